@@ -2,6 +2,7 @@
 from fastapi import HTTPException, Header, status, Request
 from typing import Optional
 from app.services.redis.redis_client import redis_conn
+from app.services.metrics import timed
 
 REDIS_PREFIX = "reco:api_key:"   # keys stored as reco:api_key:<key> 
 
@@ -12,6 +13,21 @@ def require_api_key(x_api_key: Optional[str] = Header(None)):
     if not x_api_key:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing X-API-KEY header")
     # check key existence in redis
-    if not redis_conn.exists(REDIS_PREFIX + x_api_key):
+    with timed("api_key"):
+        exists = redis_conn.exists(REDIS_PREFIX + x_api_key)
+    if not exists:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid API key")
+    return x_api_key
+
+async def require_api_key_async(x_api_key: Optional[str] = Header(None)):
+    """
+    Same as require_api_key, using the pooled redis.asyncio client (async API).
+    """
+    from app.services.redis.redis_async import redis_async_conn
+    if not x_api_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing X-API-KEY header")
+    with timed("api_key"):
+        exists = await redis_async_conn.exists(REDIS_PREFIX + x_api_key)
+    if not exists:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid API key")
     return x_api_key
@@ -4,19 +4,28 @@ from contextlib import asynccontextmanager
 from app.deps.api_key import require_api_key
 from app.services import mf    # your services/mf module (contains init_model/get_model/save_model)
 from app.routers import api    # your router(s)
+from app.services.model_cache import item_cache
+from app.services.topn_cache import topn_cache
+from app.services.shared_model import shared_store
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # STARTUP: called once when the app starts
     # initialize or load the model
     mf.init_model(k=20, lr=0.5, reg=0.02, seed=1)
-    # optionally expose model on app.state (not required if you use mf.get_model())
-    app.state.model = mf.get_model()
+    # checkpoint every MF_CHECKPOINT_S, so a restart replays at most that much of the log
+    mf.start_checkpoints()
+    # one worker publishes the item model into MF_SHARED_DIR, all of them map it
+    if shared_store:
+        shared_store.start()
+    # precompute top-N for the most requested users (MF_TOPN_REFRESH_S > 0)
+    topn_cache.start_refresher(item_cache.get)
     try:
         yield
     finally:
         # SHUTDOWN: called once when the app stops
         mf.save_model()
 
-app = FastAPI(title="Recommendation Service", lifespan=lifespan, dependencies=[Depends(require_api_key)])
-app.include_router(api.router)
\ No newline at end of file
+app = FastAPI(title="Recommendation Service", lifespan=lifespan)
+app.include_router(api.router, dependencies=[Depends(require_api_key)])
+app.include_router(api.metrics_router)
@@ -0,0 +1,32 @@
+# app/main_async.py
+# Async variant of app/main.py:  uvicorn app.main_async:app
+from fastapi import Depends, FastAPI
+from contextlib import asynccontextmanager
+from app.deps.api_key import require_api_key_async
+from app.services import mf
+from app.services.redis.redis_async import redis_async_conn
+from app.routers import api_async
+from app.services.model_cache import item_cache
+from app.services.topn_cache import topn_cache
+from app.services.shared_model import shared_store
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mf.init_model(k=20, lr=0.5, reg=0.02, seed=1)
+    # checkpoint every MF_CHECKPOINT_S, so a restart replays at most that much of the log
+    mf.start_checkpoints()
+    # one worker publishes the item model into MF_SHARED_DIR, all of them map it
+    if shared_store:
+        shared_store.start()
+    # precompute top-N for the most requested users (MF_TOPN_REFRESH_S > 0)
+    topn_cache.start_refresher(item_cache.get)
+    try:
+        yield
+    finally:
+        mf.save_model()
+        api_async.scoring_executor.shutdown(wait=False)
+        await redis_async_conn.aclose()
+
+app = FastAPI(title="Recommendation Service (async)", lifespan=lifespan)
+app.include_router(api_async.router, dependencies=[Depends(require_api_key_async)])
+app.include_router(api_async.metrics_router)
@@ -1,16 +1,30 @@
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+import os
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
+# users per /recommend/batch call (bounds the request's scoring time and response size)
+MF_BATCH_MAX_USERS = int(os.environ.get("MF_BATCH_MAX_USERS", 1000))
+
 # --- request models ---
 class RecommendationRequest(BaseModel):
     user_id: int
     top_n: Optional[int] = 10
+    exclude_seen: Optional[bool] = True     # skip videos already watched or flagged dont_suggest
+    user_meta: Optional[Dict[str, Any]] = None   # preferences for a user without history (cold start)
 
 class RecommendationResponse(BaseModel):
     user_id: int
     recommendations: list
 
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[int] = Field(..., max_length=MF_BATCH_MAX_USERS)
+    top_n: Optional[int] = 10
+    exclude_seen: Optional[bool] = True
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[RecommendationResponse]
+
 class InteractionRequest(BaseModel):
     user_id: int
     video_id: int
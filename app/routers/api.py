@@ -1,60 +1,61 @@
 # app/routers/api.py   (or your api.py)
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from typing import List, Union
-from app.models import RecommendationRequest, RecommendationResponse, InteractionRequest, ResetResponse
-# Ajusta el import si tu helper está en app.services.scoring o app.services.helpers
-from app.services import mf                        # module that implements init_model/get_model/save_model
-from app.services.helpers import compute_interaction_score  
-from app.services.redis.redis_queue import interaction_queue
-from app.services.redis.tasks import process_interaction
-import json
-from typing import List, Union
-from fastapi import APIRouter, HTTPException
-
-from app.services.redis.redis_queue import interaction_queue
-from app.services.redis.redis_model import load_model, reset_model
-from app.services.mf import MatrixFactorization
-
-router = APIRouter()
-
-# --- internal helper to process interaction (safe to call in background) ---
-def _process_interaction(payload: dict):
-    """
-    payload: dict from InteractionRequest.dict()
-    This function computes the score and calls model.update(...)
-    Keep this synchronous and fast (no DB/blocking calls). If heavy IO is required,
-    run it in a worker process.
-    """
-    # compute score - uses your scoring helper
-    score = compute_interaction_score(
-        like=payload.get("like", 0),
-        watchtime=payload.get("watchtime", 0.0),
-        duration=payload.get("duration"),
-        dont_suggest=payload.get("dont_suggest", 0),
-        comment=payload.get("comentario", "")
-    )
-
-    model = mf.get_model()   # module-level singleton
-    # If your MatrixFactorization implements warm-start using metadata, pass it here.
-    # Example: model.update(user_id, video_id, score, user_meta=..., video_meta=...)
-    # Our simple update signature: update(user_id, video_id, rating)
-    model.update(payload["user_id"], payload["video_id"], score)
-
-    # Optionally: return something or log (do not rely on return in background tasks)
-    return {"updated": True, "score": float(score)}
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional, Union
+from app.models import (RecommendationRequest, RecommendationResponse, BatchRecommendationRequest,
+                        BatchRecommendationResponse, InteractionRequest, ResetResponse)
+from app.services.redis.redis_queue import (enqueue_interactions, push_interactions, add_interactions, queue_depths,
+                                            INTERACTION_TRANSPORT)
+from app.services.redis.redis_model import reset_model
+from app.services.redis import redis_meta, redis_rows, redis_seen
+from app.services.model_cache import item_cache
+from app.services.topn_cache import topn_cache
+from app.services import ingest, metrics
+from app.routers.instrumented import InstrumentedRoute
+
+router = APIRouter(route_class=InstrumentedRoute)
+# mounted without the API key dependency, so Prometheus can scrape it (see app/main.py)
+metrics_router = APIRouter(route_class=InstrumentedRoute)
 
 # --- endpoint: get recommendations (example) ---
 @router.post("/recommend", response_model=RecommendationResponse)
 def get_recommendation(req: RecommendationRequest, request: Request):
-    # model can be retrieved via mf.get_model() or from app.state if you stored it there
-    model = load_model()
+    # item matrix comes from the versioned in-process cache, the user row straight from Redis
+    model, version = item_cache.get()
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
-    # you may want to fetch "seen" items from a store and pass exclude_seen
-    recs = model.recommend(req.user_id, top_n=req.top_n)
+    user_vector = redis_rows.load_user_row(req.user_id)
+    # cached top-N of this exact user row (see topn_cache); no scoring pass on a hit
+    recs = None if user_vector is None else topn_cache.get(req.user_id, req.exclude_seen, user_vector, version, req.top_n)
+    if recs is None:
+        # seen + blocked videos, applied as a vectorized mask during top-N selection
+        exclude = redis_seen.load_excluded(req.user_id) if req.exclude_seen else None
+        if user_vector is None:
+            # no history yet: precomputed per-attribute lists, no scoring pass
+            recs = redis_meta.cold_start(model, req.user_id, top_n=req.top_n, exclude_seen=exclude, user_meta=req.user_meta)
+        else:
+            recs = topn_cache.compute(model, version, req.user_id, user_vector, exclude, req.exclude_seen, req.top_n)
     return RecommendationResponse(user_id=req.user_id,
                                   recommendations=[{"video_id": v, "score": s} for v, s in recs])
 
+@router.post("/recommend/batch", response_model=BatchRecommendationResponse)
+def get_recommendations_batch(req: BatchRecommendationRequest):
+    """Top-N for many users: one Redis round-trip per kind of data, one blocked scoring pass."""
+    model, version = item_cache.get()
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    vectors = redis_rows.load_user_rows(req.user_ids)
+    excludes = redis_seen.load_excluded_many(req.user_ids) if req.exclude_seen else None
+    recs = topn_cache.recommend_batch(model, version, req.user_ids, vectors, excludes, req.exclude_seen, req.top_n)
+    results = []
+    for i, uid in enumerate(req.user_ids):
+        if recs[i] is None:
+            recs[i] = redis_meta.cold_start(model, uid, top_n=req.top_n,
+                                            exclude_seen=None if excludes is None else excludes[i])
+        results.append(RecommendationResponse(user_id=uid, recommendations=[{"video_id": v, "score": s}
+                                                                            for v, s in recs[i]]))
+    return BatchRecommendationResponse(results=results)
+
 # --- endpoint: interact (synchronous update) ---
 @router.post("/interact")
 def interact_sync(payload: Union[InteractionRequest, List[InteractionRequest]]):
@@ -66,11 +67,19 @@ def interact_sync(payload: Union[InteractionRequest, List[InteractionRequest]]):
     
     
     interactions = payload if isinstance(payload, list) else [payload]
-    
-    job_ids = []
-    for inter in interactions:
-        job = interaction_queue.enqueue("app.services.redis.tasks.process_interaction", inter.model_dump())
-        job_ids.append(job.id)
+
+    if INTERACTION_TRANSPORT == "batch":
+        # one RPUSH for the whole payload; the batch worker applies them in micro-batches
+        pending = push_interactions([inter.model_dump(mode="json") for inter in interactions])
+        return {"status": "queued", "queued": len(interactions), "pending": pending}
+
+    if INTERACTION_TRANSPORT == "stream":
+        # one pipelined XADD per interaction; the stream workers read them in batches
+        entry_ids = add_interactions([inter.model_dump(mode="json") for inter in interactions])
+        return {"status": "queued", "queued": len(entry_ids), "ids": entry_ids}
+
+    # all jobs go out in one pipeline instead of one round-trip per item
+    job_ids = enqueue_interactions([inter.model_dump() for inter in interactions])
 
     return {"status": "queued", "jobs": job_ids}
 
@@ -81,4 +90,37 @@ def reset_model_endpoint():
     Resets the stored model in Redis. The in-memory model remains unchanged.
     """
     reset_model()
-    return ResetResponse(status="model reset in Redis")
\ No newline at end of file
+    redis_rows.reset_model()
+    item_cache.invalidate()
+    topn_cache.clear()
+    return ResetResponse(status="model reset in Redis")
+
+
+@router.post("/ingest")
+async def ingest_bulk(request: Request, format: Optional[str] = None, ingest_id: Optional[str] = None):
+    """
+    Streamed bulk ingest of historical interactions (NDJSON or interacciones.csv-style CSV).
+    The body is parsed and applied in fixed-size chunks; progress: GET /ingest/{ingest_id}.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    try:
+        return await ingest.ingest_stream(request.stream(), fmt=fmt, ingest_id=ingest_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/ingest/{ingest_id}")
+def ingest_progress(ingest_id: str):
+    progress = ingest.get_progress(ingest_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest id")
+    return progress
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text: API stage latencies, model gauges, queue depth and the worker aggregate."""
+    metrics.observe_model(item_cache.model)
+    for transport, depth in queue_depths().items():
+        metrics.QUEUE_DEPTH.set(depth, transport=transport)
+    return PlainTextResponse(metrics.render_all(), media_type="text/plain; version=0.0.4")
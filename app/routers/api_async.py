@@ -0,0 +1,175 @@
+# app/routers/api_async.py
+"""
+Async variant of app/routers/api.py (served by app/main_async.py).
+
+Redis I/O goes through the pooled redis.asyncio client; CPU-bound scoring runs on a
+bounded thread pool so the event loop never blocks on a matrix-vector product.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Request
+
+from app.models import (RecommendationRequest, RecommendationResponse, BatchRecommendationRequest,
+                        BatchRecommendationResponse, InteractionRequest, ResetResponse)
+from app.services.model_cache import item_cache
+from app.services.topn_cache import topn_cache, mirror_key
+from app.services import ingest, metrics
+from app.routers.instrumented import InstrumentedRoute
+from fastapi.responses import PlainTextResponse
+from app.services.redis import redis_meta, redis_rows, redis_seen
+from app.services.metadata import user_tokens
+from app.services.redis.redis_async import redis_async_conn
+from app.services.redis.redis_model import reset_model
+from app.services.redis.redis_queue import (enqueue_interactions, push_interactions_async, add_interactions_async,
+                                            queue_depths, INTERACTION_TRANSPORT)
+
+MF_SCORING_WORKERS = int(os.environ.get("MF_SCORING_WORKERS", os.cpu_count() or 1))
+
+router = APIRouter(route_class=InstrumentedRoute)
+# mounted without the API key dependency, so Prometheus can scrape it (see app/main.py)
+metrics_router = APIRouter(route_class=InstrumentedRoute)
+scoring_executor = ThreadPoolExecutor(max_workers=MF_SCORING_WORKERS, thread_name_prefix="mf-score")
+
+
+def _score(user_id, user_vector, top_n, exclude, exclude_seen):
+    # runs on scoring_executor: cache refresh (if due) + scoring + top-N (stored in topn_cache)
+    model, version = item_cache.get()
+    if model is None:
+        return None
+    return topn_cache.compute(model, version, user_id, user_vector, exclude, exclude_seen, top_n)
+
+
+@router.post("/recommend", response_model=RecommendationResponse)
+async def get_recommendation(req: RecommendationRequest):
+    uid = str(int(req.user_id))
+    # user row + seen/blocked sets + stored preferences in one round-trip
+    pipe = redis_async_conn.pipeline(transaction=False)
+    pipe.hget(redis_rows.user_row_key(uid), uid)
+    redis_seen.queue_reads(pipe, uid)
+    pipe.hget(redis_meta.USER_META_KEY, uid)
+    raw_row, seen, blocked, raw_tokens = await pipe.execute()
+
+    user_vector = None if raw_row is None else redis_rows.decode_row(raw_row)
+    exclude = redis_seen.merge_members(seen, blocked) if req.exclude_seen else None
+    if user_vector is None:
+        # still make sure a model exists, like the sync endpoint
+        model, _ = await asyncio.get_running_loop().run_in_executor(scoring_executor, item_cache.get)
+        if model is None:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        # no history yet: precomputed per-attribute lists (a few dict lookups, fine on the loop)
+        tokens = user_tokens(req.user_meta) or ([] if raw_tokens is None else json.loads(raw_tokens))
+        recs = [] if model.meta_index is None else model.meta_index.cold_start(
+            tokens, top_n=req.top_n, exclude_seen=exclude)
+    else:
+        # cached top-N of this exact user row: local LRU, then the Redis mirror
+        model, version = item_cache.model, item_cache.version
+        recs = None if model is None else topn_cache.get_local(req.user_id, req.exclude_seen, user_vector, version, req.top_n)
+        if recs is None and model is not None and topn_cache.enabled and req.top_n <= topn_cache.list_n:
+            raw = await redis_async_conn.get(mirror_key(req.user_id, req.exclude_seen))
+            recs = topn_cache.accept_mirror(raw, req.user_id, req.exclude_seen, user_vector, version, req.top_n)
+        if recs is None:
+            recs = await asyncio.get_running_loop().run_in_executor(
+                scoring_executor, _score, req.user_id, user_vector, req.top_n, exclude, req.exclude_seen)
+        if recs is None:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+    return RecommendationResponse(user_id=req.user_id,
+                                  recommendations=[{"video_id": v, "score": s} for v, s in recs])
+
+
+def _score_batch(user_ids, vectors, excludes, exclude_seen, top_n, tokens):
+    # runs on scoring_executor: one blocked scoring pass for the users with a row
+    model, version = item_cache.get()
+    if model is None:
+        return None
+    recs = topn_cache.recommend_batch(model, version, user_ids, vectors, excludes, exclude_seen, top_n)
+    for i, toks in enumerate(tokens):
+        if recs[i] is None:
+            recs[i] = [] if model.meta_index is None else model.meta_index.cold_start(
+                toks, top_n=top_n, exclude_seen=None if excludes is None else excludes[i])
+    return recs
+
+
+@router.post("/recommend/batch", response_model=BatchRecommendationResponse)
+async def get_recommendations_batch(req: BatchRecommendationRequest):
+    # user rows, seen/blocked sets and stored preferences of every user in one round-trip
+    pipe = redis_async_conn.pipeline(transaction=False)
+    for user_id in req.user_ids:
+        uid = str(int(user_id))
+        pipe.hget(redis_rows.user_row_key(uid), uid)
+        redis_seen.queue_reads(pipe, uid)
+        pipe.hget(redis_meta.USER_META_KEY, uid)
+    raws = await pipe.execute()
+    rows = [raws[i::4] for i in range(4)]
+    vectors = [None if raw is None else redis_rows.decode_row(raw) for raw in rows[0]]
+    excludes = [redis_seen.merge_members(seen, blocked) for seen, blocked in zip(rows[1], rows[2])] \
+        if req.exclude_seen else None
+    tokens = [[] if raw is None else json.loads(raw) for raw in rows[3]]
+    recs = await asyncio.get_running_loop().run_in_executor(
+        scoring_executor, _score_batch, req.user_ids, vectors, excludes, req.exclude_seen, req.top_n, tokens)
+    if recs is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return BatchRecommendationResponse(results=[
+        RecommendationResponse(user_id=uid, recommendations=[{"video_id": v, "score": s} for v, s in r])
+        for uid, r in zip(req.user_ids, recs)])
+
+
+@router.post("/interact")
+async def interact(payload: Union[InteractionRequest, List[InteractionRequest]]):
+    interactions = payload if isinstance(payload, list) else [payload]
+    if INTERACTION_TRANSPORT == "batch":
+        pending = await push_interactions_async([inter.model_dump(mode="json") for inter in interactions])
+        return {"status": "queued", "queued": len(interactions), "pending": pending}
+    if INTERACTION_TRANSPORT == "stream":
+        entry_ids = await add_interactions_async([inter.model_dump(mode="json") for inter in interactions])
+        return {"status": "queued", "queued": len(entry_ids), "ids": entry_ids}
+    # RQ only speaks the sync client: one pipelined enqueue_many off the event loop
+    job_ids = await asyncio.get_running_loop().run_in_executor(
+        None, enqueue_interactions, [inter.model_dump() for inter in interactions])
+    return {"status": "queued", "jobs": job_ids}
+
+
+@router.delete("/reset", response_model=ResetResponse)
+async def reset_model_endpoint():
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, reset_model)
+    await loop.run_in_executor(None, redis_rows.reset_model)
+    item_cache.invalidate()
+    topn_cache.clear()
+    return ResetResponse(status="model reset in Redis")
+
+
+@router.post("/ingest")
+async def ingest_bulk(request: Request, format: Optional[str] = None, ingest_id: Optional[str] = None):
+    """
+    Streamed bulk ingest of historical interactions (NDJSON or interacciones.csv-style CSV).
+    The body is parsed and applied in fixed-size chunks; progress: GET /ingest/{ingest_id}.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    try:
+        return await ingest.ingest_stream(request.stream(), fmt=fmt, ingest_id=ingest_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/ingest/{ingest_id}")
+def ingest_progress(ingest_id: str):
+    progress = ingest.get_progress(ingest_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest id")
+    return progress
+
+
+def _render_metrics():
+    metrics.observe_model(item_cache.model)
+    for transport, depth in queue_depths().items():
+        metrics.QUEUE_DEPTH.set(depth, transport=transport)
+    return metrics.render_all()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    text = await asyncio.get_running_loop().run_in_executor(None, _render_metrics)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
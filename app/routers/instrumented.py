@@ -0,0 +1,56 @@
+# app/routers/instrumented.py
+import functools
+import inspect
+import time
+from fastapi.routing import APIRoute
+from app.services.metrics import REQUESTS, STAGE_SECONDS
+from app.services.profiler import MF_PROFILE, profiler
+
+
+def _profiled(endpoint, name):
+    # register the task / thread that actually runs the endpoint body (threadpool for sync defs)
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            token = profiler.enter(name)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profiler.exit(token)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            token = profiler.enter(name)
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                profiler.exit(token)
+    return wrapper
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    APIRoute that counts requests and records their latency per endpoint
+    (mf_requests_total, mf_stage_seconds{stage="request"}); with MF_PROFILE=1 the
+    endpoint is also sampled by the profiler.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if MF_PROFILE:
+            profiler.start()
+            endpoint = _profiled(endpoint, path)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def instrumented_handler(request):
+            REQUESTS.inc(endpoint=path)
+            t0 = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - t0, stage="request", endpoint=path)
+
+        return instrumented_handler
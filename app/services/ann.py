@@ -0,0 +1,309 @@
+# app/services/ann.py
+"""
+Approximate nearest-neighbour retrieval over the item matrix Q (pure NumPy).
+
+IVF (inverted file) index: items are clustered with k-means, each item is assigned
+to its nearest centroid, and a query only scores the items of the n_probe lists whose
+centroids have the highest inner product with the user vector. The candidates are
+then reranked exactly by MatrixFactorization.
+
+The lists are kept inverted (CSR: the row indices of every list, contiguous), so a query
+touches only the probed lists, never the whole catalog. Item rows that change (new
+videos, SGD updates) are re-assigned incrementally against the fixed centroids and
+appended to a per-list overlay; a row that left a list is filtered out at query time by
+its current assignment. The CSR is rebuilt once the overlay passes 1/8 of the items.
+Call IVFIndex.build again to re-cluster after heavy drift.
+
+A model reloaded from the row store carries the index of the copy it replaces
+(carry_index): items whose id and factors did not change keep their list, so a refresh
+costs one pass over Q instead of a k-means run. It re-clusters every MF_ANN_RECLUSTER_S
+seconds, or once more than MF_ANN_MAX_DRIFT of the items were re-assigned since.
+"""
+import os
+import time
+import numpy as np
+
+# set MF_ANN_LISTS > 0 to attach an index to the serving model (see attach_from_env)
+MF_ANN_LISTS = int(os.environ.get("MF_ANN_LISTS", 0))
+MF_ANN_PROBE = int(os.environ.get("MF_ANN_PROBE", 8))
+# below this catalog size recommend keeps the exact brute-force pass
+MF_ANN_MIN_ITEMS = int(os.environ.get("MF_ANN_MIN_ITEMS", 50_000))
+MF_ANN_RECLUSTER_S = float(os.environ.get("MF_ANN_RECLUSTER_S", 3600))
+MF_ANN_MAX_DRIFT = float(os.environ.get("MF_ANN_MAX_DRIFT", 0.25))
+
+_CHUNK = 65536
+# rebuild the inverted lists once this fraction of the items sits in the overlay
+_PENDING_MAX_FRAC = 0.125
+_HASH_MULT = np.random.default_rng(0x1F5).integers(1, 2 ** 63, size=4096, dtype=np.uint64) | np.uint64(1)
+
+
+def row_hash(X):
+    """uint64 checksum of every float32 row of X (equal rows, equal checksums)."""
+    out = np.empty(X.shape[0], dtype=np.uint64)
+    for start in range(0, X.shape[0], _CHUNK):
+        bits = np.ascontiguousarray(X[start:start + _CHUNK], dtype=np.float32).view(np.uint32)
+        # wraps modulo 2^64
+        out[start:start + _CHUNK] = (bits.astype(np.uint64) * _HASH_MULT[:X.shape[1]]).sum(axis=1)
+    return out
+
+
+def _nearest_centroid(X, centroids, c_sq):
+    """Index of the L2-nearest centroid for every row of X (chunked to bound memory)."""
+    out = np.empty(X.shape[0], dtype=np.int32)
+    for start in range(0, X.shape[0], _CHUNK):
+        block = X[start:start + _CHUNK]
+        # argmin |x - c|^2 == argmax 2 x.c - |c|^2
+        out[start:start + _CHUNK] = np.argmax(2.0 * block @ centroids.T - c_sq, axis=1)
+    return out
+
+
+def kmeans(X, n_clusters, n_iter=10, sample_size=None, seed=1):
+    """Plain Lloyd k-means on (a sample of) X. Returns float32 centroids."""
+    rng = np.random.default_rng(seed)
+    X = np.asarray(X, dtype=np.float32)
+    if sample_size is not None and X.shape[0] > sample_size:
+        X = X[rng.choice(X.shape[0], size=sample_size, replace=False)]
+    n_clusters = min(n_clusters, X.shape[0])
+    centroids = X[rng.choice(X.shape[0], size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _nearest_centroid(X, centroids, (centroids ** 2).sum(axis=1))
+        counts = np.bincount(assign, minlength=n_clusters).astype(np.float32)
+        # per-dimension bincount is much faster than np.add.at on 2-D rows
+        sums = np.stack([np.bincount(assign, weights=X[:, d], minlength=n_clusters)
+                         for d in range(X.shape[1])], axis=1).astype(np.float32)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # re-seed empty clusters with random points
+        n_empty = int((~filled).sum())
+        if n_empty:
+            centroids[~filled] = X[rng.choice(X.shape[0], size=n_empty, replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, n_lists=None, n_probe=MF_ANN_PROBE, n_iter=10, seed=1):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self._c_sq = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        # per item: checksum of the row it was assigned from, re-assigned since the clustering
+        # (None on an index mapped from shared_model, which is never carried)
+        self.row_hash = None
+        self.moved = None
+        self.built_at = time.monotonic()
+        # (offsets, rows, overlay): rows[offsets[l]:offsets[l + 1]] were in list l when the
+        # CSR was built; overlay {list: [row arrays]} holds rows assigned to a list since.
+        # Swapped as one tuple, so a reader never sees the parts of two builds.
+        self._lists = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), {})
+        self._n_pending = 0
+
+    @classmethod
+    def from_arrays(cls, centroids, assign, n_probe=MF_ANN_PROBE, seed=1, offsets=None, rows=None):
+        """
+        Index over already clustered items (e.g. memory-mapped from shared_model).
+        offsets / rows: its inverted lists (inverted_lists()), rebuilt from assign if missing.
+        """
+        index = cls(n_lists=centroids.shape[0], n_probe=n_probe, seed=seed)
+        index.centroids = centroids
+        index._c_sq = (centroids ** 2).sum(axis=1)
+        index.assign = assign
+        if offsets is None:
+            index._rebuild_lists()
+        else:
+            index._lists = (offsets, rows, {})
+        return index
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "_lists" not in state:
+            # pickled before the inverted lists existed
+            self._rebuild_lists()
+
+    def _rebuild_lists(self):
+        rows = np.argsort(self.assign, kind="stable")
+        offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.assign, minlength=self.n_lists), out=offsets[1:])
+        self._lists = (offsets, rows, {})
+        self._n_pending = 0
+
+    def _moved_to(self, idx, lists):
+        """Record that rows idx were (re-)assigned to lists (overlay, or a rebuild when it is full)."""
+        if self._n_pending + len(idx) > max(1024, _PENDING_MAX_FRAC * len(self.assign)):
+            self._rebuild_lists()
+            return
+        overlay = self._lists[2]
+        order = np.argsort(lists, kind="stable")
+        idx, lists = np.asarray(idx, dtype=np.int64)[order], lists[order]
+        starts = np.flatnonzero(np.r_[True, lists[1:] != lists[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(lists)]):
+            overlay.setdefault(int(lists[start]), []).append(idx[start:end])
+        self._n_pending += len(idx)
+
+    def inverted_lists(self):
+        """(offsets, rows) CSR of the current assignment, overlay folded in (shared_model publishes it)."""
+        if self._n_pending or len(self._lists[1]) != len(self.assign):
+            self._rebuild_lists()
+        return self._lists[0], self._lists[1]
+
+    def build(self, Q):
+        """Cluster Q and assign every item. n_lists defaults to sqrt(#items)."""
+        n_items = Q.shape[0]
+        if n_items == 0:
+            raise ValueError("cannot build an ANN index over an empty item matrix")
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_items)))
+        self.centroids = kmeans(Q, n_lists, n_iter=self.n_iter, sample_size=256 * n_lists, seed=self.seed)
+        self.n_lists = self.centroids.shape[0]
+        self._c_sq = (self.centroids ** 2).sum(axis=1)
+        self.assign = _nearest_centroid(np.asarray(Q, dtype=np.float32), self.centroids, self._c_sq)
+        self._rebuild_lists()
+        self.row_hash = row_hash(Q)
+        self.moved = np.zeros(n_items, dtype=bool)
+        self.built_at = time.monotonic()
+        return self
+
+    def add(self, rows):
+        """Assign newly appended item rows (in row order)."""
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        start = len(self.assign)
+        lists = _nearest_centroid(rows, self.centroids, self._c_sq)
+        self.assign = np.concatenate([self.assign, lists])
+        self._moved_to(np.arange(start, start + len(rows)), lists)
+        if self.row_hash is not None:
+            self.row_hash = np.concatenate([self.row_hash, row_hash(rows)])
+            self.moved = np.concatenate([self.moved, np.ones(len(rows), dtype=bool)])
+
+    def update(self, idx, rows):
+        """Re-assign existing items whose rows changed."""
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        idx = np.asarray(idx)
+        lists = _nearest_centroid(rows, self.centroids, self._c_sq)
+        changed = self.assign[idx] != lists
+        self.assign[idx] = lists
+        if changed.any():
+            self._moved_to(idx[changed], lists[changed])
+        if self.row_hash is not None:
+            self.row_hash[idx] = row_hash(rows)
+            self.moved[idx] = True
+
+    def drift(self) -> float:
+        """Fraction of the items re-assigned since the last clustering."""
+        return float(self.moved.mean()) if self.moved is not None and len(self.moved) else 0.0
+
+    def candidates(self, user_vector, n_probe=None):
+        """Row indices of the items in the n_probe lists best aligned with user_vector."""
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        centroid_scores = self.centroids @ user_vector
+        probe = np.argpartition(centroid_scores, -n_probe)[-n_probe:]
+        offsets, rows, overlay = self._lists
+        parts = [rows[offsets[l]:offsets[l + 1]] for l in probe.tolist()]
+        if overlay:
+            parts += [a for l in probe.tolist() for a in overlay.get(l, ())]
+        cands = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        if not overlay and len(rows) == len(self.assign):
+            return np.sort(cands)
+        # rows moved since the CSR build are listed twice or under their old list: keep the
+        # ones whose current list is probed (rows past len(assign) belong to a newer copy)
+        assign = self.assign
+        cands = np.unique(cands)
+        cands = cands[cands < len(assign)]
+        probe_mask = np.zeros(self.n_lists, dtype=bool)
+        probe_mask[probe] = True
+        return cands[probe_mask[assign[cands]]]
+
+
+def carry_index(previous, previous_ids, Q, video_ids):
+    """
+    IVF index for the items (video_ids, rows Q) with the centroids of previous, the index
+    over previous_ids. Items with the same id and row keep their list, the others are
+    assigned to the nearest centroid. None when previous cannot be carried or is due for
+    re-clustering (MF_ANN_RECLUSTER_S, MF_ANN_MAX_DRIFT).
+    """
+    if previous is None or previous.row_hash is None or previous.centroids.shape[1] != Q.shape[1]:
+        return None
+    if time.monotonic() - previous.built_at > MF_ANN_RECLUSTER_S or previous.drift() > MF_ANN_MAX_DRIFT:
+        return None
+    hashes = row_hash(Q)
+    previous_ids = np.asarray(previous_ids, dtype=np.int64)
+    order = np.argsort(previous_ids, kind="stable")
+    sorted_ids = previous_ids[order]
+    video_ids = np.asarray(video_ids, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, video_ids)
+    pos[pos >= len(sorted_ids)] = 0
+    old = order[pos]
+    keep = (sorted_ids[pos] == video_ids) & (previous.row_hash[old] == hashes)
+    index = IVFIndex(n_lists=previous.n_lists, n_probe=previous.n_probe, n_iter=previous.n_iter, seed=previous.seed)
+    index.centroids, index._c_sq = previous.centroids, previous._c_sq
+    index.assign = np.empty(len(video_ids), dtype=np.int32)
+    index.assign[keep] = previous.assign[old[keep]]
+    changed = np.flatnonzero(~keep)
+    if len(changed):
+        index.assign[changed] = _nearest_centroid(np.asarray(Q[changed], dtype=np.float32), index.centroids, index._c_sq)
+    kept_rows = np.flatnonzero(keep)
+    if np.array_equal(old[kept_rows], kept_rows) and not previous._n_pending:
+        # rows kept their index: the previous lists stay valid, only the changed rows move
+        index._lists = (previous._lists[0], previous._lists[1], {})
+        if len(changed):
+            index._moved_to(changed, index.assign[changed])
+    else:
+        index._rebuild_lists()
+    index.row_hash = hashes
+    index.moved = np.ones(len(video_ids), dtype=bool)
+    index.moved[keep] = previous.moved[old[keep]]
+    index.built_at = previous.built_at
+    return index
+
+
+def attach_from_env(model, previous=None, previous_ids=None):
+    """
+    Attach an IVF index to model if MF_ANN_LISTS is set and the catalog is large enough:
+    previous (the index over the video ids previous_ids) carried over, or a new one.
+    """
+    if MF_ANN_LISTS > 0 and model.n_videos >= MF_ANN_MIN_ITEMS:
+        index = carry_index(previous, previous_ids, model.Q, model.video_id_array)
+        if index is None:
+            model.enable_ann(n_lists=MF_ANN_LISTS, n_probe=MF_ANN_PROBE)
+        else:
+            model.ann_index = index
+    return model
+
+
+def evaluate(model, user_vectors, top_n=10, n_probe=None):
+    """
+    Compare ANN retrieval against brute force on a set of user vectors.
+    Returns build time, mean query latency for both paths and recall@top_n.
+    """
+    index = IVFIndex(n_lists=model.ann_index.n_lists if model.ann_index else None,
+                     n_probe=n_probe or MF_ANN_PROBE, seed=model.seed)
+    t0 = time.perf_counter()
+    index.build(model.Q)
+    build_s = time.perf_counter() - t0
+
+    saved = model.ann_index
+    hits = 0
+    t_exact = t_ann = 0.0
+    try:
+        for vec in user_vectors:
+            model.ann_index = None
+            t0 = time.perf_counter()
+            exact = model.recommend_for_vector(vec, top_n=top_n)
+            t_exact += time.perf_counter() - t0
+            model.ann_index = index
+            t0 = time.perf_counter()
+            approx = model.recommend_for_vector(vec, top_n=top_n)
+            t_ann += time.perf_counter() - t0
+            hits += len({v for v, _ in exact} & {v for v, _ in approx})
+    finally:
+        model.ann_index = saved
+    n = max(len(user_vectors), 1)
+    return {
+        "n_items": int(model.n_videos),
+        "n_lists": int(index.n_lists),
+        "n_probe": int(index.n_probe),
+        "build_s": build_s,
+        "exact_ms": t_exact / n * 1000.0,
+        "ann_ms": t_ann / n * 1000.0,
+        "recall": hits / float(n * top_n),
+    }
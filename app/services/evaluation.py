@@ -0,0 +1,164 @@
+# app/services/evaluation.py
+"""
+Offline ranking evaluation: train / test split and recall@k, precision@k, NDCG@k and
+catalog coverage over every test user.
+
+Interactions are (user_id, video_id, score) arrays; a test interaction is relevant if its
+score is at least the relevance threshold. Each test user gets the top max(ks) of all
+videos except the ones in their training history:
+
+    retrieval="exact"   row blocks of P @ Q.T (MatrixFactorization.item_scores_many, so a
+                        quantized Q is what gets scored), top-k per row with argpartition
+                        (mf.top_n_rows)
+    retrieval="model"   model.recommend_for_vector per user: the serving path, ANN included
+
+Blocks run on a thread pool (NumPy releases the GIL in the matrix product and the
+partition). Hits are found by binary search of (user row, video row) keys in the sorted
+test keys, so no per-user Python sets are built.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.services.mf import MF_SCORE_BLOCK_MB, MatrixFactorization, top_n_rows
+
+SPLITS = ("time", "random")
+
+
+def split_interactions(user_ids, test_frac=0.2, mode="time", timestamps=None, seed=0):
+    """
+    Boolean test mask over the interactions.
+      time    the last test_frac of every user's interactions (by timestamp, else by row
+              order, which is the order interacciones.csv was written in); users with a
+              single interaction stay in training
+      random  each interaction independently with probability test_frac
+    """
+    user_ids = np.asarray(user_ids)
+    n = user_ids.shape[0]
+    if mode == "random":
+        return np.random.default_rng(seed).random(n) < test_frac
+    if mode != "time":
+        raise ValueError(f"unknown split {mode!r}, expected one of {SPLITS}")
+    when = np.arange(n) if timestamps is None else np.asarray(timestamps)
+    order = np.lexsort((np.arange(n), when, user_ids))
+    sorted_users = user_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    rank = np.arange(n) - np.repeat(starts, counts)
+    n_train = np.ceil((1.0 - test_frac) * counts).astype(np.int64)
+    test = np.zeros(n, dtype=bool)
+    test[order] = (rank >= np.repeat(n_train, counts)) & (np.repeat(counts, counts) > 1)
+    return test
+
+
+def _lookup(ids_sorted, order, query):
+    """Row of every query id (-1 if unknown), given the id array sorted with its argsort."""
+    query = np.asarray(query, dtype=np.int64)
+    pos = np.searchsorted(ids_sorted, query)
+    pos[pos >= len(ids_sorted)] = 0
+    found = ids_sorted[pos] == query
+    return np.where(found, order[pos], -1)
+
+
+def _csr(rows, cols, n_rows):
+    """(indptr, cols) of the unique (row, col) pairs, rows ascending."""
+    keys = np.unique(rows.astype(np.int64) << 32 | cols.astype(np.int64))
+    rows, cols = keys >> 32, keys & 0xFFFFFFFF
+    return np.searchsorted(rows, np.arange(n_rows + 1)), cols
+
+
+def _top_rows(model, U, k, seen_indptr, seen_cols, users, retrieval, seen_ids):
+    """Top-k video rows for a block of users (-1 pads users with fewer than k candidates)."""
+    out = np.full((len(users), k), -1, dtype=np.int64)
+    if retrieval == "model":
+        for i, u in enumerate(users):
+            recs = model.recommend_for_vector(U[i], top_n=k, exclude_seen=seen_ids[i])
+            rows = model.rows_for_video_ids([v for v, _ in recs])
+            out[i, :len(rows)] = rows
+        return out
+    scores = model.item_scores_many(U)
+    lo, lens = seen_indptr[users], np.diff(seen_indptr)[users]
+    if lens.sum():
+        # the seen_cols slices of all users of the block, without a Python loop
+        idx = np.arange(lens.sum()) + np.repeat(lo - np.cumsum(lens) + lens, lens)
+        scores[np.repeat(np.arange(len(users)), lens), seen_cols[idx]] = -np.inf
+    cand, vals = top_n_rows(scores, k)
+    out[:, :cand.shape[1]] = np.where(np.isfinite(vals), cand, -1)
+    return out
+
+
+def evaluate(model: MatrixFactorization, train, test, ks=(10,), relevance=0.5, retrieval="exact",
+             block_rows=None, workers=None) -> dict:
+    """
+    Ranking metrics of model on test. train and test are (user_ids, video_ids, scores);
+    the training pairs are excluded from every user's ranking. Test users without a
+    factor row or without a relevant test video are skipped (reported as cold_users /
+    users). Returns {"users": ..., "recall@10": ..., "precision@10": ..., "ndcg@10": ...,
+    "coverage@10": ..., "seconds": ...} for every k in ks.
+    """
+    t0 = time.perf_counter()
+    ks = sorted({int(k) for k in ks})
+    k_max = ks[-1]
+    user_id_array = np.fromiter((model.idx2user[i] for i in range(model.n_users)), dtype=np.int64,
+                                count=model.n_users)
+    u_order = np.argsort(user_id_array, kind="stable")
+    u_sorted = user_id_array[u_order]
+    video_ids = model.video_id_array
+    v_order = np.argsort(video_ids, kind="stable")
+    v_sorted = video_ids[v_order]
+
+    # relevant test pairs, as model rows
+    t_users, t_videos, t_scores = (np.asarray(a) for a in test)
+    rel = t_scores >= relevance
+    t_u, t_v = _lookup(u_sorted, u_order, t_users[rel]), _lookup(v_sorted, v_order, t_videos[rel])
+    cold_users = len(np.unique(t_users[rel][t_u < 0]))
+    known = (t_u >= 0) & (t_v >= 0)
+    rel_indptr, rel_cols = _csr(t_u[known], t_v[known], model.n_users)
+    n_rel = np.diff(rel_indptr)
+    test_keys = np.repeat(np.arange(model.n_users, dtype=np.int64), n_rel) * model.n_videos + rel_cols
+    eval_users = np.flatnonzero(n_rel > 0)
+
+    # training history, excluded from the ranking
+    tr_users, tr_videos = np.asarray(train[0]), np.asarray(train[1])
+    s_u, s_v = _lookup(u_sorted, u_order, tr_users), _lookup(v_sorted, v_order, tr_videos)
+    ok = (s_u >= 0) & (s_v >= 0)
+    seen_indptr, seen_cols = _csr(s_u[ok], s_v[ok], model.n_users)
+
+    if block_rows is None:
+        block_rows = max(1, int(MF_SCORE_BLOCK_MB * 2 ** 20) // max(4 * model.n_videos, 1))
+    if retrieval == "model":
+        block_rows = min(block_rows, 256)
+    blocks = [eval_users[i:i + block_rows] for i in range(0, len(eval_users), block_rows)]
+
+    def run(users):
+        seen_ids = None
+        if retrieval == "model":
+            seen_ids = [video_ids[seen_cols[seen_indptr[u]:seen_indptr[u + 1]]] for u in users]
+        return _top_rows(model, model.P[users], k_max, seen_indptr, seen_cols, users, retrieval, seen_ids)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        top = np.concatenate(list(pool.map(run, blocks))) if blocks else np.zeros((0, k_max), dtype=np.int64)
+
+    # hit matrix (users x k_max): is (user row, video row) a relevant test pair
+    keys = eval_users[:, None] * model.n_videos + top
+    pos = np.searchsorted(test_keys, keys)
+    pos[pos >= len(test_keys)] = 0
+    hits = (top >= 0) & (test_keys[pos] == keys) if len(test_keys) else np.zeros(top.shape, dtype=bool)
+    n_rel_users = n_rel[eval_users]
+    discounts = 1.0 / np.log2(np.arange(2, k_max + 2))
+    ideal = np.cumsum(discounts)
+
+    result = {"users": int(len(eval_users)), "cold_users": int(cold_users), "retrieval": retrieval}
+    for k in ks:
+        h = hits[:, :k]
+        n_hits = h.sum(axis=1)
+        dcg = (h * discounts[:k]).sum(axis=1)
+        idcg = ideal[np.minimum(n_rel_users, k) - 1]
+        recommended = top[:, :k]
+        n = max(len(eval_users), 1)
+        result[f"recall@{k}"] = float((n_hits / n_rel_users).sum() / n)
+        result[f"precision@{k}"] = float(n_hits.sum() / (k * n))
+        result[f"ndcg@{k}"] = float((dcg / idcg).sum() / n)
+        result[f"coverage@{k}"] = float(len(np.unique(recommended[recommended >= 0])) / max(model.n_videos, 1))
+    result["seconds"] = round(time.perf_counter() - t0, 3)
+    return result
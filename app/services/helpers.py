@@ -1,3 +1,13 @@
+import numpy as np
+
+# pesos por defecto
+DEFAULT_SCORE_WEIGHTS = {
+    "w_watch": 0.6,
+    "like_bonus": 0.4,
+    "comment_bonus": 0.05,
+    "dont_penalty": -0.6
+}
+
 def compute_interaction_score(
     like: bool | int,
     watchtime: float,
@@ -20,14 +30,8 @@ def compute_interaction_score(
     :param min_watch_ratio_for_full: Minimum watch ratio to consider full watch
     :return: Computed interaction score
     """
-    # pesos por defecto
     if weights is None:
-        weights = {
-            "w_watch": 0.6,
-            "like_bonus": 0.4,
-            "comment_bonus": 0.05,
-            "dont_penalty": -0.6
-        }
+        weights = DEFAULT_SCORE_WEIGHTS
 
     # normalizar inputs básicos
     like = bool(like)
@@ -63,4 +67,47 @@ def compute_interaction_score(
     # recortar a [0,1]
     score = max(0.0, min(1.0, score))
 
-    return float(score)
\ No newline at end of file
+    return float(score)
+
+
+def compute_interaction_scores(
+    like,
+    watchtime,
+    duration=None,
+    dont_suggest=None,
+    comment=None,
+    *,
+    weights: dict | None = None,
+    min_watch_ratio_for_full: float = 0.98
+) -> np.ndarray:
+    """
+    Vectorized compute_interaction_score: same rules, applied to whole arrays
+    (e.g. columns of interacciones.csv). Missing/NaN/non-positive durations use the
+    same fallback as the scalar version.
+
+    :return: float32 array of scores in [0, 1]
+    """
+    if weights is None:
+        weights = DEFAULT_SCORE_WEIGHTS
+
+    watchtime = np.asarray(watchtime, dtype=np.float64)
+    n = watchtime.shape[0]
+    like = np.asarray(like, dtype=np.float64) != 0
+    dont = np.zeros(n, dtype=bool) if dont_suggest is None else np.asarray(dont_suggest, dtype=np.float64) != 0
+    # comments are ignored, as in compute_interaction_score
+
+    if duration is None:
+        duration = np.full(n, np.nan)
+    duration = np.asarray(duration, dtype=np.float64)
+    has_duration = np.isfinite(duration) & (duration > 0)
+    watch_ratio = np.where(has_duration, watchtime / np.where(has_duration, duration, 1.0), watchtime)
+    fallback = ~has_duration & (watch_ratio > 1.0)
+    watch_ratio = np.where(fallback, np.minimum(1.0, watch_ratio / (watch_ratio + 60.0)), watch_ratio)
+
+    watch_ratio = np.clip(watch_ratio, 0.0, 1.0)
+    watch_ratio[watch_ratio >= min_watch_ratio_for_full] = 1.0
+
+    score = weights["w_watch"] * watch_ratio
+    score += np.where(like, weights["like_bonus"], 0.0)
+    score += np.where(dont, weights["dont_penalty"], 0.0)
+    return np.clip(score, 0.0, 1.0).astype(np.float32)
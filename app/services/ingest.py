@@ -0,0 +1,170 @@
+# app/services/ingest.py
+"""
+Streaming bulk ingest of historical interactions (POST /ingest).
+
+The request body is NDJSON (one InteractionRequest-like object per line) or CSV with
+the interacciones.csv header (id,user_id,video_id,like,comentario,watchtime,dont_suggest
+[,duration]). It is read as a byte stream, split into lines, and parsed in chunks of
+MF_INGEST_CHUNK rows: each chunk becomes column arrays, is scored with
+compute_interaction_scores and applied to the model as one batch. Memory stays at one
+chunk regardless of upload size. Progress is kept in the Redis hash ingest:<id>.
+
+MF_INGEST_TARGET picks the model: "redis" (the row store the workers train, default) or
+"local" (this process's model, logged first when MF_LOG_DIR is set, see mf.apply_interactions).
+"""
+import csv
+import io
+import json
+import os
+import uuid
+import numpy as np
+from typing import AsyncIterator, Callable, Optional
+from starlette.concurrency import run_in_threadpool
+from app.services.helpers import compute_interaction_scores
+from app.services.redis.redis_client import redis_conn
+
+MF_INGEST_CHUNK = int(os.environ.get("MF_INGEST_CHUNK", 5000))
+MF_INGEST_TARGET = os.environ.get("MF_INGEST_TARGET", "redis")
+INGEST_PREFIX = "ingest:"
+INGEST_TTL_S = 24 * 3600
+MAX_ERROR_SAMPLES = 20
+
+
+class ChunkParser:
+    """Collects validated rows of one chunk as columns."""
+
+    def __init__(self):
+        self.user_id, self.video_id, self.like = [], [], []
+        self.watchtime, self.duration, self.dont_suggest = [], [], []
+
+    def __len__(self):
+        return len(self.user_id)
+
+    def add(self, row: dict):
+        # convert everything first so a bad field does not leave a half-added row
+        values = (
+            int(row["user_id"]),
+            int(row["video_id"]),
+            int(float(row.get("like") or 0)),
+            float(row.get("watchtime") or 0.0),
+            float(row["duration"]) if row.get("duration") not in (None, "") else np.nan,
+            int(float(row.get("dont_suggest") or 0)),
+        )
+        if values[0] < 0 or values[1] < 0:
+            raise ValueError("user_id and video_id must be non-negative")
+        for column, value in zip((self.user_id, self.video_id, self.like,
+                                  self.watchtime, self.duration, self.dont_suggest), values):
+            column.append(value)
+
+    def arrays(self):
+        """(user_ids, video_ids, scores, dont_suggest) for the chunk."""
+        dont = np.asarray(self.dont_suggest, dtype=np.int8)
+        scores = compute_interaction_scores(
+            like=np.asarray(self.like), watchtime=np.asarray(self.watchtime),
+            duration=np.asarray(self.duration), dont_suggest=dont,
+        )
+        return np.asarray(self.user_id, dtype=np.int64), np.asarray(self.video_id, dtype=np.int64), scores, dont
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into decoded lines (no trailing newline); blank lines are skipped."""
+    pending = b""
+    async for chunk in stream:
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8").rstrip("\r")
+    if pending.strip():
+        yield pending.decode("utf-8").rstrip("\r")
+
+
+def default_apply(user_ids, video_ids, scores, dont_suggest):
+    """Apply one parsed chunk to the Redis row store and the seen/blocked sets."""
+    from app.services.redis import redis_rows, redis_seen
+    from app.services.topn_cache import topn_cache
+    # seen before the rows, so no top-N list is cached from a new row with the old exclusions
+    redis_seen.record_arrays(user_ids, video_ids, dont_suggest)
+    redis_rows.apply_batch(user_ids, video_ids, scores)
+    topn_cache.invalidate_users(np.unique(user_ids))
+
+
+def local_apply(user_ids, video_ids, scores, dont_suggest):
+    """Apply one parsed chunk to the in-process model, logged first so it survives a crash."""
+    from app.services import mf
+    from app.services.redis import redis_seen
+    mf.apply_interactions(user_ids, video_ids, scores)
+    redis_seen.record_arrays(user_ids, video_ids, dont_suggest)
+
+
+def _report(progress_key: str, status: dict):
+    redis_conn.hset(progress_key, mapping={k: json.dumps(v) if isinstance(v, list) else v for k, v in status.items()})
+    redis_conn.expire(progress_key, INGEST_TTL_S)
+
+
+async def ingest_stream(stream: AsyncIterator[bytes], fmt: str = "ndjson",
+                        apply_fn: Optional[Callable] = None, chunk_rows: int = MF_INGEST_CHUNK,
+                        ingest_id: Optional[str] = None) -> dict:
+    """Parse, score and apply a streamed upload chunk by chunk. Returns the final status."""
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError(f"unsupported ingest format {fmt!r}")
+    apply_fn = apply_fn or (local_apply if MF_INGEST_TARGET == "local" else default_apply)
+    ingest_id = ingest_id or uuid.uuid4().hex
+    progress_key = INGEST_PREFIX + ingest_id
+    status = {"ingest_id": ingest_id, "status": "running", "rows": 0, "applied": 0, "errors": 0, "chunks": 0}
+    error_samples = []
+    header = None
+    chunk = ChunkParser()
+
+    async def flush():
+        user_ids, video_ids, scores, dont = chunk.arrays()
+        await run_in_threadpool(apply_fn, user_ids, video_ids, scores, dont)
+        status["applied"] += len(chunk)
+        status["chunks"] += 1
+        await run_in_threadpool(_report, progress_key, status)
+
+    line_no = 0
+    async for line in iter_lines(stream):
+        line_no += 1
+        if fmt == "csv" and header is None:
+            header = next(csv.reader([line]))
+            continue
+        status["rows"] += 1
+        try:
+            if fmt == "csv":
+                row = dict(zip(header, next(csv.reader(io.StringIO(line)))))
+            else:
+                row = json.loads(line)
+            chunk.add(row)
+        except (ValueError, KeyError, TypeError, StopIteration) as exc:
+            status["errors"] += 1
+            if len(error_samples) < MAX_ERROR_SAMPLES:
+                error_samples.append(f"line {line_no}: {exc}")
+            continue
+        if len(chunk) >= chunk_rows:
+            await flush()
+            chunk = ChunkParser()
+    if len(chunk):
+        await flush()
+
+    status["status"] = "done"
+    status["error_samples"] = error_samples
+    await run_in_threadpool(_report, progress_key, status)
+    return status
+
+
+def get_progress(ingest_id: str) -> Optional[dict]:
+    raw = redis_conn.hgetall(INGEST_PREFIX + ingest_id)
+    if not raw:
+        return None
+    out = {}
+    for key, value in raw.items():
+        key, value = key.decode(), value.decode()
+        if key in ("rows", "applied", "errors", "chunks"):
+            out[key] = int(value)
+        elif key == "error_samples":
+            out[key] = json.loads(value)
+        else:
+            out[key] = value
+    return out
@@ -0,0 +1,194 @@
+# app/services/interaction_log.py
+"""
+Append-only binary log of applied interactions (user_id, video_id, score, timestamp).
+
+The log is a directory of segment files named after the global byte offset they start
+at (00000000000000000000.log, ...). A segment holds frames, one per append:
+
+    magic        u32   FRAME_MAGIC
+    payload_len  u32   bytes of payload (a multiple of RECORD_DTYPE.itemsize)
+    crc32        u32   of the payload
+    payload      RECORD_DTYPE[n]   little-endian records, written with one write()
+
+Offsets are global (segment start + position), so a checkpoint can say "covers the log
+up to offset X" (mf.save_model stores it in the model file). On startup mf.init_model
+replays the frames after the checkpoint (mf.replay_log); a torn or corrupt frame at the end
+(crash mid-write) stops the replay and is cut off before appending again. Segments that
+end before a checkpoint offset are deleted (truncate_before).
+
+Only one process may append: open() takes an exclusive lock on <directory>/LOCK.
+"""
+import fcntl
+import os
+import struct
+import threading
+import time
+import zlib
+import logging
+from typing import Iterator, Optional, Tuple
+import numpy as np
+
+MF_LOG_SEGMENT_BYTES = int(os.environ.get("MF_LOG_SEGMENT_BYTES", 64 * 2 ** 20))
+# "always": fsync after every append (survives power loss); "never": the OS flushes
+MF_LOG_FSYNC = os.environ.get("MF_LOG_FSYNC", "never")
+
+FRAME_MAGIC = 0x314C464D   # b"MFL1"
+_FRAME = struct.Struct("<III")
+RECORD_DTYPE = np.dtype([("user_id", "<i8"), ("video_id", "<i8"), ("score", "<f4"), ("ts", "<f8")])
+SEGMENT_SUFFIX = ".log"
+
+logger = logging.getLogger(__name__)
+
+
+def _segment_name(start: int) -> str:
+    return f"{start:020d}{SEGMENT_SUFFIX}"
+
+
+class InteractionLog:
+    def __init__(self, directory: str, segment_bytes: int = MF_LOG_SEGMENT_BYTES, fsync: str = MF_LOG_FSYNC):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync == "always"
+        self.lock = threading.Lock()
+        self.end: Optional[int] = None   # global offset after the last valid frame (known after open)
+        self._scanned = False            # self.end is final (a _frames pass reached the end)
+        self._file = None
+        self._lock_file = None
+        self._segment_start = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # ---------- segments ----------
+    def segments(self) -> list:
+        """Start offsets of the segment files, ascending."""
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _path(self, start: int) -> str:
+        return os.path.join(self.directory, _segment_name(start))
+
+    # ---------- reading ----------
+    def _frames(self, from_offset: int) -> Iterator[Tuple[int, bytes]]:
+        """(end offset, payload) of every valid frame after from_offset; stops at the first bad one."""
+        starts = self.segments()
+        if starts and from_offset < starts[0]:
+            logger.warning("interaction log starts at %d, after the requested offset %d; "
+                           "interactions in between are lost", starts[0], from_offset)
+            from_offset = starts[0]
+        self.end, self._scanned = from_offset, False
+        for i, start in enumerate(starts):
+            next_start = starts[i + 1] if i + 1 < len(starts) else None
+            if next_start is not None and next_start <= from_offset:
+                continue
+            with open(self._path(start), "rb") as f:
+                pos = max(from_offset - start, 0)
+                f.seek(pos)
+                while True:
+                    header = f.read(_FRAME.size)
+                    if len(header) < _FRAME.size:
+                        break
+                    magic, length, crc = _FRAME.unpack(header)
+                    payload = f.read(length) if magic == FRAME_MAGIC else b""
+                    if magic != FRAME_MAGIC or len(payload) < length or zlib.crc32(payload) != crc \
+                            or length % RECORD_DTYPE.itemsize:
+                        if next_start is not None:
+                            logger.warning("corrupt frame at offset %d in a closed segment", start + pos)
+                        self._scanned = True
+                        return
+                    pos += _FRAME.size + length
+                    self.end = start + pos
+                    yield self.end, payload
+            if next_start is not None and self.end != next_start:
+                break
+        self._scanned = True
+
+    def read(self, from_offset: int) -> Iterator[Tuple[np.ndarray, int]]:
+        """(records, end offset) of every valid frame after from_offset, one per append."""
+        for end, payload in self._frames(from_offset):
+            yield np.frombuffer(payload, dtype=RECORD_DTYPE), end
+
+    # ---------- writing ----------
+    def open(self, from_offset: int = 0) -> int:
+        """
+        Position the log for appending after the last valid frame at or after from_offset
+        (anything after it is cut off). Returns that offset.
+        """
+        with self.lock:
+            if self._lock_file is None:
+                lock_file = open(os.path.join(self.directory, "LOCK"), "a")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    raise RuntimeError(f"interaction log {self.directory} is open in another process "
+                                       "(MF_LOG_DIR has a single writer: run one worker process)")
+                self._lock_file = lock_file
+            if not self._scanned or self.end < from_offset:
+                for _ in self._frames(from_offset):
+                    pass
+            end = self.end
+            starts = [s for s in self.segments() if s <= end]
+            last = starts[-1] if starts else None
+            if last is not None and os.path.getsize(self._path(last)) >= end - last:
+                self._close_file()
+                self._segment_start = last
+                self._file = open(self._path(last), "r+b")
+                self._file.truncate(end - last)
+                self._file.seek(0, os.SEEK_END)
+            else:
+                # the log ends before the checkpoint: everything in it is covered, start afresh
+                for start in starts:
+                    os.remove(self._path(start))
+                self._new_segment(end)
+            # segments after the valid end only hold what followed a torn frame
+            for start in self.segments():
+                if start > end:
+                    os.remove(self._path(start))
+            return end
+
+    def _new_segment(self, start: int):
+        self._close_file()
+        self._segment_start = start
+        self._file = open(self._path(start), "ab")
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, user_ids, video_ids, scores, ts=None) -> int:
+        """Append one frame. Returns the global offset after it."""
+        n = len(user_ids)
+        records = np.empty(n, dtype=RECORD_DTYPE)
+        records["user_id"], records["video_id"], records["score"] = user_ids, video_ids, scores
+        records["ts"] = time.time() if ts is None else ts
+        payload = records.tobytes()
+        frame = _FRAME.pack(FRAME_MAGIC, len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            if self._file is None:
+                raise RuntimeError("interaction log is not open for appending (call open first)")
+            if self.end - self._segment_start >= self.segment_bytes:
+                self._new_segment(self.end)
+            self._file.write(frame)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.end += len(frame)
+            return self.end
+
+    def truncate_before(self, offset: int) -> int:
+        """Delete the segments that end at or before offset (covered by a checkpoint). Returns how many."""
+        with self.lock:
+            starts = self.segments()
+            removed = 0
+            for start, next_start in zip(starts, starts[1:]):
+                if next_start <= offset and start != self._segment_start:
+                    os.remove(self._path(start))
+                    removed += 1
+            return removed
+
+    def close(self):
+        with self.lock:
+            self._close_file()
+            if self._lock_file is not None:
+                self._lock_file.close()   # releases the flock
+                self._lock_file = None
@@ -0,0 +1,166 @@
+# app/services/metadata.py
+"""
+Metadata index for warm starts and cold-start recommendations.
+
+Catalog fields become attribute tokens shared by both sides:
+
+    video  categoria -> "categoria:<c>"   estilo -> "estilo:<s>"   etiquetas -> "etiqueta:<e>"
+    user   categorias_preferidas -> "categoria:<c>"   danceStyles -> "estilo:<s>"
+
+build() averages the Q rows of the videos carrying each token into a centroid vector
+and ranks the videos carrying the token against it, keeping the top MF_COLD_TOP_N
+(a per-category / per-style / per-tag "best of" list). Then:
+  - a new video starts at the mean centroid of its tokens (warm_video_vector)
+  - a new user starts at the mean centroid of its preferences (warm_user_vector);
+    scoring items against it favours the videos that sit near those attributes
+  - an unknown user gets cold_start(): the precomputed lists of its tokens,
+    interleaved by rank. That is a dict lookup per token, with no scoring pass.
+Centroids drift as Q trains; call build() again (the API does it when the catalog
+changes and every MF_META_REBUILD_S otherwise, see redis_meta.refresh_index).
+"""
+import ast
+import os
+import time
+import numpy as np
+
+MF_COLD_TOP_N = int(os.environ.get("MF_COLD_TOP_N", 100))
+
+VIDEO_FIELDS = {"categoria": "categoria", "estilo": "estilo", "etiquetas": "etiqueta"}
+USER_FIELDS = {"categorias_preferidas": "categoria", "danceStyles": "estilo", "estilos_preferidos": "estilo"}
+POPULAR = "*"   # token of the global list, served when nothing else matches
+
+
+def _values(value) -> list:
+    # catalog CSVs store lists as their Python repr ("['salsa', 'jazz']")
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            try:
+                return [str(v) for v in ast.literal_eval(value)]
+            except (ValueError, SyntaxError):
+                return []
+        return [value] if value else []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def _tokens(meta, fields) -> list:
+    if not meta:
+        return []
+    out = []
+    for field, prefix in fields.items():
+        for v in _values(meta.get(field)):
+            token = f"{prefix}:{v}"
+            if token not in out:
+                out.append(token)
+    return out
+
+
+def video_tokens(meta) -> list:
+    return _tokens(meta, VIDEO_FIELDS)
+
+
+def user_tokens(meta) -> list:
+    return _tokens(meta, USER_FIELDS)
+
+
+class MetadataIndex:
+    def __init__(self, top_n=MF_COLD_TOP_N):
+        self.top_n = top_n
+        self.video_tokens = {}   # video_id -> [token]
+        self.user_tokens = {}    # user_id -> [token]
+        self.centroids = {}      # token -> float32 (k,)
+        self.top_by_token = {}   # token -> [(video_id, score)]
+        self.videos_by_category = {}
+        self.meta_version = None  # catalog version it was built from (redis_meta.META_VERSION_KEY)
+        self.built_at = 0.0
+
+    # ---------- catalog ----------
+    def set_video(self, video_id, meta):
+        tokens = meta if isinstance(meta, list) else video_tokens(meta)
+        if tokens:
+            self.video_tokens[int(video_id)] = tokens
+
+    def set_user(self, user_id, meta):
+        tokens = meta if isinstance(meta, list) else user_tokens(meta)
+        if tokens:
+            self.user_tokens[int(user_id)] = tokens
+
+    # ---------- centroids + per-token top-N ----------
+    def build(self, model):
+        """Recompute centroids and per-token lists from model.Q; also fills model.videos_by_category."""
+        pairs = [(model.video_map[vid], tok) for vid, toks in self.video_tokens.items()
+                 if vid in model.video_map for tok in toks]
+        names = sorted({tok for _, tok in pairs})
+        centroids = {}
+        if pairs:
+            rows = np.fromiter((r for r, _ in pairs), dtype=np.int64, count=len(pairs))
+            col = {tok: i for i, tok in enumerate(names)}
+            tok_idx = np.fromiter((col[t] for _, t in pairs), dtype=np.int64, count=len(pairs))
+            counts = np.bincount(tok_idx, minlength=len(names)).astype(np.float32)
+            # float32 rows also on a scoring-only (quantized) model
+            Q_rows = model.item_rows(rows)
+            sums = np.stack([np.bincount(tok_idx, weights=Q_rows[:, d], minlength=len(names))
+                             for d in range(model.k)], axis=1).astype(np.float32)
+            C = sums / counts[:, None]
+            centroids = {tok: C[i] for i, tok in enumerate(names)}
+        if model.n_videos:
+            centroids[POPULAR] = model.item_mean()
+
+        # each list only ranks the videos carrying its token; the global one ranks all videos
+        top_by_token = {}
+        if pairs:
+            order = np.argsort(tok_idx, kind="stable")
+            bounds = np.searchsorted(tok_idx[order], np.arange(len(names) + 1))
+            for i, tok in enumerate(names):
+                tok_rows = rows[order[bounds[i]:bounds[i + 1]]]
+                top_by_token[tok] = model._top_n(model.item_scores(C[i], tok_rows), self.top_n, rows=tok_rows)
+        if POPULAR in centroids:
+            top_by_token[POPULAR] = model._top_n(model.item_scores(centroids[POPULAR]), self.top_n)
+        self.centroids, self.top_by_token = centroids, top_by_token
+
+        by_category = {}
+        for vid, toks in self.video_tokens.items():
+            for tok in toks:
+                if tok.startswith("categoria:"):
+                    by_category.setdefault(tok.split(":", 1)[1], []).append(vid)
+        self.videos_by_category = model.videos_by_category = by_category
+        self.built_at = time.monotonic()
+        return self
+
+    def _mean_centroid(self, tokens):
+        vecs = [self.centroids[t] for t in tokens if t in self.centroids]
+        if not vecs:
+            return None
+        return np.mean(vecs, axis=0).astype(np.float32)
+
+    def warm_video_vector(self, meta):
+        """Mean centroid of the video's tokens, or None if none is known."""
+        return self._mean_centroid(meta if isinstance(meta, list) else video_tokens(meta))
+
+    def warm_user_vector(self, meta):
+        return self._mean_centroid(meta if isinstance(meta, list) else user_tokens(meta))
+
+    def cold_start(self, tokens=None, top_n=10, exclude_seen=None):
+        """
+        Top-N for a user without a factor row: the precomputed lists of its tokens
+        interleaved by rank (the global list if none matches), skipping excluded ids.
+        """
+        lists = [self.top_by_token[t] for t in (tokens or []) if t in self.top_by_token]
+        if not lists:
+            lists = [self.top_by_token.get(POPULAR, [])]
+        exclude = set() if exclude_seen is None else set(np.asarray(list(exclude_seen)).tolist())
+        out, taken = [], set()
+        for rank in range(max(len(lst) for lst in lists)):
+            for lst in lists:
+                if rank < len(lst):
+                    vid, score = lst[rank]
+                    if vid not in taken and vid not in exclude:
+                        taken.add(vid)
+                        out.append((vid, score))
+                        if len(out) >= top_n:
+                            return out
+        return out
@@ -0,0 +1,324 @@
+# app/services/metrics.py
+"""
+Minimal in-process metrics (counters, gauges, latency histograms) with Prometheus
+text output.
+
+The API exposes its own registry plus the aggregate pushed by the RQ / batch workers
+on GET /metrics (no API key needed). Workers call maybe_push() after each job: their
+deltas go to a host-wide spool file, and every MF_METRICS_PUSH_S seconds the spool is
+added into the Redis hash METRICS_KEY.
+
+Hot paths use timed("stage") around each step, e.g. redis_get, decode, score, top_n,
+lock_wait, lock_hold, save.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+MF_METRICS_PUSH_S = float(os.environ.get("MF_METRICS_PUSH_S", 5))
+METRICS_KEY = "metrics:workers"
+# worker deltas waiting for the next push, shared by all worker processes of the host (see maybe_push)
+MF_METRICS_SPOOL = os.environ.get("MF_METRICS_SPOOL", os.path.join(tempfile.gettempdir(), "mf-metrics-spool.json"))
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_key(labels: dict) -> str:
+    return json.dumps(labels, sort_keys=True, separators=(",", ":"))
+
+
+def _format_labels(labels: dict, extra: dict | None = None) -> str:
+    merged = dict(labels)
+    if extra:
+        merged.update(extra)
+    if not merged:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(merged.items())) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, value=1.0, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, json.loads(k), v) for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = float(value)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name, self.help = name, help_text
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def samples(self):
+        out = []
+        with self.lock:
+            items = [(json.loads(k), list(v)) for k, v in self.values.items()]
+        for labels, row in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+                cumulative += count
+                out.append((self.name + "_bucket", dict(labels, le=str(bound)), cumulative))
+            out.append((self.name + "_count", labels, cumulative))
+            out.append((self.name + "_sum", labels, row[-1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kw):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, **kw)
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self, extra_labels: dict | None = None) -> str:
+        return render_registries([(self, extra_labels)])
+
+    # ---------- worker push / API pull ----------
+    def drain_into(self, pipe, key=METRICS_KEY):
+        """Add this registry's values into a Redis hash (via pipe) and reset them."""
+        _write_deltas(pipe, self.take_deltas(), key)
+
+    def take_deltas(self) -> dict:
+        """
+        Reset the values and return them as Redis hash fields of the aggregate:
+        {"incr": {field: delta}, "set": {field: value}} (counters and histograms add up,
+        gauges and histogram bucket bounds are overwritten).
+        """
+        incr, set_ = {}, {}
+        for metric in list(self.metrics.values()):
+            with metric.lock:
+                values, metric.values = metric.values, {}
+            for label_key, value in values.items():
+                field = f"{metric.kind}|{metric.name}|{label_key}"
+                if metric.kind == "histogram":
+                    set_[f"buckets|{metric.name}"] = json.dumps(metric.buckets)
+                    for i, v in enumerate(value):
+                        if v:
+                            incr[f"{field}|{i}"] = v
+                elif metric.kind == "gauge":
+                    set_[field] = value
+                else:
+                    incr[field] = value
+        return {"incr": incr, "set": set_}
+
+    @classmethod
+    def from_hash(cls, raw: dict) -> "Registry":
+        """Rebuild a registry from the Redis aggregate written by drain_into."""
+        reg = cls()
+        fields = {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v
+                  for k, v in raw.items()}
+        for field, value in fields.items():
+            parts = field.split("|")
+            if parts[0] == "counter":
+                reg.counter(parts[1]).values[parts[2]] = float(value)
+            elif parts[0] == "gauge":
+                reg.gauge(parts[1]).values[parts[2]] = float(value)
+            elif parts[0] == "histogram":
+                buckets = json.loads(fields.get(f"buckets|{parts[1]}", json.dumps(DEFAULT_BUCKETS)))
+                hist = reg.histogram(parts[1], buckets=buckets)
+                row = hist.values.setdefault(parts[2], [0.0] * (len(hist.buckets) + 2))
+                row[int(parts[3])] = float(value)
+        return reg
+
+
+def render_registries(sources) -> str:
+    """
+    Prometheus text for several (registry, extra_labels) pairs.
+    Samples of one metric family are kept together under a single HELP/TYPE header.
+    """
+    lines = []
+    names = []
+    for reg, _ in sources:
+        names.extend(n for n in reg.metrics if n not in names)
+    for name in names:
+        family = [(reg.metrics[name], extra) for reg, extra in sources if name in reg.metrics]
+        first = family[0][0]
+        lines.append(f"# HELP {name} {first.help}")
+        lines.append(f"# TYPE {name} {first.kind}")
+        for metric, extra in family:
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(labels, extra)} {value:.17g}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("mf_stage_seconds", "Latency of hot-path stages")
+INTERACTIONS_APPLIED = registry.counter("mf_interactions_applied_total", "Interactions applied to the model")
+REQUESTS = registry.counter("mf_requests_total", "API requests by endpoint")
+MODEL_ROWS = registry.gauge("mf_model_rows", "Rows in the served model (side=users|videos)")
+MODEL_BYTES = registry.gauge("mf_model_bytes", "Bytes held by the served factor matrices")
+QUEUE_DEPTH = registry.gauge("mf_queue_depth", "Pending interactions per transport")
+STREAM_ENTRIES = registry.counter("mf_stream_entries_total", "Interaction stream entries claimed from other consumers or dead-lettered")
+
+
+@contextmanager
+def timed(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage=stage)
+
+
+@contextmanager
+def timed_lock(lock, name: str = "model"):
+    """
+    Acquire lock recording wait time (lock_wait) and hold time (lock_hold).
+    Raises TimeoutError if the lock gives up (e.g. a Redis lock with a blocking_timeout).
+    """
+    t0 = time.perf_counter()
+    acquired = lock.acquire()
+    t1 = time.perf_counter()
+    STAGE_SECONDS.observe(t1 - t0, stage="lock_wait", lock=name)
+    if not acquired:
+        raise TimeoutError(f"{name} lock not acquired after {t1 - t0:.1f}s")
+    try:
+        yield
+    finally:
+        lock.release()
+        STAGE_SECONDS.observe(time.perf_counter() - t1, stage="lock_hold", lock=name)
+
+
+def observe_model(model):
+    if model is None:
+        return
+    MODEL_ROWS.set(model.n_users, side="users")
+    MODEL_ROWS.set(model.n_videos, side="videos")
+    MODEL_BYTES.set(model.P.nbytes + model.item_nbytes)
+
+
+def _write_deltas(pipe, deltas: dict, key=METRICS_KEY):
+    for field, value in deltas["incr"].items():
+        pipe.hincrbyfloat(key, field, value)
+    for field, value in deltas["set"].items():
+        pipe.hset(key, field, value)
+
+
+def _empty_spool() -> dict:
+    return {"pushed_at": 0.0, "incr": {}, "set": {}}
+
+
+_flush_registered = [False]
+
+
+def maybe_push(force: bool = False):
+    """
+    Worker side: push accumulated metrics to Redis at most every MF_METRICS_PUSH_S seconds.
+
+    The deltas are first merged into the spool file MF_METRICS_SPOOL (under flock), which
+    also records the last push. RQ runs every job in a fresh fork that exits right after
+    it, so neither the deltas nor the throttle could live in process memory. Whichever
+    process finds the push due sends the whole spool. Processes that call this also
+    flush at exit.
+    """
+    if not _flush_registered[0]:
+        _flush_registered[0] = True
+        atexit.register(flush)
+    deltas = registry.take_deltas()
+    fd = os.open(MF_METRICS_SPOOL, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            spool = json.loads(f.read() or "null") or _empty_spool()
+        except ValueError:
+            spool = _empty_spool()   # torn write of a killed process
+        for field, value in deltas["incr"].items():
+            spool["incr"][field] = spool["incr"].get(field, 0.0) + value
+        spool["set"].update(deltas["set"])
+        now = time.time()
+        if force or now - spool["pushed_at"] >= MF_METRICS_PUSH_S:
+            if spool["incr"] or spool["set"]:
+                from app.services.redis.redis_client import redis_conn
+                pipe = redis_conn.pipeline(transaction=False)
+                _write_deltas(pipe, spool)
+                try:
+                    pipe.execute()
+                except Exception:
+                    # kept in the spool for the next push
+                    logging.getLogger(__name__).warning("metrics push failed", exc_info=True)
+                    now = spool["pushed_at"]
+                else:
+                    spool = _empty_spool()
+            spool["pushed_at"] = now
+        f.seek(0)
+        f.truncate()
+        json.dump(spool, f)
+
+
+def flush():
+    """Push whatever is spooled now (worker shutdown)."""
+    try:
+        maybe_push(force=True)
+    except Exception:
+        logging.getLogger(__name__).warning("metrics flush failed", exc_info=True)
+
+
+def render_all() -> str:
+    """API side: local metrics plus the worker aggregate (labelled source="worker")."""
+    from app.services.redis.redis_client import redis_conn
+    sources = [(registry, {"source": "api"})]
+    try:
+        raw = redis_conn.hgetall(METRICS_KEY)
+    except Exception:
+        raw = {}
+    if raw:
+        sources.append((Registry.from_hash(raw), {"source": "worker"}))
+    return render_registries(sources)
@@ -1,14 +1,197 @@
 # app/services/mf.py
+import copy
 import os
 import pickle
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping
+from contextlib import contextmanager
 import numpy as np
 from .helpers import compute_interaction_score
+from .metrics import STAGE_SECONDS, timed, timed_lock
+from .quant import MF_QUANT, QuantizedMatrix, check_mode
 
-MODEL_PATH = os.environ.get("MF_MODEL_PATH", "data/mf_model.pkl")
+MODEL_PATH = os.environ.get("MF_MODEL_PATH", "data/mf_model.bin")
+# "bin" (model_io binary format, memory-mapped on load) or "pickle"
+MODEL_FORMAT = os.environ.get("MF_MODEL_FORMAT", "bin")
+# still read when MODEL_PATH does not exist yet
+LEGACY_MODEL_PATH = "data/mf_model.pkl"
+
+# factor buffers grow geometrically so adding rows is amortized O(1)
+GROWTH_FACTOR = 1.5
+MIN_CAPACITY = 64
+
+# How concurrent updates of one in-process model are synchronized:
+#   "lock"     one model-wide lock around every row write (default)
+#   "striped"  rows hash onto MF_LOCK_STRIPES user locks and as many video locks; an update
+#              holds only the stripes of the rows it touches, so no step is ever lost
+#   "hogwild"  no locks at all; racing writes may drop a step, which SGD tolerates
+# Readers (recommend) never take a lock in any mode; they may see a row mid-update.
+CONCURRENCY_MODES = ("lock", "striped", "hogwild")
+MF_CONCURRENCY = os.environ.get("MF_CONCURRENCY", "lock")
+MF_LOCK_STRIPES = int(os.environ.get("MF_LOCK_STRIPES", 16))
+MF_UPDATE_THREADS = int(os.environ.get("MF_UPDATE_THREADS", os.cpu_count() or 1))
+
+# SnapshotPublisher defaults: republish after MF_SNAPSHOT_EVERY applied interactions or, for
+# the remainder, every MF_SNAPSHOT_INTERVAL_S. Lower values mean fresher reads and more
+# copying (one copy of P and Q per publish).
+MF_SNAPSHOT_EVERY = int(os.environ.get("MF_SNAPSHOT_EVERY", 10_000))
+MF_SNAPSHOT_INTERVAL_S = float(os.environ.get("MF_SNAPSHOT_INTERVAL_S", 1.0))
+
+# Durability of the global model, off unless MF_LOG_DIR is set (only useful with
+# MF_INGEST_TARGET=local, the one path that trains this process's model): every
+# apply_interactions call is appended to the interaction log in MF_LOG_DIR before it is
+# applied. save_model is the checkpoint: the file records the log offset it covers, and
+# init_model replays the log after it in batches of MF_REPLAY_BATCH. A checkpoint is written
+# every MF_CHECKPOINT_S (start_checkpoints), so recovery replays at most that much of the log
+# whatever the model size. The log has a single writer: run one worker process with it.
+MF_LOG_DIR = os.environ.get("MF_LOG_DIR", "")
+MF_CHECKPOINT_S = float(os.environ.get("MF_CHECKPOINT_S", 300))
+MF_REPLAY_BATCH = int(os.environ.get("MF_REPLAY_BATCH", 50_000))
+
+# recommend_many scores users in row blocks (P[block] @ Q.T); the (users x videos) float32
+# score block stays under MF_SCORE_BLOCK_MB
+MF_SCORE_BLOCK_MB = float(os.environ.get("MF_SCORE_BLOCK_MB", 64))
+
+def sgd_step(pu, qv, rating, lr, reg):
+    """
+    One SGD step on a (user, video) pair. Returns the new (pu, qv) rows.
+    Shared by MatrixFactorization.update and the Redis row store so both
+    apply exactly the same math.
+    """
+    err = rating - float(pu.dot(qv))
+    new_pu = pu + lr * (err * qv - reg * pu)
+    new_qv = qv + lr * (err * pu - reg * qv)
+    return new_pu.astype(np.float32), new_qv.astype(np.float32)
+
+def coalesce_pairs(u_idx, v_idx, ratings):
+    """
+    Merge repeated (user, video) pairs of a batch into one entry with the mean rating.
+    Returns (u_idx, v_idx, ratings) without duplicates.
+    """
+    u_idx = np.asarray(u_idx, dtype=np.int64)
+    v_idx = np.asarray(v_idx, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.float32)
+    pairs = np.stack([u_idx, v_idx], axis=1)
+    uniq, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse)
+    merged = np.bincount(inverse, weights=ratings) / counts
+    return uniq[:, 0], uniq[:, 1], merged.astype(np.float32)
+
+def sgd_batch_step(P, Q, u_idx, v_idx, ratings, lr, reg):
+    """
+    Vectorized mini-batch SGD, applied in place on P and Q.
+    All gradients are computed from the same (pre-update) rows and scattered back with
+    np.add.at. A row touched by several pairs gets the mean of its gradients, so a
+    burst on one user does not multiply the step size.
+    """
+    u_idx, v_idx, ratings = coalesce_pairs(u_idx, v_idx, ratings)
+    pu = P[u_idx]
+    qv = Q[v_idx]
+    err = ratings - np.einsum("ij,ij->i", pu, qv)
+    grad_p = err[:, None] * qv - reg * pu
+    grad_q = err[:, None] * pu - reg * qv
+    # counts over the touched rows only, so a small batch costs nothing per row of P/Q
+    _, u_inv, u_counts = np.unique(u_idx, return_inverse=True, return_counts=True)
+    _, v_inv, v_counts = np.unique(v_idx, return_inverse=True, return_counts=True)
+    np.add.at(P, u_idx, (lr / u_counts[u_inv].astype(np.float32))[:, None] * grad_p)
+    np.add.at(Q, v_idx, (lr / v_counts[v_inv].astype(np.float32))[:, None] * grad_q)
+    return err
+
+def top_n_rows(scores, top_n):
+    """
+    Per-row top-N of a (users x items) score block: argpartition per row, then only the N
+    are sorted (descending score, ties: higher index first, like MatrixFactorization._top_n).
+    Returns (item indices, scores), both (users x min(top_n, items)).
+    """
+    n_rows, n_items = scores.shape
+    top_n = max(0, min(top_n, n_items))
+    if top_n < n_items:
+        cand = np.argpartition(scores, n_items - top_n, axis=1)[:, n_items - top_n:]
+    else:
+        cand = np.broadcast_to(np.arange(n_items), scores.shape)
+    vals = np.take_along_axis(scores, cand, axis=1)
+    order = np.lexsort((-cand, -vals), axis=1)
+    return np.take_along_axis(cand, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+def _new_positions(ids, id_map):
+    """Positions in ids of the first occurrence of every id not yet in id_map."""
+    seen = set()
+    keep = []
+    for i, id_ in enumerate(ids):
+        if id_ not in id_map and id_ not in seen:
+            seen.add(id_)
+            keep.append(i)
+    return keep
+
+class IdArrayMap(Mapping):
+    """
+    Read-only id -> row mapping over an int64 array of ids (row i holds ids[i]), looked up
+    in a sorted copy (built on the first lookup). Models loaded from arrays use it instead
+    of a dict: no Python object per id, and the id array itself can be a shared memory map
+    (see shared_model). Writable models swap it for a dict when they first add ids.
+    """
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self._order = self._sorted = None
+
+    @property
+    def order(self):
+        if self._order is None:
+            self._order = np.argsort(self.ids, kind="stable")
+        return self._order
+
+    @property
+    def sorted(self):
+        if self._sorted is None:
+            self._sorted = self.ids[self.order]
+        return self._sorted
+
+    def __getitem__(self, key):
+        pos = int(np.searchsorted(self.sorted, key))
+        if pos < len(self.sorted) and self.sorted[pos] == key:
+            return int(self.order[pos])
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except (KeyError, TypeError, OverflowError):
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+class RowIdArray(Mapping):
+    """Read-only row -> id mapping over the same array (the idx2user / idx2video of an IdArrayMap)."""
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=np.int64)
+
+    def __getitem__(self, row):
+        if isinstance(row, (int, np.integer)) and 0 <= row < len(self.ids):
+            return int(self.ids[row])
+        raise KeyError(row)
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+def _copy_map(id_map):
+    # array-backed maps are never written, so they can be shared as they are
+    return id_map if isinstance(id_map, (IdArrayMap, RowIdArray)) else dict(id_map)
 
 class MatrixFactorization:
-    def __init__(self, k=20, lr=0.5, reg=0.02, seed=1):
+    def __init__(self, k=20, lr=0.5, reg=0.02, seed=1, concurrency=None):
         rng = np.random.default_rng(seed)
         self.k = k
         self.lr = lr
@@ -18,68 +201,623 @@ class MatrixFactorization:
         self.video_map = {}
         self.idx2user = {}
         self.idx2video = {}
-        self.P = np.zeros((0, k), dtype=np.float32)
-        self.Q = np.zeros((0, k), dtype=np.float32)
-        self.lock = threading.Lock()
-        # optional metadata indices
+        # P/Q are views over capacity-managed buffers (see _reserve); n_users/n_videos are the live rows
+        self._P_buf = np.zeros((0, k), dtype=np.float32)
+        self._Q_buf = np.zeros((0, k), dtype=np.float32)
+        self.n_users = 0
+        self.n_videos = 0
+        self.concurrency = concurrency or MF_CONCURRENCY
+        if self.concurrency not in CONCURRENCY_MODES:
+            raise ValueError(f"unknown concurrency mode {self.concurrency!r}, expected one of {CONCURRENCY_MODES}")
+        self._init_locks()
+        # optional metadata indices (filled by enable_metadata / MetadataIndex.build)
         self.videos_by_category = {}
+        self.meta_index = None
+        # optional ANN index over Q (enable_ann)
+        self.ann_index = None
+        # optional quantized copy of Q used for scoring (quantize)
+        self.q_quant = None
+        # interactions applied so far; snapshots are read-only copies (see snapshot)
+        self.n_updates = 0
+        # interaction log offset covered by the rows (see apply_interactions)
+        self.log_offset = 0
+        self.frozen = False
+        self.publisher = None
         self.seed = seed  # store seed for re-creation after unpickling
 
+    @classmethod
+    def from_arrays(cls, user_ids, P, video_ids, Q, k=20, lr=0.5, reg=0.02, seed=1, frozen=False):
+        """
+        Build a model from factor rows and their ids (row i of P belongs to user_ids[i]).
+        Used by the storage backends to rebuild a model without unpickling.
+        Q may be a QuantizedMatrix: the model then only scores (no float32 Q, see quantize).
+        The id maps are views of the id arrays (IdArrayMap) instead of dicts; a writable
+        model turns them into dicts on its first new id (_writable_maps). frozen=True builds
+        a read-only model.
+        """
+        model = cls(k=k, lr=lr, reg=reg, seed=seed)
+        model.user_map, model.idx2user = IdArrayMap(user_ids), RowIdArray(user_ids)
+        model.video_map, model.idx2video = IdArrayMap(video_ids), RowIdArray(video_ids)
+        model.P = np.asarray(P, dtype=np.float32).reshape(len(user_ids), k)
+        if isinstance(Q, QuantizedMatrix):
+            model._Q_buf, model.n_videos, model.q_quant = None, len(video_ids), Q
+        else:
+            model.Q = np.asarray(Q, dtype=np.float32).reshape(len(video_ids), k)
+        model.frozen = frozen
+        return model
+
+    # ---------- factor storage ----------
+    @property
+    def P(self):
+        return self._P_buf[:self.n_users]
+
+    @P.setter
+    def P(self, value):
+        self._P_buf = np.ascontiguousarray(value, dtype=np.float32).reshape(-1, self.k)
+        self.n_users = self._P_buf.shape[0]
+
+    @property
+    def Q(self):
+        if self._Q_buf is None:
+            raise RuntimeError("float32 Q was released by quantize(keep_master=False); this model only scores")
+        return self._Q_buf[:self.n_videos]
+
+    @Q.setter
+    def Q(self, value):
+        self._Q_buf = np.ascontiguousarray(value, dtype=np.float32).reshape(-1, self.k)
+        self.n_videos = self._Q_buf.shape[0]
+
+    def _reserve(self, buf, n_rows, extra):
+        """Return a buffer with room for n_rows + extra rows (grown geometrically if needed)."""
+        need = n_rows + extra
+        if need <= buf.shape[0]:
+            return buf
+        capacity = max(need, int(buf.shape[0] * GROWTH_FACTOR), MIN_CAPACITY)
+        new_buf = np.empty((capacity, self.k), dtype=np.float32)
+        new_buf[:n_rows] = buf[:n_rows]
+        return new_buf
+
+    # ---------- synchronization ----------
+    def _init_locks(self):
+        # self.lock guards structure (id maps, buffer growth, ANN index) and, in "lock" mode, rows too
+        self.lock = threading.Lock()
+        self._user_stripes = [threading.Lock() for _ in range(MF_LOCK_STRIPES)]
+        self._video_stripes = [threading.Lock() for _ in range(MF_LOCK_STRIPES)]
+        # n_updates is bumped from many stripes at once (or none, hogwild): += alone loses counts
+        self._count_lock = threading.Lock()
+
+    def _check_writable(self):
+        if getattr(self, "frozen", False):
+            raise RuntimeError("model snapshots and shared models are read-only; update the working model")
+
+    @contextmanager
+    def _row_locks(self, u_idx, v_idx):
+        """Hold whatever the concurrency mode needs to write rows u_idx of P and v_idx of Q."""
+        self._check_writable()
+        if self.concurrency == "hogwild":
+            yield
+            return
+        if self.concurrency == "lock":
+            with timed_lock(self.lock):
+                yield
+            return
+        # striped: user stripes then video stripes, each in ascending order, so no deadlock
+        n = len(self._user_stripes)
+        locks = [self._user_stripes[i] for i in np.unique(np.asarray(u_idx) % n)]
+        locks += [self._video_stripes[i] for i in np.unique(np.asarray(v_idx) % n)]
+        t0 = time.perf_counter()
+        for lock in locks:
+            lock.acquire()
+        t1 = time.perf_counter()
+        STAGE_SECONDS.observe(t1 - t0, stage="lock_wait", lock="stripes")
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+            STAGE_SECONDS.observe(time.perf_counter() - t1, stage="lock_hold", lock="stripes")
+
+    @contextmanager
+    def _all_stripes(self, stripes):
+        # buffer growth in striped mode: no writer may hold a row of the old buffer meanwhile
+        if self.concurrency != "striped":
+            yield
+            return
+        for lock in stripes:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(stripes):
+                lock.release()
+
     def _init_vector(self):
         return self.rng.normal(0.0, 0.01, size=self.k).astype(np.float32)
 
     def _add_user(self, user_id, warm_vector=None):
-        vec = warm_vector if warm_vector is not None else self._init_vector()
-        with self.lock:
-            idx = len(self.user_map)
-            self.user_map[user_id] = idx
-            self.idx2user[idx] = user_id
-            self.P = np.vstack([self.P, vec[np.newaxis, :]])
+        self.add_users([user_id], None if warm_vector is None else warm_vector[np.newaxis, :])
 
     def _add_video(self, video_id, warm_vector=None):
-        vec = warm_vector if warm_vector is not None else self._init_vector()
+        self.add_videos([video_id], None if warm_vector is None else warm_vector[np.newaxis, :])
+
+    def _writable_maps(self, side):
+        """Turn the array-backed id maps of a side into dicts (once, under self.lock) before adding ids."""
+        map_attr, idx_attr = ("user_map", "idx2user") if side == "user" else ("video_map", "idx2video")
+        id_map = getattr(self, map_attr)
+        if isinstance(id_map, IdArrayMap):
+            ids = id_map.ids.tolist()
+            setattr(self, map_attr, dict(zip(ids, range(len(ids)))))
+            setattr(self, idx_attr, dict(enumerate(ids)))
+
+    def add_users(self, user_ids, warm_vectors=None):
+        """
+        Register many users with a single allocation. Ids already known are skipped.
+        warm_vectors (optional) has one row per id in user_ids.
+        """
+        self._check_writable()
+        ids = list(user_ids)
+        if not _new_positions(ids, self.user_map):
+            return
+        with self.lock:
+            # decided again under the lock so two threads never register the same id
+            keep = _new_positions(ids, self.user_map)
+            if not keep:
+                return
+            self._writable_maps("user")
+            if warm_vectors is not None:
+                vecs = np.asarray(warm_vectors, dtype=np.float32)[keep]
+            else:
+                vecs = self.rng.normal(0.0, 0.01, size=(len(keep), self.k)).astype(np.float32)
+            start = self.n_users
+            if start + len(keep) > self._P_buf.shape[0]:
+                with self._all_stripes(self._user_stripes):
+                    self._P_buf = self._reserve(self._P_buf, start, len(keep))
+            self._P_buf[start:start + len(keep)] = vecs
+            for idx, i in enumerate(keep, start):
+                self.user_map[ids[i]] = idx
+                self.idx2user[idx] = ids[i]
+            self.n_users = start + len(keep)
+
+    def add_videos(self, video_ids, warm_vectors=None):
+        """Same as add_users, for videos."""
+        self._check_writable()
+        ids = list(video_ids)
+        if not _new_positions(ids, self.video_map):
+            return
         with self.lock:
-            idx = len(self.video_map)
-            self.video_map[video_id] = idx
-            self.idx2video[idx] = video_id
-            self.Q = np.vstack([self.Q, vec[np.newaxis, :]])
+            # decided again under the lock so two threads never register the same id
+            keep = _new_positions(ids, self.video_map)
+            if not keep:
+                return
+            self._writable_maps("video")
+            if warm_vectors is not None:
+                vecs = np.asarray(warm_vectors, dtype=np.float32)[keep]
+            else:
+                vecs = self.rng.normal(0.0, 0.01, size=(len(keep), self.k)).astype(np.float32)
+            start = self.n_videos
+            if start + len(keep) > self._Q_buf.shape[0]:
+                with self._all_stripes(self._video_stripes):
+                    self._Q_buf = self._reserve(self._Q_buf, start, len(keep))
+            self._Q_buf[start:start + len(keep)] = vecs
+            for idx, i in enumerate(keep, start):
+                self.video_map[ids[i]] = idx
+                self.idx2video[idx] = ids[i]
+            self.n_videos = start + len(keep)
+            if getattr(self, "ann_index", None) is not None:
+                self.ann_index.add(vecs)
+            if getattr(self, "q_quant", None) is not None:
+                self.q_quant.append(vecs)
 
-    def update(self, user_id, video_id, rating):
+    def record_meta(self, user_id, video_id, user_meta=None, video_meta=None):
+        # metadata (optional) is recorded and used to warm-start ids seen for the first time
+        index = getattr(self, "meta_index", None)
+        if index is not None:
+            if user_meta:
+                index.set_user(user_id, user_meta)
+            if video_meta:
+                index.set_video(video_id, video_meta)
+
+    def update(self, user_id, video_id, rating, user_meta=None, video_meta=None):
+        self.record_meta(user_id, video_id, user_meta, video_meta)
         # ensure existence
-        print(f"Update called: user_id={user_id}, video_id={video_id}, rating={rating}")
         if user_id not in self.user_map:
-            self._add_user(user_id)
+            self._add_user(user_id, self._warm_rows([user_id], "user", random_fill=False))
         if video_id not in self.video_map:
-            self._add_video(video_id)
+            self._add_video(video_id, self._warm_rows([video_id], "video", random_fill=False))
         u = self.user_map[user_id]
         v = self.video_map[video_id]
-        # do SGD update (in lock to be safe)
-        pred = float(self.P[u].dot(self.Q[v]))
-        err = rating - pred
+        # read and write the rows under the same locks (see CONCURRENCY_MODES)
+        with self._row_locks((u,), (v,)):
+            P, Q = self.P, self.Q
+            P[u], Q[v] = sgd_step(P[u].copy(), Q[v].copy(), rating, self.lr, self.reg)
+            self._count_updates(1)
+        self._items_changed(np.array([v]))
+        self._maybe_publish()
+
+    def _count_updates(self, n):
+        with self._count_lock:
+            self.n_updates += n
+
+    def _items_changed(self, v_idx):
+        # keep the derived item structures (ANN lists, quantized rows) in step with Q
+        index, quant = getattr(self, "ann_index", None), getattr(self, "q_quant", None)
+        if index is None and quant is None:
+            return
         with self.lock:
-            pu = self.P[u].copy()
-            qv = self.Q[v].copy()
-            self.P[u] += self.lr * (err * qv - self.reg * pu)
-            self.Q[v] += self.lr * (err * pu - self.reg * qv)
-        
+            rows = self.Q[v_idx]
+            if index is not None:
+                index.update(v_idx, rows)
+            if quant is not None:
+                quant.set_rows(v_idx, rows)
 
-    def recommend(self, user_id, top_n=10, exclude_seen=set()):
+    def _apply_rows(self, u_idx, v_idx, ratings, log_offset=None):
+        with self._row_locks(u_idx, v_idx):
+            err = sgd_batch_step(self.P, self.Q, u_idx, v_idx, ratings, self.lr, self.reg)
+            self._count_updates(len(u_idx))
+            if log_offset is not None:
+                # under the row locks, so a snapshot never has the rows without the offset
+                self.log_offset = log_offset
+        self._items_changed(np.unique(v_idx))
+        self._maybe_publish()
+        return err
+
+    def _warm_rows(self, ids, side, random_fill=True):
+        """
+        Warm-start rows from the metadata index for ids (one row per id), or None if
+        nothing is known. Ids without metadata get a random row (or None for a single id).
+        """
+        index = getattr(self, "meta_index", None)
+        if index is None:
+            return None
+        tokens, warm = (index.user_tokens, index.warm_user_vector) if side == "user" else \
+            (index.video_tokens, index.warm_video_vector)
+        vecs = [warm(tokens[i]) if i in tokens else None for i in ids]
+        if all(v is None for v in vecs):
+            return None
+        if not random_fill:
+            return vecs[0]
+        return np.stack([self._init_vector() if v is None else v for v in vecs])
+
+    def _add_warm(self, ids, side):
+        add, known = (self.add_users, self.user_map) if side == "user" else (self.add_videos, self.video_map)
+        if getattr(self, "meta_index", None) is None:
+            add(ids)
+            return
+        new = list(dict.fromkeys(i for i in ids if i not in known))
+        add(new, self._warm_rows(new, side))
+
+    def _row_indices(self, user_ids, video_ids):
+        self._add_warm(user_ids, "user")
+        self._add_warm(video_ids, "video")
+        u_idx = np.fromiter((self.user_map[u] for u in user_ids), dtype=np.int64, count=len(user_ids))
+        v_idx = np.fromiter((self.video_map[v] for v in video_ids), dtype=np.int64, count=len(video_ids))
+        return u_idx, v_idx
+
+    def update_batch(self, user_ids, video_ids, ratings, log_offset=None):
+        """
+        Apply a batch of interactions with one vectorized SGD step.
+        New ids are registered in one go and repeated (user, video) pairs are merged.
+        log_offset: interaction log offset covered once the batch is applied (apply_interactions).
+        """
+        if len(user_ids) == 0:
+            return
+        u_idx, v_idx = self._row_indices(user_ids, video_ids)
+        self._apply_rows(u_idx, v_idx, ratings, log_offset)
+
+    def update_many(self, user_ids, video_ids, ratings, n_threads=None, chunk_size=2048):
+        """
+        Apply many interactions as mini-batches of at most chunk_size on a thread pool.
+        In "striped" mode the interactions are grouped by (user stripe, video stripe), so a
+        mini-batch holds exactly two stripe locks, and the groups are queued diagonal by
+        diagonal so the ones running together touch disjoint stripes. In "hogwild" mode
+        chunks run unsynchronized; in "lock" mode they take turns on the model lock.
+        Returns the number of interactions applied.
+        """
+        n = len(user_ids)
+        if n == 0:
+            return 0
+        u_idx, v_idx = self._row_indices(user_ids, video_ids)
+        ratings = np.asarray(ratings, dtype=np.float32)
+        if self.concurrency == "striped":
+            s = len(self._user_stripes)
+            us, vs = u_idx % s, v_idx % s
+            block = ((vs - us) % s) * s + us   # diagonal-major
+            order = np.argsort(block, kind="stable")
+            starts = np.flatnonzero(np.r_[True, np.diff(block[order]) != 0])
+            groups = np.split(order, starts[1:])
+        else:
+            groups = [np.arange(n)]
+        tasks = [g[i:i + chunk_size] for g in groups for i in range(0, len(g), chunk_size)]
+        with ThreadPoolExecutor(max_workers=n_threads or MF_UPDATE_THREADS) as pool:
+            for _ in pool.map(lambda sel: self._apply_rows(u_idx[sel], v_idx[sel], ratings[sel]), tasks):
+                pass
+        return n
+
+    def recommend(self, user_id, top_n=10, exclude_seen=set(), user_meta=None):
         # returns list of (video_id, score)
         if user_id not in self.user_map:
-            return []
+            return self.cold_start(user_id, top_n=top_n, exclude_seen=exclude_seen, user_meta=user_meta)
         u = self.user_map[user_id]
-        scores = self.Q.dot(self.P[u])
-        idxs = np.argsort(scores)[::-1]
+        return self.recommend_for_vector(self.P[u], top_n=top_n, exclude_seen=exclude_seen)
+
+    def recommend_for_vector(self, user_vector, top_n=10, exclude_seen=set()):
+        # same as recommend, for a user row that lives outside P (e.g. fetched from Redis)
+        exclude_idx = self._exclude_index(exclude_seen)
+        index = getattr(self, "ann_index", None)
+        if index is not None:
+            # approximate retrieval, exact rerank of the candidates only
+            with timed("ann_candidates"):
+                rows = index.candidates(user_vector)
+            if len(rows) >= top_n + (0 if exclude_idx is None else len(exclude_idx)):
+                with timed("score"):
+                    scores = self.item_scores(user_vector, rows)
+                with timed("top_n"):
+                    return self._top_n(scores, top_n, exclude_idx, rows=rows)
+        with timed("score"):
+            scores = self.item_scores(user_vector)
+        with timed("top_n"):
+            return self._top_n(scores, top_n, exclude_idx)
+
+    def recommend_many(self, user_ids, top_n=10, exclude_seen=None, block_rows=None):
+        """
+        Top-N for many users at once: {user_id: [(video_id, score), ...]}. exclude_seen is
+        None or one collection of video ids per user. Users without a row get cold_start.
+        """
+        user_ids = [int(u) for u in user_ids]
+        known = [i for i, u in enumerate(user_ids) if u in self.user_map]
+        rows = np.fromiter((self.user_map[user_ids[i]] for i in known), dtype=np.int64, count=len(known))
+        excludes = None if exclude_seen is None else [exclude_seen[i] for i in known]
+        recs = self.recommend_for_vectors(self.P[rows], top_n=top_n, exclude_seen=excludes, block_rows=block_rows)
+        out = {user_ids[i]: r for i, r in zip(known, recs)}
+        for i, uid in enumerate(user_ids):
+            if uid not in out:
+                out[uid] = self.cold_start(uid, top_n=top_n, exclude_seen=None if exclude_seen is None else exclude_seen[i])
+        return out
+
+    def recommend_for_vectors(self, user_vectors, top_n=10, exclude_seen=None, block_rows=None):
+        """
+        recommend_for_vector for every row of user_vectors, scored block_rows users at a time
+        with one matrix product per block (exact, the ANN index is not used). Returns one
+        list per row. Ties at the N-th score may pick a different item than the single path.
+        """
+        U = np.asarray(user_vectors, dtype=np.float32).reshape(-1, self.k)
+        if block_rows is None:
+            block_rows = int(MF_SCORE_BLOCK_MB * 2 ** 20) // max(4 * self.n_videos, 1)
+        block_rows = max(1, block_rows)
         out = []
-        for idx in idxs:
-            vid = self.idx2video[idx]
-            if vid in exclude_seen:
-                continue
-            out.append((vid, float(scores[idx])))
-            if len(out) >= top_n:
-                break
+        for start in range(0, U.shape[0], block_rows):
+            with timed("score"):
+                scores = self.item_scores_many(U[start:start + block_rows])
+            if exclude_seen is not None:
+                # one scatter of -inf over the (row, item) pairs of the whole block
+                cols = [self._exclude_index(ex) for ex in exclude_seen[start:start + block_rows]]
+                cols = [np.zeros(0, dtype=np.int64) if c is None else c for c in cols]
+                lens = [len(c) for c in cols]
+                if sum(lens):
+                    scores[np.repeat(np.arange(len(cols)), lens), np.concatenate(cols)] = -np.inf
+            with timed("top_n"):
+                out.extend(self._top_n_rows(scores, top_n))
         return out
-    
+
+    def _top_n_rows(self, scores, top_n):
+        """Per-row top-N (video_id, score) lists of a (users x items) score block."""
+        cand, vals = top_n_rows(scores, top_n)
+        if cand.shape[1] == 0:
+            return [[] for _ in range(scores.shape[0])]
+        ids = self.video_id_array[cand]
+        # excluded items (-inf) only show up when fewer than top_n are left
+        return [[(v, s) for v, s in zip(id_row, val_row) if s != -np.inf]
+                for id_row, val_row in zip(ids.tolist(), vals.astype(float).tolist())]
+
+    def item_scores_many(self, U):
+        """U @ Q.T: one row of item scores per query vector."""
+        quant = getattr(self, "q_quant", None)
+        return U @ self.Q.T if quant is None else quant.dot_many(U)
+
+    def item_scores(self, vec, rows=None):
+        """Q @ vec (or Q[rows] @ vec), from the quantized rows when the model has them."""
+        quant = getattr(self, "q_quant", None)
+        if rows is None:
+            return self.Q.dot(vec) if quant is None else quant.dot(vec)
+        return self.Q[rows].dot(vec) if quant is None else quant.dot_rows(rows, vec)
+
+    def item_rows(self, rows):
+        """float32 rows of Q, dequantized on a scoring-only model."""
+        return self.Q[rows] if self._Q_buf is not None else self.q_quant.dequantize(rows)
+
+    def item_mean(self):
+        """Mean item row (without materializing a dequantized Q)."""
+        if self._Q_buf is not None:
+            return self.Q.mean(axis=0).astype(np.float32)
+        total = np.zeros(self.k, dtype=np.float64)
+        for start in range(0, self.n_videos, 65536):
+            total += self.q_quant.dequantize(np.arange(start, min(start + 65536, self.n_videos))).sum(axis=0)
+        return (total / max(self.n_videos, 1)).astype(np.float32)
+
+    def _video_id_lookup(self):
+        """
+        (ids, order, sorted ids) of idx2video, rebuilt lazily when videos were added. One
+        tuple, swapped in one assignment, so concurrent readers never mix two builds.
+        """
+        cached = getattr(self, "_video_ids", None)
+        if cached is None or len(cached[0]) != len(self.idx2video):
+            if isinstance(self.video_map, IdArrayMap):
+                cached = (self.video_map.ids, self.video_map.order, self.video_map.sorted)
+            else:
+                ids = np.fromiter((self.idx2video[i] for i in range(len(self.idx2video))),
+                                  dtype=np.int64, count=len(self.idx2video))
+                order = np.argsort(ids, kind="stable")
+                cached = (ids, order, ids[order])
+            self._video_ids = cached
+        return cached
+
+    @property
+    def video_id_array(self):
+        """idx2video as an int64 array."""
+        return self._video_id_lookup()[0]
+
+    def rows_for_video_ids(self, video_ids):
+        """Vectorized video_map lookup: row indices of the known ids in video_ids (unknown ids dropped)."""
+        ids = np.asarray(video_ids, dtype=np.int64)
+        if ids.size == 0 or self.n_videos == 0:
+            return np.zeros(0, dtype=np.int64)
+        _, order, sorted_ids = self._video_id_lookup()
+        pos = np.searchsorted(sorted_ids, ids)
+        pos[pos >= len(sorted_ids)] = 0
+        found = sorted_ids[pos] == ids
+        return order[pos[found]]
+
+    def _exclude_index(self, exclude_seen):
+        # video ids -> row indices; unknown ids are ignored
+        if exclude_seen is None or len(exclude_seen) == 0:
+            return None
+        if isinstance(exclude_seen, np.ndarray):
+            return self.rows_for_video_ids(exclude_seen)
+        video_map = self.video_map
+        return np.fromiter((video_map[v] for v in exclude_seen if v in video_map), dtype=np.int64)
+
+    def _top_n(self, scores, top_n, exclude_idx=None, rows=None):
+        """
+        Top-N (video_id, score) pairs in descending score order.
+        Same ordering as np.argsort(scores, kind="stable")[::-1] (ties: higher index first),
+        but only the candidates above the N-th score are sorted.
+        If rows is given, scores[i] belongs to item row rows[i] (a candidate subset).
+        """
+        n_items = scores.shape[0]
+        if rows is None:
+            rows = np.arange(n_items)
+            if exclude_idx is not None and len(exclude_idx):
+                scores = scores.copy()
+                scores[exclude_idx] = -np.inf
+        elif exclude_idx is not None and len(exclude_idx):
+            scores = np.where(np.isin(rows, exclude_idx), -np.inf, scores)
+        if exclude_idx is not None and len(exclude_idx):
+            n_valid = int(np.isfinite(scores).sum())
+        else:
+            n_valid = n_items
+        top_n = min(top_n, n_valid)
+        if top_n <= 0:
+            return []
+        if top_n < n_items:
+            kth = n_items - top_n
+            threshold = scores[np.argpartition(scores, kth)[kth]]
+            # every candidate tied with the N-th score, so tie order matches a full sort
+            cand = np.flatnonzero(scores >= threshold)
+        else:
+            cand = np.arange(n_items)
+        order = np.lexsort((-rows[cand], -scores[cand]))[:top_n]
+        top = cand[order]
+        return list(zip(self.video_id_array[rows[top]].tolist(), scores[top].astype(float).tolist()))
+
+    def cold_start(self, user_id=None, top_n=10, exclude_seen=None, user_meta=None):
+        """Precomputed per-attribute top-N for a user without a row ([] without a metadata index)."""
+        index = getattr(self, "meta_index", None)
+        if index is None:
+            return []
+        from .metadata import user_tokens
+        tokens = user_tokens(user_meta) or index.user_tokens.get(user_id, [])
+        return index.cold_start(tokens, top_n=top_n, exclude_seen=exclude_seen)
+
+    # ---------- snapshots ----------
+    @contextmanager
+    def _quiesce(self):
+        # no structural change and no row write while held ("hogwild" writers take no lock,
+        # so a row copied mid-update may be torn there)
+        with self.lock:
+            with self._all_stripes(self._user_stripes), self._all_stripes(self._video_stripes):
+                yield
+
+    def snapshot(self, previous=None):
+        """
+        Read-only copy for readers: factor arrays, id maps and derived indices as of one
+        instant. previous (an older snapshot) lets unchanged id maps be shared instead of copied.
+        The metadata index is shared, not copied (it is rebuilt, never edited in place, by build()).
+        """
+        with self._quiesce():
+            P, Q = self.P.copy(), self.Q.copy()
+            n_updates, log_offset = self.n_updates, getattr(self, "log_offset", 0)
+            same_users = previous is not None and previous.n_users == self.n_users
+            same_videos = previous is not None and previous.n_videos == self.n_videos
+            user_map = previous.user_map if same_users else _copy_map(self.user_map)
+            idx2user = previous.idx2user if same_users else _copy_map(self.idx2user)
+            video_map = previous.video_map if same_videos else _copy_map(self.video_map)
+            idx2video = previous.idx2video if same_videos else _copy_map(self.idx2video)
+            ann_index = getattr(self, "ann_index", None)
+            if ann_index is not None:
+                ann_index = copy.copy(ann_index)
+                ann_index.assign = ann_index.assign.copy()
+                if ann_index.row_hash is not None:
+                    ann_index.row_hash, ann_index.moved = ann_index.row_hash.copy(), ann_index.moved.copy()
+            quant_mode = None if getattr(self, "q_quant", None) is None else self.q_quant.mode
+        snap = MatrixFactorization(k=self.k, lr=self.lr, reg=self.reg, seed=self.seed, concurrency=self.concurrency)
+        snap.user_map, snap.idx2user, snap.video_map, snap.idx2video = user_map, idx2user, video_map, idx2video
+        snap.P, snap.Q = P, Q
+        snap._P_buf.flags.writeable = snap._Q_buf.flags.writeable = False
+        if same_videos and getattr(previous, "_video_ids", None) is not None:
+            snap._video_ids = previous._video_ids
+        # quantized from the copy itself: the working copy refreshes its rows after the row locks
+        snap.q_quant = None if quant_mode is None else QuantizedMatrix.from_float(Q, quant_mode)
+        snap.ann_index = ann_index
+        snap.meta_index = getattr(self, "meta_index", None)
+        snap.videos_by_category = self.videos_by_category
+        snap.n_updates, snap.log_offset = n_updates, log_offset
+        snap.frozen = True
+        return snap
+
+    def _maybe_publish(self):
+        publisher = getattr(self, "publisher", None)
+        if publisher is not None:
+            publisher.maybe_publish()
+
+    # ---------- metadata ----------
+    def enable_metadata(self, video_meta=None, user_meta=None):
+        """
+        Attach a MetadataIndex (see metadata.py) built from {video_id: meta} / {user_id: meta}
+        catalog dicts. Call meta_index.build(model) again after training to refresh centroids.
+        """
+        from .metadata import MetadataIndex
+        index = MetadataIndex()
+        for vid, meta in (video_meta or {}).items():
+            index.set_video(vid, meta)
+        for uid, meta in (user_meta or {}).items():
+            index.set_user(uid, meta)
+        self.meta_index = index.build(self)
+        return self.meta_index
+
+    # ---------- approximate retrieval ----------
+    def enable_ann(self, n_lists=None, n_probe=8):
+        """Build an IVF index over Q (see ann.py); recommend then reranks its candidates."""
+        from .ann import IVFIndex
+        self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe, seed=self.seed).build(self.Q)
+        return self.ann_index
+
+    def disable_ann(self):
+        self.ann_index = None
+
+    # ---------- quantized scoring ----------
+    def quantize(self, mode=None, keep_master=True):
+        """
+        Score against a quantized copy of Q ("f16" / "int8", see quant.py; "none" drops it).
+        The float32 Q stays the training master and updates refresh the quantized rows.
+        keep_master=False releases the float32 Q for a model that only scores (API item cache):
+        build the metadata and ANN indices first, they read Q.
+        """
+        mode = check_mode(mode or MF_QUANT)
+        with self.lock:
+            if mode == "none":
+                self.q_quant = None
+                return None
+            self.q_quant = QuantizedMatrix.from_float(self.Q, mode)
+            if not keep_master:
+                self._Q_buf = None
+        return self.q_quant
+
+    @property
+    def item_nbytes(self) -> int:
+        """Bytes of the item factors held for scoring (float32 Q and/or its quantized copy)."""
+        quant = getattr(self, "q_quant", None)
+        return (0 if self._Q_buf is None else self.Q.nbytes) + (0 if quant is None else quant.nbytes)
+
     # ---------- pickling helpers ----------
     def __getstate__(self):
         """
@@ -87,23 +825,99 @@ class MatrixFactorization:
         Numpy arrays are picklable.
         """
         state = self.__dict__.copy()
-        if "lock" in state:
-            del state["lock"]
+        for key in ("lock", "_user_stripes", "_video_stripes", "_count_lock", "publisher"):
+            state.pop(key, None)
         # rng can be large; remove and re-create from seed
         if "rng" in state:
             del state["rng"]
+        # derived caches, rebuilt on demand (quantize again after loading)
+        for key in ("_video_ids", "q_quant"):
+            state.pop(key, None)
+        # only the live rows are pickled, not the spare capacity
+        del state["_P_buf"], state["_Q_buf"], state["n_users"], state["n_videos"]
+        state["P"] = self.P
+        state["Q"] = self.Q
         return state
 
     def __setstate__(self, state):
+        P, Q = state.pop("P"), state.pop("Q")
         self.__dict__.update(state)
+        self.P = P
+        self.Q = Q
         # recreate runtime-only attributes
-        self.lock = threading.Lock()
+        self.__dict__.setdefault("concurrency", MF_CONCURRENCY)
+        self.__dict__.setdefault("q_quant", None)
+        self.__dict__.setdefault("n_updates", 0)
+        self.__dict__.setdefault("log_offset", 0)
+        self.__dict__.setdefault("frozen", False)
+        self.publisher = None
+        self._init_locks()
         self.rng = np.random.default_rng(1)
         
         
 
+class SnapshotPublisher:
+    """
+    Double buffering for one working model. Writers update the working model in place;
+    readers take `current`, an immutable snapshot, and never lock. A new snapshot replaces
+    it (a single reference assignment) once `every` interactions were applied since the
+    last one, or `interval_s` after the last one when updates trickle in (start()).
+    For embedding a model that is trained and read in one process (see scripts/stress_mf.py);
+    the API reads item factors from model_cache, not from the global model.
+    """
+
+    def __init__(self, model: MatrixFactorization, every=MF_SNAPSHOT_EVERY, interval_s=MF_SNAPSHOT_INTERVAL_S):
+        self.model = model
+        self.every = every
+        self.interval_s = interval_s
+        self.lock = threading.Lock()
+        self.thread = None
+        self.current = model.snapshot()
+        self.published_at = time.monotonic()
+        model.publisher = self
+
+    def publish(self, blocking=True):
+        """Snapshot the working model and swap it in. Returns the snapshot now current."""
+        if not self.lock.acquire(blocking=blocking):
+            return self.current   # another thread is publishing
+        try:
+            with timed("snapshot"):
+                snap = self.model.snapshot(previous=self.current)
+            self.current = snap
+            self.published_at = time.monotonic()
+            return snap
+        finally:
+            self.lock.release()
+
+    def pending(self) -> int:
+        return self.model.n_updates - self.current.n_updates
+
+    def maybe_publish(self):
+        # called by writers after every update; only an integer comparison when nothing is due
+        if self.pending() >= self.every:
+            self.publish(blocking=False)
+
+    def start(self):
+        """Publish leftover updates every interval_s from a daemon thread."""
+        if self.thread is not None or self.interval_s <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.interval_s)
+                if self.pending() > 0 and time.monotonic() - self.published_at >= self.interval_s:
+                    self.publish(blocking=False)
+
+        self.thread = threading.Thread(target=run, name="mf-snapshot", daemon=True)
+        self.thread.start()
+
+
 # Module-level singleton
 _model: MatrixFactorization | None = None
+_log = None
+# log append + apply happen together, so log order is apply order and log_offset only grows
+_apply_lock = threading.Lock()
+_checkpoint_thread: threading.Thread | None = None
 
 def init_model(k=20, lr=0.5, reg=0.02, seed=1, load_path: str | None = None):
     """Initialize the global model (create or load from disk)."""
@@ -112,31 +926,149 @@ def init_model(k=20, lr=0.5, reg=0.02, seed=1, load_path: str | None = None):
         return _model
     if load_path is None:
         load_path = MODEL_PATH
+        if not os.path.exists(load_path) and os.path.exists(LEGACY_MODEL_PATH):
+            load_path = LEGACY_MODEL_PATH
     # try load
     if os.path.exists(load_path):
-        with open(load_path, "rb") as f:
-            _model = pickle.load(f)
-            return _model
-    # else create new
-    _model = MatrixFactorization(k=k, lr=lr, reg=reg, seed=seed)
+        from .ann import attach_from_env
+        _model = attach_from_env(load_model_file(load_path))
+    else:
+        # else create new
+        _model = MatrixFactorization(k=k, lr=lr, reg=reg, seed=seed)
+    # interactions logged after the checkpoint; raises if another process owns the log
+    replay_log(_model)
     return _model
 
+def get_log():
+    """The interaction log of the global model, or None if MF_LOG_DIR is empty."""
+    global _log
+    if _log is None and MF_LOG_DIR:
+        from .interaction_log import InteractionLog
+        _log = InteractionLog(MF_LOG_DIR)
+    return _log or None
+
+def replay_log(model: MatrixFactorization, log=None, batch_records: int | None = None) -> int:
+    """
+    Apply the logged interactions after model.log_offset, then open the log for appending.
+    Returns the number of interactions replayed.
+
+    Every frame was one update_batch call. Consecutive frames that touch disjoint users and
+    videos are merged into one batch of up to batch_records (the SGD step of a row only
+    depends on the pairs of its batch, so the result is the same); a frame that shares a
+    row with the pending batch starts a new one.
+    """
+    log = log or get_log()
+    if log is None:
+        return 0
+    batch_records = batch_records or MF_REPLAY_BATCH
+    n = 0
+
+    def apply(frames, end):
+        records = frames[0] if len(frames) == 1 else np.concatenate(frames)
+        model.update_batch(records["user_id"], records["video_id"], records["score"], log_offset=end)
+        return len(records)
+
+    with timed("replay"):
+        frames, users, videos, end = [], set(), set(), model.log_offset
+        pending = 0
+        for records, frame_end in log.read(model.log_offset):
+            frame_users, frame_videos = set(records["user_id"].tolist()), set(records["video_id"].tolist())
+            if frames and (pending + len(records) > batch_records
+                           or not users.isdisjoint(frame_users) or not videos.isdisjoint(frame_videos)):
+                n += apply(frames, end)
+                frames, users, videos, pending = [], set(), set(), 0
+            frames.append(records)
+            users |= frame_users
+            videos |= frame_videos
+            pending += len(records)
+            end = frame_end
+        if frames:
+            n += apply(frames, end)
+    # a checkpoint newer than the log (or an empty log) still moves the offset forward
+    model.log_offset = log.open(model.log_offset)
+    return n
+
+def apply_interactions(user_ids, video_ids, scores, user_meta=None, video_meta=None):
+    """
+    Durable update of the global model: the interactions are logged, then applied as one
+    batch. user_meta / video_meta ({id: meta}) only warm-start new rows and are not logged.
+    """
+    model = get_model()
+    for uid, meta in (user_meta or {}).items():
+        model.record_meta(uid, None, user_meta=meta)
+    for vid, meta in (video_meta or {}).items():
+        model.record_meta(None, vid, video_meta=meta)
+    log = get_log()
+    if log is None:
+        model.update_batch(user_ids, video_ids, scores)
+        return
+    with _apply_lock:
+        end = log.append(user_ids, video_ids, scores)
+        model.update_batch(user_ids, video_ids, scores, log_offset=end)
+
+def start_checkpoints(interval_s: float = MF_CHECKPOINT_S):
+    """Checkpoint (save_model) from a daemon thread every interval_s if the log moved."""
+    global _checkpoint_thread
+    if _checkpoint_thread is not None or interval_s <= 0 or get_log() is None:
+        return
+
+    def run():
+        import logging
+        saved = get_model().log_offset
+        while True:
+            time.sleep(interval_s)
+            try:
+                if get_model().log_offset != saved:
+                    saved = save_model()
+            except Exception:
+                logging.getLogger(__name__).exception("checkpoint failed")
+
+    _checkpoint_thread = threading.Thread(target=run, name="mf-checkpoint", daemon=True)
+    _checkpoint_thread.start()
+
+def load_model_file(path: str) -> MatrixFactorization:
+    """Load a model file in either format (binary files are memory-mapped)."""
+    from . import model_io
+    if model_io.is_binary_model(path):
+        return model_io.load(path, mmap=True)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
 def get_model() -> MatrixFactorization:
+    """The working model (local ingest, checkpoints); the API serves from model_cache."""
     if _model is None:
         # fall back: initialize with defaults if not initialized externally
         return init_model()
     return _model
 
-def save_model(path: str | None = None):
+def save_model(path: str | None = None) -> int | None:
+    """
+    Checkpoint the global model. Returns the interaction log offset the file covers;
+    log segments before it are deleted.
+    """
     global _model
     if _model is None:
-        return
+        return None
     if path is None:
         path = MODEL_PATH
-    tmp = path + ".tmp"
-    with open(tmp, "wb") as f:
-        pickle.dump(_model, f)
-    os.replace(tmp, path)
+    if MODEL_FORMAT == "bin":
+        from . import model_io
+        # a fresh snapshot is consistent, and writers only wait for the copy, not the write
+        snap = _model.snapshot()
+        with timed("save"):
+            model_io.save(snap, path)
+        covered = snap.log_offset
+    else:
+        tmp = path + ".tmp"
+        # pickling reads the live model: hold logged writers off so rows and offset agree
+        with _apply_lock, open(tmp, "wb") as f:
+            pickle.dump(_model, f)
+            covered = _model.log_offset
+        os.replace(tmp, path)
+    log = get_log()
+    if log is not None:
+        log.truncate_before(covered)
+    return covered
 
 
 if __name__ == "__main__":
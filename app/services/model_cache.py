@@ -0,0 +1,107 @@
+# app/services/model_cache.py
+"""
+In-process, versioned cache of the decoded model for the API.
+
+Writers bump a version counter in Redis on every save (redis_rows.VERSION_KEY).
+Requests are served from the cached copy; the version is re-checked at most once
+per MF_CACHE_MAX_STALENESS_MS and the model is only reloaded when it changed.
+
+With MF_SHARED_DIR set the item matrix is not decoded per process: the version comes
+from the shared generation header and the model is a read-only map of the generation
+one updater process published (see shared_model).
+"""
+import os
+import time
+import threading
+from typing import Callable, Optional, Tuple
+from app.services.mf import MatrixFactorization
+from app.services.redis import redis_meta, redis_rows
+from app.services.ann import attach_from_env
+from app.services.quant import MF_QUANT
+from app.services.shared_model import shared_store
+from app.services.metrics import timed, observe_model
+
+MF_CACHE_MAX_STALENESS_MS = float(os.environ.get("MF_CACHE_MAX_STALENESS_MS", 1000))
+
+class VersionedModelCache:
+    def __init__(self, loader: Callable[[], Optional[MatrixFactorization]], version_fn: Callable[[], int],
+                 max_staleness_ms: float = MF_CACHE_MAX_STALENESS_MS):
+        self.loader = loader
+        self.version_fn = version_fn
+        self.max_staleness_ms = max_staleness_ms
+        self.model: Optional[MatrixFactorization] = None
+        self.version: Optional[int] = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self) -> Tuple[Optional[MatrixFactorization], Optional[int]]:
+        """Returns (model, version), refreshing it if the staleness bound has passed and the version moved."""
+        now = time.monotonic()
+        if self.model is not None and (now - self.checked_at) * 1000.0 < self.max_staleness_ms:
+            return self.model, self.version
+        # only one thread refreshes; the others keep serving the current copy
+        if not self.lock.acquire(blocking=self.model is None):
+            return self.model, self.version
+        try:
+            if self.model is not None and (time.monotonic() - self.checked_at) * 1000.0 < self.max_staleness_ms:
+                return self.model, self.version
+            with timed("version_check"):
+                version = self.version_fn()
+            if self.model is None or version != self.version:
+                with timed("cache_refresh"):
+                    model = self.loader()
+                self.model, self.version = model, version
+                observe_model(model)
+            self.checked_at = time.monotonic()
+            return self.model, self.version
+        finally:
+            self.lock.release()
+
+    def invalidate(self):
+        with self.lock:
+            self.model = None
+            self.version = None
+
+
+def _load_item_model() -> Optional[MatrixFactorization]:
+    model = redis_rows.load_model(user_ids=[])
+    if model is None:
+        return None
+    # centroids + per-attribute top-N for cold starts, kept until the catalog changes (redis_meta.refresh_index)
+    previous = item_cache.model
+    with timed("meta_index"):
+        model.meta_index = redis_meta.refresh_index(model, getattr(previous, "meta_index", None))
+    # the ANN lists of the copy being replaced are re-used for the items that did not change
+    with timed("ann_index"):
+        if previous is not None and previous.ann_index is not None:
+            model = attach_from_env(model, previous.ann_index, previous.video_id_array)
+        else:
+            model = attach_from_env(model)
+    if MF_QUANT != "none":
+        # the API never trains its item copy: score from the quantized rows only
+        with timed("quantize"):
+            model.quantize(MF_QUANT, keep_master=False)
+    return model
+
+
+def _shared_version() -> int:
+    head = shared_store.current()
+    # nothing published yet: fall back to the row store until the updater catches up
+    return redis_rows.get_version() if head is None else head[1]
+
+
+def _load_shared_item_model() -> Optional[MatrixFactorization]:
+    model = shared_store.attach()
+    if model is None:
+        return _load_item_model()
+    # the ANN index and quantized Q come with the generation; only the metadata index is per process
+    with timed("meta_index"):
+        model.meta_index = redis_meta.refresh_index(model, getattr(item_cache.model, "meta_index", None))
+    return model
+
+
+# The API only caches the item side; user rows are a single HGET per request.
+item_cache = VersionedModelCache(
+    loader=_load_shared_item_model if shared_store else _load_item_model,
+    version_fn=_shared_version if shared_store else redis_rows.get_version,
+)
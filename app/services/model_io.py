@@ -0,0 +1,179 @@
+# app/services/model_io.py
+"""
+Binary model format (no pickle).
+
+Layout, all little-endian:
+
+    header (HEADER_SIZE bytes)
+        magic        8s   b"MFBIN\\x00\\x00\\x00"
+        version      u32
+        k            u32
+        lr, reg      f64, f64
+        seed         i64
+        n_users      u64
+        n_videos     u64
+        user_ids_off, video_ids_off, P_off, Q_off   u64 each (byte offsets)
+        q_format     u32   (version >= 2) 0 float32, 1 float16, 2 int8 + per-row scale
+        scale_off    u64   (version >= 2) byte offset of the int8 scales, 0 otherwise
+        log_offset   u64   (version >= 2) interaction log offset the model covers (see interaction_log)
+    user_ids   int64[n_users]
+    video_ids  int64[n_videos]
+    P          float32[n_users, k]
+    Q          float32 / float16 / int8 [n_videos, k]
+    scale      float32[n_videos]              (int8 only)
+
+Every block starts on a BLOCK_ALIGN boundary so the file can be opened with
+np.memmap and the arrays used in place. The same bytes are used as the Redis payload.
+
+A quantized Q (quant.py, MF_SNAPSHOT_QUANT) is turned back into a float32 master on
+load, or kept as is with serving=True for a model that only scores.
+"""
+import os
+import struct
+import numpy as np
+from app.services.mf import MatrixFactorization, RowIdArray
+from app.services.quant import MF_SNAPSHOT_QUANT, QuantizedMatrix, check_mode
+
+MAGIC = b"MFBIN\x00\x00\x00"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<8sIIddqQQQQQQ")
+_HEADER_V2 = struct.Struct("<IQQ")   # follows _HEADER
+HEADER_SIZE = 128
+BLOCK_ALIGN = 64
+
+ID_DTYPE = np.dtype("<i8")
+FACTOR_DTYPE = np.dtype("<f4")
+SCALE_DTYPE = np.dtype("<f4")
+Q_FORMATS = {"none": 0, "f16": 1, "int8": 2}
+Q_DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2"), 2: np.dtype("i1")}
+
+
+def _align(offset: int) -> int:
+    return (offset + BLOCK_ALIGN - 1) // BLOCK_ALIGN * BLOCK_ALIGN
+
+
+def _layout(n_users: int, n_videos: int, k: int, q_format: int = 0):
+    """Byte offsets of each block and the total size."""
+    user_ids_off = HEADER_SIZE
+    video_ids_off = _align(user_ids_off + n_users * ID_DTYPE.itemsize)
+    p_off = _align(video_ids_off + n_videos * ID_DTYPE.itemsize)
+    q_off = _align(p_off + n_users * k * FACTOR_DTYPE.itemsize)
+    total = q_off + n_videos * k * Q_DTYPES[q_format].itemsize
+    scale_off = 0
+    if q_format == Q_FORMATS["int8"]:
+        scale_off = _align(total)
+        total = scale_off + n_videos * SCALE_DTYPE.itemsize
+    return user_ids_off, video_ids_off, p_off, q_off, scale_off, total
+
+
+def is_binary_model(data) -> bool:
+    """True if data (bytes or a file path) holds the binary format."""
+    if isinstance(data, (str, os.PathLike)):
+        with open(data, "rb") as f:
+            data = f.read(len(MAGIC))
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def _id_array(idx_map, n: int) -> np.ndarray:
+    if isinstance(idx_map, RowIdArray):
+        return idx_map.ids[:n].astype(ID_DTYPE, copy=False)
+    return np.fromiter((idx_map[i] for i in range(n)), dtype=ID_DTYPE, count=n)
+
+
+def dumps(model: MatrixFactorization, quant: str | None = None) -> bytes:
+    """Encode a model; quant ("none" / "f16" / "int8", default MF_SNAPSHOT_QUANT) is the format of Q."""
+    q_format = Q_FORMATS[check_mode(quant or MF_SNAPSHOT_QUANT)]
+    k = model.k
+    n_users, n_videos = model.n_users, model.n_videos
+    user_ids_off, video_ids_off, p_off, q_off, scale_off, total = _layout(n_users, n_videos, k, q_format)
+    buf = bytearray(total)
+    _HEADER.pack_into(buf, 0, MAGIC, FORMAT_VERSION, k, float(model.lr), float(model.reg), int(model.seed),
+                      n_users, n_videos, user_ids_off, video_ids_off, p_off, q_off)
+    _HEADER_V2.pack_into(buf, _HEADER.size, q_format, scale_off, int(getattr(model, "log_offset", 0)))
+    user_ids = _id_array(model.idx2user, n_users)
+    video_ids = _id_array(model.idx2video, n_videos)
+    buf[user_ids_off:user_ids_off + user_ids.nbytes] = user_ids.tobytes()
+    buf[video_ids_off:video_ids_off + video_ids.nbytes] = video_ids.tobytes()
+    buf[p_off:p_off + n_users * k * 4] = np.ascontiguousarray(model.P, dtype=FACTOR_DTYPE).tobytes()
+    # a scoring-only model has no float32 Q left, only its quantized copy
+    Q = model.q_quant.dequantize() if model._Q_buf is None else model.Q
+    if q_format == Q_FORMATS["none"]:
+        buf[q_off:q_off + Q.nbytes] = np.ascontiguousarray(Q, dtype=FACTOR_DTYPE).tobytes()
+    else:
+        qm = QuantizedMatrix.from_float(Q, "f16" if q_format == Q_FORMATS["f16"] else "int8")
+        data = np.ascontiguousarray(qm.data, dtype=Q_DTYPES[q_format]).tobytes()
+        buf[q_off:q_off + len(data)] = data
+        if qm.scale is not None:
+            buf[scale_off:scale_off + qm.scale.nbytes] = qm.scale.astype(SCALE_DTYPE).tobytes()
+    return bytes(buf)
+
+
+def read_header(data) -> dict:
+    magic, version, k, lr, reg, seed, n_users, n_videos, user_ids_off, video_ids_off, p_off, q_off = \
+        _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a binary MF model")
+    if version not in (1, FORMAT_VERSION):
+        raise ValueError(f"unsupported MF model format version {version}")
+    # version 1 files have a float32 Q and nothing after the offsets
+    q_format, scale_off, log_offset = _HEADER_V2.unpack_from(data, _HEADER.size) if version >= 2 else (0, 0, 0)
+    if q_format not in Q_DTYPES:
+        raise ValueError(f"unsupported Q format {q_format}")
+    return {"k": k, "lr": lr, "reg": reg, "seed": seed, "n_users": n_users, "n_videos": n_videos,
+            "user_ids_off": user_ids_off, "video_ids_off": video_ids_off, "P_off": p_off, "Q_off": q_off,
+            "q_format": q_format, "scale_off": scale_off, "log_offset": log_offset}
+
+
+def _from_buffer(buf, header: dict, serving: bool = False, frozen: bool = False) -> MatrixFactorization:
+    k, n_users, n_videos = header["k"], header["n_users"], header["n_videos"]
+    user_ids = np.frombuffer(buf, dtype=ID_DTYPE, count=n_users, offset=header["user_ids_off"])
+    video_ids = np.frombuffer(buf, dtype=ID_DTYPE, count=n_videos, offset=header["video_ids_off"])
+    P = np.frombuffer(buf, dtype=FACTOR_DTYPE, count=n_users * k, offset=header["P_off"]).reshape(n_users, k)
+    q_format = header["q_format"]
+    Q = np.frombuffer(buf, dtype=Q_DTYPES[q_format], count=n_videos * k, offset=header["Q_off"]).reshape(n_videos, k)
+    if q_format != Q_FORMATS["none"]:
+        scale = None
+        if q_format == Q_FORMATS["int8"]:
+            scale = np.frombuffer(buf, dtype=SCALE_DTYPE, count=n_videos, offset=header["scale_off"])
+        Q = QuantizedMatrix("f16" if q_format == Q_FORMATS["f16"] else "int8", Q, scale)
+        if not serving:
+            # training needs a float32 master; it starts from the quantized values
+            Q = Q.dequantize()
+    # id maps stay views of the id arrays (IdArrayMap); a writable model makes dicts on its first new id
+    model = MatrixFactorization.from_arrays(user_ids, P, video_ids, Q, k=k, lr=header["lr"], reg=header["reg"],
+                                            seed=header["seed"], frozen=frozen)
+    model.log_offset = header["log_offset"]
+    return model
+
+
+def loads(data: bytes, copy: bool = True, serving: bool = False) -> MatrixFactorization:
+    """
+    Decode a model from bytes. With copy=False the factor arrays point into data
+    (read-only if data is immutable bytes). With serving=True a quantized Q is kept
+    quantized (the model scores with it and cannot be trained).
+    """
+    header = read_header(data)
+    buf = bytearray(data) if copy else data
+    return _from_buffer(buf, header, serving)
+
+
+def save(model: MatrixFactorization, path: str, quant: str | None = None):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(dumps(model, quant))
+    os.replace(tmp, path)
+
+
+def load(path: str, mmap: bool = True, serving: bool = False, readonly: bool = False) -> MatrixFactorization:
+    """
+    Open a binary model file. With mmap=True the factors are a copy-on-write memory map:
+    startup does not read the matrices, pages are shared between processes until a
+    process writes to a row. readonly=True maps the file read-only instead and returns a
+    frozen model (MatrixFactorization.from_arrays): the id arrays are used in place too,
+    so nothing proportional to the model size is copied. serving: see loads.
+    """
+    if not mmap:
+        with open(path, "rb") as f:
+            return loads(f.read(), copy=True, serving=serving)
+    mm = np.memmap(path, dtype=np.uint8, mode="r" if readonly else "c")
+    return _from_buffer(mm, read_header(mm), serving, frozen=readonly)
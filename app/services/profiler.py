@@ -0,0 +1,119 @@
+# app/services/profiler.py
+"""
+Sampling profiler for API endpoints, enabled with MF_PROFILE=1.
+
+A background thread samples the Python stack of every thread currently running an
+endpoint (registered by app/routers/instrumented.py) every MF_PROFILE_INTERVAL_MS and
+counts collapsed stacks per endpoint. Every MF_PROFILE_DUMP_S seconds, and at exit, the
+counts are written to MF_PROFILE_DIR/<endpoint>.folded in the "folded stacks" format
+read by flamegraph.pl and speedscope.
+
+Async endpoints share the event loop thread, so samples are attributed per task: each
+thread keeps a registry task -> endpoint (task None for sync endpoints in the threadpool)
+and a sample of the loop thread goes to the endpoint of the task running at that moment.
+Samples taken while the loop runs no registered task (idle, other callbacks) are dropped.
+"""
+import asyncio
+import atexit
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+MF_PROFILE = os.environ.get("MF_PROFILE", "0") == "1"
+MF_PROFILE_INTERVAL_MS = float(os.environ.get("MF_PROFILE_INTERVAL_MS", 5))
+MF_PROFILE_DUMP_S = float(os.environ.get("MF_PROFILE_DUMP_S", 30))
+MF_PROFILE_DIR = os.environ.get("MF_PROFILE_DIR", "profiles")
+
+# endpoint of the current task (or threadpool call); restored on exit for nested endpoints
+_endpoint = contextvars.ContextVar("mf_profile_endpoint", default=None)
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms=MF_PROFILE_INTERVAL_MS, dump_s=MF_PROFILE_DUMP_S, out_dir=MF_PROFILE_DIR):
+        self.interval = interval_ms / 1000.0
+        self.dump_s = dump_s
+        self.out_dir = out_dir
+        self.active = {}     # thread id -> {task (None for sync) -> endpoint name}
+        self.loops = {}      # thread id -> event loop running on it
+        self.stacks = defaultdict(Counter)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="mf-profiler", daemon=True)
+        self.thread.start()
+        atexit.register(self.dump)
+
+    def _key(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        self.loops[threading.get_ident()] = loop
+        return asyncio.current_task(loop)
+
+    def enter(self, endpoint: str):
+        token = _endpoint.set(endpoint)
+        self.active.setdefault(threading.get_ident(), {})[self._key()] = endpoint
+        return token
+
+    def exit(self, token):
+        _endpoint.reset(token)
+        running = self.active.get(threading.get_ident(), {})
+        outer = _endpoint.get()
+        if outer is None:
+            running.pop(self._key(), None)
+        else:
+            running[self._key()] = outer
+
+    def _current(self, tid, running):
+        loop = self.loops.get(tid)
+        if loop is None:
+            return running.get(None)
+        # the task the loop is running right now (None between tasks)
+        task = asyncio.current_task(loop)
+        return running.get(task) if task is not None else None
+
+    def _run(self):
+        last_dump = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for tid, running in list(self.active.items()):
+                    frame = frames.get(tid)
+                    endpoint = self._current(tid, running) if running else None
+                    if frame is not None and endpoint is not None:
+                        self.stacks[endpoint][_collapse(frame)] += 1
+            if time.monotonic() - last_dump >= self.dump_s:
+                self.dump()
+                last_dump = time.monotonic()
+
+    def dump(self):
+        with self.lock:
+            snapshot = {endpoint: dict(stacks) for endpoint, stacks in self.stacks.items()}
+        if not snapshot:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        for endpoint, stacks in snapshot.items():
+            name = endpoint.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+            with open(os.path.join(self.out_dir, name + ".folded"), "w") as f:
+                for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                    f.write(f"{stack} {count}\n")
+
+
+profiler = SamplingProfiler()
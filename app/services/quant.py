@@ -0,0 +1,151 @@
+# app/services/quant.py
+"""
+Quantized item factors for scoring, transport and snapshots.
+
+    "f16"   float16 rows (2 bytes per value)
+    "int8"  int8 rows with one float32 scale per row: q = round(x / s), s = max|x| / 127
+            (k + 4 bytes per row, 3.6x smaller than float32 at k=32)
+
+Training keeps full-precision rows (MatrixFactorization.Q, the Redis row store); a
+QuantizedMatrix is derived from them. NumPy has no fast float16 arithmetic, so f16 is
+meant for storage and transport: scoring from it is several times slower than from
+float32. int8 rows are converted block by block while scoring, at about float32 speed
+with a quarter of the memory.
+
+    MF_QUANT            serving matrix of the API item cache (see model_cache)
+    MF_SNAPSHOT_QUANT   Q in model_io snapshots and the Redis model blob
+"""
+import os
+import numpy as np
+
+QUANT_MODES = ("none", "f16", "int8")
+MF_QUANT = os.environ.get("MF_QUANT", "none")
+MF_SNAPSHOT_QUANT = os.environ.get("MF_SNAPSHOT_QUANT", "none")
+
+# rows converted to float32 at a time while scoring (8192 x k floats stay in cache)
+_BLOCK = 8192
+GROWTH_FACTOR = 1.5
+
+
+def check_mode(mode: str) -> str:
+    if mode not in QUANT_MODES:
+        raise ValueError(f"unknown quantization {mode!r}, expected one of {QUANT_MODES}")
+    return mode
+
+
+def quantize_int8(X):
+    """Per-row symmetric int8: returns (int8 rows, float32 scales). All-zero rows get scale 1."""
+    X = np.asarray(X, dtype=np.float32)
+    scale = np.abs(X).max(axis=1) / 127.0 if X.size else np.zeros(X.shape[0], dtype=np.float32)
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    data = np.rint(X / scale[:, None]).clip(-127, 127).astype(np.int8)
+    return data, scale
+
+
+class QuantizedMatrix:
+    """
+    Read-mostly quantized copy of a float32 matrix. Rows can be rewritten (set_rows)
+    and appended (append, amortized O(1) like the MatrixFactorization buffers).
+    """
+
+    def __init__(self, mode, data, scale=None):
+        self.mode = check_mode(mode)
+        self._data = data
+        self._scale = scale
+        self.n = data.shape[0]
+
+    @classmethod
+    def from_float(cls, X, mode):
+        X = np.asarray(X, dtype=np.float32)
+        if mode == "f16":
+            return cls(mode, X.astype(np.float16))
+        if mode == "int8":
+            return cls(mode, *quantize_int8(X))
+        raise ValueError(f"cannot quantize to {mode!r}")
+
+    @property
+    def data(self):
+        return self._data[:self.n]
+
+    @property
+    def scale(self):
+        return None if self._scale is None else self._scale[:self.n]
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (0 if self._scale is None else self.scale.nbytes)
+
+    def __len__(self):
+        return self.n
+
+    # ---------- reads ----------
+    def dequantize(self, rows=None) -> np.ndarray:
+        data = self.data if rows is None else self.data[rows]
+        out = data.astype(np.float32)
+        if self._scale is not None:
+            out *= (self.scale if rows is None else self.scale[rows])[:, None]
+        return out
+
+    def dot(self, vec) -> np.ndarray:
+        """data @ vec as float32, converting _BLOCK rows at a time."""
+        vec = np.asarray(vec, dtype=np.float32)
+        data = self.data
+        out = np.empty(self.n, dtype=np.float32)
+        buf = np.empty((min(_BLOCK, self.n), data.shape[1]), dtype=np.float32)
+        for start in range(0, self.n, _BLOCK):
+            block = data[start:start + _BLOCK]
+            m = block.shape[0]
+            np.copyto(buf[:m], block, casting="unsafe")
+            np.dot(buf[:m], vec, out=out[start:start + m])
+        if self._scale is not None:
+            out *= self.scale
+        return out
+
+    def dot_many(self, U) -> np.ndarray:
+        """U @ data.T as float32 (one row of scores per row of U), converting _BLOCK rows at a time."""
+        U = np.asarray(U, dtype=np.float32)
+        data = self.data
+        out = np.empty((U.shape[0], self.n), dtype=np.float32)
+        buf = np.empty((min(_BLOCK, self.n), data.shape[1]), dtype=np.float32)
+        for start in range(0, self.n, _BLOCK):
+            block = data[start:start + _BLOCK]
+            m = block.shape[0]
+            np.copyto(buf[:m], block, casting="unsafe")
+            out[:, start:start + m] = U @ buf[:m].T
+        if self._scale is not None:
+            out *= self.scale
+        return out
+
+    def dot_rows(self, rows, vec) -> np.ndarray:
+        """Scores of a subset of rows (ANN candidates)."""
+        out = self.data[rows].astype(np.float32).dot(np.asarray(vec, dtype=np.float32))
+        if self._scale is not None:
+            out *= self.scale[rows]
+        return out
+
+    # ---------- writes ----------
+    def set_rows(self, rows, X):
+        X = np.asarray(X, dtype=np.float32)
+        if self.mode == "f16":
+            self._data[rows] = X
+        else:
+            self._data[rows], self._scale[rows] = quantize_int8(X)
+
+    def append(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        need = self.n + X.shape[0]
+        if need > self._data.shape[0]:
+            capacity = max(need, int(self._data.shape[0] * GROWTH_FACTOR))
+            data = np.empty((capacity, self._data.shape[1]), dtype=self._data.dtype)
+            data[:self.n] = self.data
+            self._data = data
+            if self._scale is not None:
+                scale = np.empty(capacity, dtype=np.float32)
+                scale[:self.n] = self.scale
+                self._scale = scale
+        start, self.n = self.n, need
+        self.set_rows(slice(start, need), X)
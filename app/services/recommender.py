@@ -82,5 +82,5 @@ for u in users:
     seen[u] = set([v for (uu, v, _) in interactions if uu == u])
 
 for u in users:
-    recs = model.recommend(u, top_n=3, exclude=seen.get(u, set()))
+    recs = model.recommend(u, top_n=3, exclude_seen=seen.get(u, set()))
     print(f"User {u}: {recs}")
\ No newline at end of file
@@ -0,0 +1,45 @@
+# app/services/redis/batch_worker.py
+"""
+Micro-batching interaction worker.
+
+Drains up to MF_BATCH_MAX interactions (or whatever arrives within MF_BATCH_WAIT_MS)
+from the Redis buffer and applies them with one load/save of the touched rows.
+Run with:  python -m app.services.redis.batch_worker
+and start the API with INTERACTION_TRANSPORT=batch.
+With MF_USER_SHARDS > 1 run one worker per shard with MF_WORKER_SHARD=<s>
+(unset: the worker takes batches from any shard).
+"""
+import os
+import signal
+import sys
+import logging
+from app.services.redis.redis_queue import drain_interactions
+from app.services.redis.tasks import process_interaction_batch
+from app.services.metrics import timed
+
+MF_BATCH_MAX = int(os.environ.get("MF_BATCH_MAX", 1000))
+MF_BATCH_WAIT_MS = int(os.environ.get("MF_BATCH_WAIT_MS", 50))
+MF_WORKER_SHARD = int(os.environ["MF_WORKER_SHARD"]) if os.environ.get("MF_WORKER_SHARD") else None
+
+logger = logging.getLogger(__name__)
+
+def run_once(max_items: int = MF_BATCH_MAX, max_wait_ms: int = MF_BATCH_WAIT_MS, shard: int | None = MF_WORKER_SHARD) -> int:
+    with timed("drain"):
+        batch = drain_interactions(max_items=max_items, max_wait_ms=max_wait_ms, shard=shard)
+    if not batch:
+        return 0
+    return process_interaction_batch(batch)["applied"]
+
+def run(max_items: int = MF_BATCH_MAX, max_wait_ms: int = MF_BATCH_WAIT_MS, shard: int | None = MF_WORKER_SHARD):
+    logger.info("batch worker started (max_items=%d, max_wait_ms=%d, shard=%s)", max_items, max_wait_ms, shard)
+    while True:
+        applied = run_once(max_items, max_wait_ms, shard)
+        if applied:
+            logger.debug("applied %d interactions", applied)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # exit normally on SIGTERM, so atexit pushes the spooled metrics (metrics.flush)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    run()
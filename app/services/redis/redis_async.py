@@ -0,0 +1,11 @@
+# app/services/redis/redis_async.py
+import os
+import redis.asyncio as aioredis
+from app.services.redis.redis_client import REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD
+
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 64))
+
+# pooled asyncio client for the async API (app/main_async.py); binary responses like redis_conn
+async_pool = aioredis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                                     max_connections=REDIS_MAX_CONNECTIONS)
+redis_async_conn = aioredis.Redis(connection_pool=async_pool)
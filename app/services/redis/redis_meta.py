@@ -0,0 +1,200 @@
+# app/services/redis/redis_meta.py
+"""
+Catalog metadata and attribute centroids in Redis (see app/services/metadata.py).
+
+    mf_meta_v1:video       video_id -> JSON list of tokens ("categoria:battle", ...)
+    mf_meta_v1:user        user_id  -> JSON list of tokens
+    mf_meta_v1:centroids   token    -> raw little-endian float32 row
+    mf_meta_v1:version     bumped whenever the tokens of a video change
+
+Each API process keeps its MetadataIndex across item refreshes and rebuilds it when the
+catalog version moves, or every MF_META_REBUILD_S as Q drifts (refresh_index). The
+centroids are published from one place: the shared-model updater (MF_SHARED_DIR), or
+this module's CLI. Workers read them (cached for MF_META_CENTROID_TTL_S) to warm-start
+rows of ids they register for the first time.
+
+Load a catalog and publish the centroids with:
+    python -m app.services.redis.redis_meta --videos data/videos.csv --users data/usuarios.csv --publish
+Without a shared-model updater, keep them current with --publish-every <seconds>.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+import numpy as np
+from typing import Optional
+from app.services.redis.redis_client import redis_conn
+from app.services.metadata import MetadataIndex, user_tokens, video_tokens
+
+META_PREFIX = "mf_meta_v1"
+VIDEO_META_KEY = META_PREFIX + ":video"
+USER_META_KEY = META_PREFIX + ":user"
+CENTROIDS_KEY = META_PREFIX + ":centroids"
+META_VERSION_KEY = META_PREFIX + ":version"
+
+MF_META_CENTROID_TTL_S = float(os.environ.get("MF_META_CENTROID_TTL_S", 60))
+MF_META_REBUILD_S = float(os.environ.get("MF_META_REBUILD_S", 300))
+
+ROW_DTYPE = np.dtype("<f4")
+
+_centroid_cache = {"at": 0.0, "centroids": {}}
+
+
+def store_videos(metas: dict, pipe=None):
+    """
+    metas: {video_id: catalog dict}. Ids without any known field are skipped. Only videos
+    whose tokens changed are written, and then the catalog version is bumped.
+    """
+    mapping = _mapping({vid: video_tokens(m) for vid, m in metas.items()})
+    if not mapping:
+        return
+    current = redis_conn.hmget(VIDEO_META_KEY, list(mapping))
+    changed = {i: toks for (i, toks), cur in zip(mapping.items(), current) if cur is None or cur.decode() != toks}
+    if not changed:
+        return
+    target = pipe or redis_conn.pipeline(transaction=False)
+    target.hset(VIDEO_META_KEY, mapping=changed)
+    target.incr(META_VERSION_KEY)
+    if pipe is None:
+        target.execute()
+
+
+def store_users(metas: dict, pipe=None):
+    mapping = _mapping({uid: user_tokens(m) for uid, m in metas.items()})
+    if mapping:
+        (pipe or redis_conn).hset(USER_META_KEY, mapping=mapping)
+
+
+def _mapping(tokens_by_id) -> dict:
+    return {str(int(i)): json.dumps(toks) for i, toks in tokens_by_id.items() if toks}
+
+
+def get_meta_version() -> int:
+    return int(redis_conn.get(META_VERSION_KEY) or 0)
+
+
+def load_user_tokens(user_id) -> list:
+    raw = redis_conn.hget(USER_META_KEY, str(int(user_id)))
+    return [] if raw is None else json.loads(raw)
+
+
+def _tokens_for(key, ids) -> dict:
+    if not ids:
+        return {}
+    raws = redis_conn.hmget(key, [str(int(i)) for i in ids])
+    return {int(i): json.loads(r) for i, r in zip(ids, raws) if r is not None}
+
+
+def build_index(model) -> MetadataIndex:
+    """Index over the stored video metadata for the given (item) model."""
+    index = MetadataIndex()
+    # read before the catalog: a change racing with the HGETALL triggers another rebuild
+    index.meta_version = get_meta_version()
+    for vid, raw in redis_conn.hgetall(VIDEO_META_KEY).items():
+        index.set_video(int(vid), json.loads(raw))
+    return index.build(model)
+
+
+def refresh_index(model, previous: Optional[MetadataIndex] = None) -> MetadataIndex:
+    """
+    previous, carried over to model (a reload of the same catalog), unless the catalog
+    version moved or previous is older than MF_META_REBUILD_S: then a new build_index.
+    """
+    if (previous is None or previous.meta_version != get_meta_version()
+            or time.monotonic() - previous.built_at >= MF_META_REBUILD_S):
+        return build_index(model)
+    model.videos_by_category = previous.videos_by_category
+    return previous
+
+
+def publish_centroids(index: MetadataIndex):
+    pipe = redis_conn.pipeline()
+    pipe.delete(CENTROIDS_KEY)
+    if index.centroids:
+        pipe.hset(CENTROIDS_KEY, mapping={t: np.asarray(c, dtype=ROW_DTYPE).tobytes()
+                                          for t, c in index.centroids.items()})
+    pipe.execute()
+
+
+def load_centroids() -> dict:
+    now = time.monotonic()
+    if now - _centroid_cache["at"] >= MF_META_CENTROID_TTL_S:
+        raw = redis_conn.hgetall(CENTROIDS_KEY)
+        _centroid_cache["centroids"] = {t.decode(): np.frombuffer(v, dtype=ROW_DTYPE).astype(np.float32)
+                                        for t, v in raw.items()}
+        # nothing published yet: ask again next time instead of caching the miss
+        _centroid_cache["at"] = now if raw else 0.0
+    return _centroid_cache["centroids"]
+
+
+def warm_rows(side: str, ids) -> dict:
+    """{id: warm vector} for the ids that have stored metadata and known centroids."""
+    tokens = _tokens_for(USER_META_KEY if side == "user" else VIDEO_META_KEY, ids)
+    if not tokens:
+        return {}
+    centroids = load_centroids()
+    out = {}
+    for i, toks in tokens.items():
+        vecs = [centroids[t] for t in toks if t in centroids]
+        if vecs:
+            out[i] = np.mean(vecs, axis=0).astype(np.float32)
+    return out
+
+
+def cold_start(model, user_id, top_n=10, exclude_seen=None, user_meta: Optional[dict] = None) -> list:
+    """Recommendations for a user without a factor row (needs model.meta_index)."""
+    index = getattr(model, "meta_index", None)
+    if index is None:
+        return []
+    tokens = user_tokens(user_meta) or load_user_tokens(user_id)
+    return index.cold_start(tokens, top_n=top_n, exclude_seen=exclude_seen)
+
+
+def load_catalog(videos_csv: Optional[str] = None, users_csv: Optional[str] = None, chunk: int = 10_000) -> dict:
+    """Store the metadata of data/videos.csv / data/usuarios.csv style files."""
+    counts = {}
+    for path, store, name in ((videos_csv, store_videos, "videos"), (users_csv, store_users, "users")):
+        if not path:
+            continue
+        n = 0
+        batch = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                batch[int(row["id"])] = row
+                if len(batch) >= chunk:
+                    store(batch)
+                    n += len(batch)
+                    batch = {}
+        if batch:
+            store(batch)
+            n += len(batch)
+        counts[name] = n
+    return counts
+
+
+def publish_from_row_store() -> int:
+    """Build the index over the item rows of the Redis row store and publish its centroids. Returns their count."""
+    from app.services.redis import redis_rows
+    model = redis_rows.load_model(user_ids=[])
+    if model is None:
+        return 0
+    index = build_index(model)
+    publish_centroids(index)
+    return len(index.centroids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load catalog metadata into Redis")
+    parser.add_argument("--videos", default=None)
+    parser.add_argument("--users", default=None)
+    parser.add_argument("--publish", action="store_true", help="publish the attribute centroids of the row store")
+    parser.add_argument("--publish-every", type=float, default=0, help="keep publishing every this many seconds")
+    args = parser.parse_args()
+    if args.videos or args.users:
+        print(load_catalog(args.videos, args.users))
+    while args.publish or args.publish_every:
+        print({"centroids": publish_from_row_store()})
+        if not args.publish_every:
+            break
+        time.sleep(args.publish_every)
@@ -4,21 +4,32 @@ import zlib
 from typing import Optional
 from app.services.redis.redis_client import redis_conn
 from app.services.mf import MatrixFactorization
+from app.services import model_io
+from app.services.metrics import timed
 
 MODEL_KEY = "mf_model_v1"
 LOCK_KEY = "mf_model_lock_v1"
 
-def save_model(model: MatrixFactorization, key: str = MODEL_KEY):
-    raw = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
-    compressed = zlib.compress(raw)
-    redis_conn.set(key, compressed)
+def save_model(model: MatrixFactorization, key: str = MODEL_KEY, quant: Optional[str] = None):
+    # binary layout from model_io: raw blocks, no pickle, no zlib; Q optionally f16/int8 (MF_SNAPSHOT_QUANT)
+    with timed("encode"):
+        data = model_io.dumps(model, quant)
+    with timed("save"):
+        redis_conn.set(key, data)
 
 def load_model(key: str = MODEL_KEY) -> Optional[MatrixFactorization]:
-    data = redis_conn.get(key)
+    with timed("redis_get"):
+        data = redis_conn.get(key)
     if data is None:
         return None
-    raw = zlib.decompress(data)
-    model = pickle.loads(raw)
+    if model_io.is_binary_model(data):
+        with timed("decode"):
+            return model_io.loads(data, copy=True)
+    # legacy payload: zlib-compressed pickle
+    with timed("decompress"):
+        raw = zlib.decompress(data)
+    with timed("unpickle"):
+        model = pickle.loads(raw)
     return model
 
 def get_lock(blocking: bool = True, timeout: int = 30):
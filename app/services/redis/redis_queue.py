@@ -1,5 +1,284 @@
 # app/services/redis/redis_queue.py
+import os
+import json
+import time
+import redis
 from rq import Queue
 from app.services.redis.redis_client import redis_conn
+from app.services.redis.redis_rows import MF_USER_SHARDS, user_shard
 
-interaction_queue = Queue("interactions", connection=redis_conn)
+# Interactions are routed by user shard (see redis_rows): shard s has the RQ queue
+# "interactions:<s>" and the buffer "interactions:buffer:<s>". Run one worker per shard,
+# e.g. `rq worker interactions:0` or MF_WORKER_SHARD=0 python -m app.services.redis.batch_worker.
+# Unsharded (MF_USER_SHARDS=1) the names are the plain "interactions" / "interactions:buffer".
+interaction_queues = [
+    Queue("interactions" if MF_USER_SHARDS == 1 else f"interactions:{s}", connection=redis_conn)
+    for s in range(MF_USER_SHARDS)
+]
+interaction_queue = interaction_queues[0]
+
+# "rq": one RQ job per interaction (default)
+# "batch": plain Redis list drained in micro-batches by app/services/redis/batch_worker.py
+# "stream": Redis Stream read by a consumer group, see app/services/redis/stream_worker.py
+INTERACTION_TRANSPORT = os.environ.get("INTERACTION_TRANSPORT", "rq")
+INTERACTION_BUFFER_KEY = "interactions:buffer"
+INTERACTION_STREAM_KEY = "interactions:stream"
+MF_STREAM_GROUP = os.environ.get("MF_STREAM_GROUP", "mf-workers")
+# XADD keeps each stream at about this many entries (0: no cap). Only a backstop for a stalled
+# group, since it drops the oldest entries read or not; the workers trim what was acknowledged.
+MF_STREAM_MAXLEN = int(os.environ.get("MF_STREAM_MAXLEN", 1_000_000))
+# an entry delivered this many times without being acknowledged goes to <stream>:dead
+MF_STREAM_MAX_DELIVERIES = int(os.environ.get("MF_STREAM_MAX_DELIVERIES", 5))
+STREAM_FIELD = b"i"
+# trim_streams forgets consumers idle this long with nothing pending (one is left per worker restart)
+STALE_CONSUMER_MS = 24 * 3600 * 1000
+
+def buffer_key(shard: int) -> str:
+    return INTERACTION_BUFFER_KEY if MF_USER_SHARDS == 1 else f"{INTERACTION_BUFFER_KEY}:{shard}"
+
+def stream_key(shard: int) -> str:
+    return INTERACTION_STREAM_KEY if MF_USER_SHARDS == 1 else f"{INTERACTION_STREAM_KEY}:{shard}"
+
+def _by_shard(payloads: list) -> dict:
+    """shard -> [(position, payload)]"""
+    groups = {}
+    for pos, p in enumerate(payloads):
+        groups.setdefault(user_shard(p["user_id"]), []).append((pos, p))
+    return groups
+
+def enqueue_interactions(payloads: list) -> list:
+    """Enqueue one RQ job per interaction on its shard's queue, all in a single Redis pipeline. Returns the job ids."""
+    job_ids = [None] * len(payloads)
+    pipe = redis_conn.pipeline()
+    for shard, items in _by_shard(payloads).items():
+        jobs = interaction_queues[shard].enqueue_many([
+            Queue.prepare_data("app.services.redis.tasks.process_interaction", args=(p,))
+            for _, p in items
+        ], pipeline=pipe)
+        for (pos, _), job in zip(items, jobs):
+            job_ids[pos] = job.id
+    pipe.execute()
+    return job_ids
+
+def push_interactions(payloads: list) -> int:
+    """Append interaction dicts to their shard buffers in one round-trip. Returns the pending count of those buffers."""
+    if not payloads:
+        return redis_conn.llen(buffer_key(0))
+    pipe = redis_conn.pipeline(transaction=False)
+    for shard, items in _by_shard(payloads).items():
+        pipe.rpush(buffer_key(shard), *[json.dumps(p) for _, p in items])
+    return sum(pipe.execute())
+
+async def push_interactions_async(payloads: list) -> int:
+    """push_interactions for the async API (redis.asyncio client)."""
+    from app.services.redis.redis_async import redis_async_conn
+    if not payloads:
+        return await redis_async_conn.llen(buffer_key(0))
+    pipe = redis_async_conn.pipeline(transaction=False)
+    for shard, items in _by_shard(payloads).items():
+        pipe.rpush(buffer_key(shard), *[json.dumps(p) for _, p in items])
+    return sum(await pipe.execute())
+
+def _xadd(pipe, payloads: list) -> list:
+    """Queue one XADD per payload on its shard's stream; returns the payload positions in command order."""
+    order = []
+    maxlen = MF_STREAM_MAXLEN or None
+    for shard, items in _by_shard(payloads).items():
+        key = stream_key(shard)
+        for pos, p in items:
+            pipe.xadd(key, {STREAM_FIELD: json.dumps(p)}, maxlen=maxlen, approximate=True)
+            order.append(pos)
+    return order
+
+def _in_order(order: list, entry_ids: list) -> list:
+    out = [None] * len(order)
+    for pos, entry_id in zip(order, entry_ids):
+        out[pos] = entry_id.decode()
+    return out
+
+def add_interactions(payloads: list) -> list:
+    """XADD interaction dicts to their shard streams in one round-trip. Returns the entry ids."""
+    pipe = redis_conn.pipeline(transaction=False)
+    order = _xadd(pipe, payloads)
+    return _in_order(order, pipe.execute()) if order else []
+
+async def add_interactions_async(payloads: list) -> list:
+    """add_interactions for the async API (redis.asyncio client)."""
+    from app.services.redis.redis_async import redis_async_conn
+    pipe = redis_async_conn.pipeline(transaction=False)
+    order = _xadd(pipe, payloads)
+    return _in_order(order, await pipe.execute()) if order else []
+
+def stream_depth() -> int:
+    """Entries of the worker group not yet read (lag) or read but not acknowledged, over all shards."""
+    pipe = redis_conn.pipeline(transaction=False)
+    for shard in range(MF_USER_SHARDS):
+        pipe.xinfo_groups(stream_key(shard))
+    depth = 0
+    for groups in pipe.execute(raise_on_error=False):
+        if isinstance(groups, Exception):
+            continue   # no stream yet
+        for g in groups:
+            if g["name"].decode() == MF_STREAM_GROUP:
+                depth += g["pending"] + (g.get("lag") or 0)
+    return depth
+
+def queue_depths() -> dict:
+    """Pending interactions per transport, summed over shards (for the mf_queue_depth gauge)."""
+    pipe = redis_conn.pipeline(transaction=False)
+    for q in interaction_queues:
+        pipe.llen(q.key)
+    for shard in range(MF_USER_SHARDS):
+        pipe.llen(buffer_key(shard))
+    depths = pipe.execute()
+    return {"rq": sum(depths[:MF_USER_SHARDS]), "batch": sum(depths[MF_USER_SHARDS:]), "stream": stream_depth()}
+
+def drain_interactions(max_items: int = 1000, max_wait_ms: int = 50, shard: int | None = None) -> list:
+    """
+    Pop up to max_items interactions from the buffer of one shard (or of whichever
+    shard has data first when shard is None), waiting at most max_wait_ms for the
+    batch to fill. Blocks (up to 1s) only for the first item.
+    """
+    keys = [buffer_key(shard)] if shard is not None else [buffer_key(s) for s in range(MF_USER_SHARDS)]
+    first = redis_conn.blpop(keys, timeout=1)
+    if first is None:
+        return []
+    key = first[0]
+    out = [json.loads(first[1])]
+    deadline = time.monotonic() + max_wait_ms / 1000.0
+    while len(out) < max_items:
+        chunk = redis_conn.lpop(key, max_items - len(out))
+        if chunk:
+            out.extend(json.loads(raw) for raw in chunk)
+            continue
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.001)
+    return out
+
+# ---------- stream consumers (stream_worker.py) ----------
+# Entries are returned as {stream key: [(entry id, interaction dict), ...]}, the shape ack_stream takes.
+
+def _stream_keys(shard: int | None) -> list:
+    return [stream_key(shard)] if shard is not None else [stream_key(s) for s in range(MF_USER_SHARDS)]
+
+def _entries(raw) -> list:
+    # entries trimmed while pending come back without fields (Redis 6.2 XAUTOCLAIM)
+    return [(entry_id.decode(), json.loads(fields[STREAM_FIELD])) for entry_id, fields in raw if fields]
+
+def _collect(out: dict, response) -> int:
+    n = 0
+    for key, raw in response or []:
+        out.setdefault(key.decode(), []).extend(_entries(raw))
+        n += len(raw)
+    return n
+
+def ensure_stream_groups(shard: int | None = None):
+    """Create the worker group (and the stream) on the shard streams that lack it; it starts at the first entry."""
+    for key in _stream_keys(shard):
+        try:
+            redis_conn.xgroup_create(key, MF_STREAM_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+def read_stream(consumer: str, max_items: int = 1000, max_wait_ms: int = 50, shard: int | None = None) -> dict:
+    """
+    XREADGROUP up to max_items new entries for consumer from one shard's stream (or from
+    all of them when shard is None), waiting at most max_wait_ms for the batch to fill.
+    Blocks (up to 1s) only for the first entry. The entries stay pending until ack_stream.
+    """
+    streams = {key: ">" for key in _stream_keys(shard)}
+    # COUNT applies to each stream: split the batch between them
+    per_stream = lambda n: -(-(max_items - n) // len(streams))
+    out = {}
+    n = _collect(out, redis_conn.xreadgroup(MF_STREAM_GROUP, consumer, streams, count=per_stream(0), block=1000))
+    if not n:
+        return {}
+    deadline = time.monotonic() + max_wait_ms / 1000.0
+    while n < max_items:
+        got = _collect(out, redis_conn.xreadgroup(MF_STREAM_GROUP, consumer, streams, count=per_stream(n)))
+        if got:
+            n += got
+            continue
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.001)
+    return out
+
+def ack_stream(entries: dict) -> int:
+    """XACK a batch of entries in one round-trip. Returns how many were still pending."""
+    pipe = redis_conn.pipeline(transaction=False)
+    for key, items in entries.items():
+        if items:
+            pipe.xack(key, MF_STREAM_GROUP, *[entry_id for entry_id, _ in items])
+    return sum(pipe.execute())
+
+# XAUTOCLAIM cursor per stream: each call resumes where the previous one stopped
+_claim_cursors = {}
+
+def claim_stale(consumer: str, min_idle_ms: int, max_items: int = 1000, shard: int | None = None):
+    """
+    Take over entries pending for more than min_idle_ms (read by a worker that crashed or
+    failed to apply them). Entries delivered more than MF_STREAM_MAX_DELIVERIES times are
+    moved to <stream>:dead and acknowledged instead. Returns (entries, dead count).
+    """
+    out, dead = {}, 0
+    for key in _stream_keys(shard):
+        response = redis_conn.xautoclaim(key, MF_STREAM_GROUP, consumer, min_idle_time=min_idle_ms,
+                                         start_id=_claim_cursors.get(key, "0-0"), count=max_items)
+        # Redis >= 7 appends the ids of entries trimmed while pending (already dropped from the group)
+        _claim_cursors[key] = response[0].decode()
+        items = _entries(response[1])
+        if len(items) < len(response[1]):
+            redis_conn.xack(key, MF_STREAM_GROUP, *[entry_id for entry_id, fields in response[1] if not fields])
+        if not items:
+            continue
+        deliveries = {
+            p["message_id"].decode(): p["times_delivered"]
+            for p in redis_conn.xpending_range(key, MF_STREAM_GROUP, min=items[0][0], max=items[-1][0],
+                                               count=len(items), consumername=consumer)
+        }
+        poison = [(i, p) for i, p in items if deliveries.get(i, 0) > MF_STREAM_MAX_DELIVERIES]
+        if poison:
+            pipe = redis_conn.pipeline(transaction=False)
+            for entry_id, p in poison:
+                pipe.xadd(key + ":dead", {STREAM_FIELD: json.dumps(p), b"id": entry_id})
+            pipe.xack(key, MF_STREAM_GROUP, *[entry_id for entry_id, _ in poison])
+            pipe.execute()
+            dead += len(poison)
+            items = [(i, p) for i, p in items if deliveries.get(i, 0) <= MF_STREAM_MAX_DELIVERIES]
+        if items:
+            out[key] = items
+    return out, dead
+
+def _id_tuple(entry_id) -> tuple:
+    ms, _, seq = (entry_id.decode() if isinstance(entry_id, bytes) else entry_id).partition("-")
+    return int(ms), int(seq or 0)
+
+def trim_streams(shard: int | None = None) -> int:
+    """
+    XTRIM MINID every stream up to its oldest entry some group has not acknowledged yet
+    (pending, or not read: past the group's last-delivered id), so nothing unprocessed is
+    dropped. Also forgets the worker group's consumers idle for STALE_CONSUMER_MS with
+    nothing pending. Returns the number of entries removed.
+    """
+    removed = 0
+    for key in _stream_keys(shard):
+        try:
+            groups = redis_conn.xinfo_groups(key)
+        except redis.ResponseError:
+            continue
+        if not groups:
+            continue   # nobody reads it yet: nothing is known to be processed
+        floor = None
+        for g in groups:
+            low = redis_conn.xpending(key, g["name"])["min"] if g["pending"] else g["last-delivered-id"]
+            floor = low if floor is None or _id_tuple(low) < _id_tuple(floor) else floor
+        removed += redis_conn.xtrim(key, minid=floor, approximate=True)
+        if not any(g["name"].decode() == MF_STREAM_GROUP for g in groups):
+            continue
+        for c in redis_conn.xinfo_consumers(key, MF_STREAM_GROUP):
+            if not c["pending"] and c.get("idle", 0) > STALE_CONSUMER_MS:
+                redis_conn.xgroup_delconsumer(key, MF_STREAM_GROUP, c["name"])
+    return removed
@@ -0,0 +1,426 @@
+# app/services/redis/redis_rows.py
+"""
+Row-level model storage in Redis.
+
+Instead of one pickled blob, every factor row is its own hash field:
+
+    mf_rows_v1:meta        k, lr, reg, seed
+    mf_rows_v1:user_map    user_id  -> row index
+    mf_rows_v1:video_map   video_id -> row index
+    mf_rows_v1:P           user_id  -> raw little-endian float32 bytes
+    mf_rows_v1:Q           video_id -> raw little-endian float32 bytes
+    mf_rows_v1:version     counter bumped by every write (see model_cache)
+    mf_rows_v1:staging:*   a model being written by save_model
+
+An interaction reads and writes only the two rows it touches, so no global
+lock is needed. Concurrent updates of the same row may drop one SGD step
+(Hogwild-style), which SGD tolerates.
+
+Sharding (MF_USER_SHARDS=N, MF_ITEM_SHARDS=M): user rows live in N hashes
+mf_rows_v1:P:<user_id % N> and item rows in M hashes mf_rows_v1:Q:<video_id % M>,
+each with its own lock (<key>:lock). A batch is split into (user shard, item shard)
+blocks and each block is applied holding only its two locks (user lock first, so
+workers cannot deadlock). Updates of disjoint blocks run concurrently and none are
+lost. The queue routes interactions by user shard (see redis_queue), so with one
+worker per user shard only the item locks are ever contended. With N = M = 1 the
+keys are the unsharded ones above and no locks are taken.
+"""
+import os
+from contextlib import ExitStack, contextmanager
+import numpy as np
+from typing import Optional
+from app.services.redis.redis_client import redis_conn
+from app.services.redis import redis_meta
+from app.services.mf import MatrixFactorization, sgd_step, sgd_batch_step
+from app.services.metrics import timed, timed_lock
+
+ROWS_PREFIX = "mf_rows_v1"
+META_KEY = ROWS_PREFIX + ":meta"
+USER_MAP_KEY = ROWS_PREFIX + ":user_map"
+VIDEO_MAP_KEY = ROWS_PREFIX + ":video_map"
+P_KEY = ROWS_PREFIX + ":P"
+Q_KEY = ROWS_PREFIX + ":Q"
+VERSION_KEY = ROWS_PREFIX + ":version"
+# save_model writes here, then renames over the live keys
+STAGING_PREFIX = ROWS_PREFIX + ":staging"
+
+ROW_DTYPE = np.dtype("<f4")
+
+MF_USER_SHARDS = max(1, int(os.environ.get("MF_USER_SHARDS", 1)))
+MF_ITEM_SHARDS = max(1, int(os.environ.get("MF_ITEM_SHARDS", 1)))
+SHARDED = MF_USER_SHARDS * MF_ITEM_SHARDS > 1
+SHARD_LOCK_TIMEOUT_S = 30
+# how long a worker waits for a shard lock before giving up on the block (TimeoutError)
+MF_SHARD_LOCK_WAIT_S = float(os.environ.get("MF_SHARD_LOCK_WAIT_S", 10))
+MF_ROWS_SAVE_CHUNK = int(os.environ.get("MF_ROWS_SAVE_CHUNK", 10_000))
+
+DEFAULT_META = {"k": 32, "lr": 0.5, "reg": 0.02, "seed": 1}
+
+# Assign the next free row index to every id not yet present in the map.
+# Runs atomically inside Redis, so two workers never hand out the same index.
+_REGISTER_IDS = redis_conn.register_script("""
+local out = {}
+for i, id in ipairs(ARGV) do
+    local idx = redis.call('HGET', KEYS[1], id)
+    if not idx then
+        idx = redis.call('HLEN', KEYS[1])
+        redis.call('HSET', KEYS[1], id, idx)
+    end
+    out[i] = tonumber(idx)
+end
+return out
+""")
+
+_rng = np.random.default_rng()
+
+
+# ---------- shards ----------
+def user_shard(user_id) -> int:
+    return int(user_id) % MF_USER_SHARDS
+
+
+def item_shard(video_id) -> int:
+    return int(video_id) % MF_ITEM_SHARDS
+
+
+def p_key(shard: int) -> str:
+    return P_KEY if MF_USER_SHARDS == 1 else f"{P_KEY}:{shard}"
+
+
+def q_key(shard: int) -> str:
+    return Q_KEY if MF_ITEM_SHARDS == 1 else f"{Q_KEY}:{shard}"
+
+
+def user_row_key(user_id) -> str:
+    return p_key(user_shard(user_id))
+
+
+def video_row_key(video_id) -> str:
+    return q_key(item_shard(video_id))
+
+
+def shard_lock(key: str):
+    # expires after SHARD_LOCK_TIMEOUT_S if its holder dies; acquire() gives up after MF_SHARD_LOCK_WAIT_S
+    return redis_conn.lock(key + ":lock", timeout=SHARD_LOCK_TIMEOUT_S, blocking_timeout=MF_SHARD_LOCK_WAIT_S)
+
+
+@contextmanager
+def block_lock(u_shard: int, i_shard: int):
+    """Hold the locks of one (user shard, item shard) block. No-op when not sharded."""
+    if not SHARDED:
+        yield
+        return
+    with timed_lock(shard_lock(p_key(u_shard)), "user_shard"):
+        with timed_lock(shard_lock(q_key(i_shard)), "item_shard"):
+            yield
+
+
+def _hmget_sharded(ids, key_fn) -> list:
+    """HMGET rows spread over several hashes in one pipeline. Results follow ids order."""
+    groups = {}
+    for pos, i in enumerate(ids):
+        groups.setdefault(key_fn(i), []).append(pos)
+    if not groups:
+        return []
+    pipe = redis_conn.pipeline(transaction=False)
+    for key, positions in groups.items():
+        pipe.hmget(key, [str(ids[p]) for p in positions])
+    out = [None] * len(ids)
+    for positions, raws in zip(groups.values(), pipe.execute()):
+        for p, raw in zip(positions, raws):
+            out[p] = raw
+    return out
+
+
+def encode_row(vec) -> bytes:
+    return np.asarray(vec, dtype=ROW_DTYPE).tobytes()
+
+
+def decode_row(raw: bytes) -> np.ndarray:
+    # copy so the row is writable and independent of the Redis buffer
+    return np.frombuffer(raw, dtype=ROW_DTYPE).astype(np.float32)
+
+
+def decode_rows(raws, k: int) -> np.ndarray:
+    if not raws:
+        return np.zeros((0, k), dtype=np.float32)
+    return np.frombuffer(b"".join(raws), dtype=ROW_DTYPE).reshape(len(raws), k).astype(np.float32)
+
+
+def init_meta(k=DEFAULT_META["k"], lr=DEFAULT_META["lr"], reg=DEFAULT_META["reg"], seed=DEFAULT_META["seed"]):
+    """Store hyper-parameters if missing. Existing values are kept."""
+    pipe = redis_conn.pipeline()
+    for field, value in (("k", k), ("lr", lr), ("reg", reg), ("seed", seed)):
+        pipe.hsetnx(META_KEY, field, value)
+    pipe.execute()
+
+
+def get_meta() -> Optional[dict]:
+    raw = redis_conn.hgetall(META_KEY)
+    if not raw:
+        return None
+    meta = {key.decode(): value.decode() for key, value in raw.items()}
+    return {"k": int(meta["k"]), "lr": float(meta["lr"]), "reg": float(meta["reg"]), "seed": int(meta["seed"])}
+
+
+def _ensure_meta() -> dict:
+    meta = get_meta()
+    if meta is None:
+        init_meta()
+        meta = get_meta()
+    return meta
+
+
+def register_ids(map_key: str, row_key_fn, ids, k: int) -> list:
+    """
+    Register ids in a map (atomically) and give new ones an initial row: the warm-start
+    vector of their stored metadata (redis_meta) if there is one, random otherwise.
+    Returns the row index of each id.
+    """
+    if not ids:
+        return []
+    idxs = _REGISTER_IDS(keys=[map_key], args=[str(int(i)) for i in ids])
+    warm = redis_meta.warm_rows("user" if map_key == USER_MAP_KEY else "video", ids)
+    pipe = redis_conn.pipeline()
+    for i in ids:
+        vec = warm.get(int(i))
+        if vec is None or len(vec) != k:
+            vec = _rng.normal(0.0, 0.01, size=k)
+        # HSETNX: if another worker already wrote the row, keep theirs
+        pipe.hsetnx(row_key_fn(i), str(int(i)), encode_row(vec))
+    pipe.execute()
+    return idxs
+
+
+def update_interaction(user_id: int, video_id: int, rating: float) -> float:
+    """
+    Apply one SGD step touching only P[user_id] and Q[video_id].
+    Returns the prediction before the update.
+    """
+    meta = _ensure_meta()
+    uid, vid = str(int(user_id)), str(int(video_id))
+    pk, qk = user_row_key(user_id), video_row_key(video_id)
+
+    with block_lock(user_shard(user_id), item_shard(video_id)):
+        with timed("rows_read"):
+            pipe = redis_conn.pipeline()
+            pipe.hget(pk, uid)
+            pipe.hget(qk, vid)
+            raw_p, raw_q = pipe.execute()
+        if raw_p is None:
+            register_ids(USER_MAP_KEY, user_row_key, [user_id], meta["k"])
+            raw_p = redis_conn.hget(pk, uid)
+        if raw_q is None:
+            register_ids(VIDEO_MAP_KEY, video_row_key, [video_id], meta["k"])
+            raw_q = redis_conn.hget(qk, vid)
+
+        pu, qv = decode_row(raw_p), decode_row(raw_q)
+        pred = float(pu.dot(qv))
+        new_pu, new_qv = sgd_step(pu, qv, rating, meta["lr"], meta["reg"])
+
+        with timed("rows_write"):
+            pipe = redis_conn.pipeline()
+            pipe.hset(pk, uid, encode_row(new_pu))
+            pipe.hset(qk, vid, encode_row(new_qv))
+            pipe.incr(VERSION_KEY)
+            pipe.execute()
+    return pred
+
+
+def apply_batch(user_ids, video_ids, ratings) -> int:
+    """
+    Batched version of update_interaction: one HMGET round-trip for every touched row,
+    one vectorized SGD step (mf.sgd_batch_step) and one pipelined write-back.
+    Returns the number of interactions applied.
+    When sharded, each (user shard, item shard) block is applied under its own locks.
+    """
+    if len(user_ids) == 0:
+        return 0
+    meta = _ensure_meta()
+    if not SHARDED:
+        return _apply_block(user_ids, video_ids, ratings, meta, P_KEY, Q_KEY)
+
+    u = np.asarray(user_ids, dtype=np.int64)
+    v = np.asarray(video_ids, dtype=np.int64)
+    r = np.asarray(ratings, dtype=np.float32)
+    block = (u % MF_USER_SHARDS) * MF_ITEM_SHARDS + v % MF_ITEM_SHARDS
+    order = np.argsort(block, kind="stable")   # keeps interaction order inside a block
+    starts = np.flatnonzero(np.r_[True, np.diff(block[order]) != 0])
+    for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+        sel = order[start:end]
+        us, its = divmod(int(block[sel[0]]), MF_ITEM_SHARDS)
+        with block_lock(us, its):
+            _apply_block(u[sel], v[sel], r[sel], meta, p_key(us), q_key(its))
+    return len(user_ids)
+
+
+def _apply_block(user_ids, video_ids, ratings, meta, pk, qk) -> int:
+    """apply_batch for interactions whose rows all live in the hashes pk and qk."""
+    k = meta["k"]
+    users = list(dict.fromkeys(int(u) for u in user_ids))
+    videos = list(dict.fromkeys(int(v) for v in video_ids))
+
+    with timed("rows_read"):
+        pipe = redis_conn.pipeline()
+        pipe.hmget(pk, [str(u) for u in users])
+        pipe.hmget(qk, [str(v) for v in videos])
+        raw_p, raw_q = pipe.execute()
+
+    # register every missing id of the batch at once, then re-read their rows
+    missing_u = [u for u, r in zip(users, raw_p) if r is None]
+    missing_v = [v for v, r in zip(videos, raw_q) if r is None]
+    if missing_u or missing_v:
+        register_ids(USER_MAP_KEY, lambda _: pk, missing_u, k)
+        register_ids(VIDEO_MAP_KEY, lambda _: qk, missing_v, k)
+        pipe = redis_conn.pipeline()
+        pipe.hmget(pk, [str(u) for u in users])
+        pipe.hmget(qk, [str(v) for v in videos])
+        raw_p, raw_q = pipe.execute()
+
+    P = decode_rows(raw_p, k)
+    Q = decode_rows(raw_q, k)
+    u_pos = {u: i for i, u in enumerate(users)}
+    v_pos = {v: i for i, v in enumerate(videos)}
+    u_idx = np.fromiter((u_pos[int(u)] for u in user_ids), dtype=np.int64, count=len(user_ids))
+    v_idx = np.fromiter((v_pos[int(v)] for v in video_ids), dtype=np.int64, count=len(video_ids))
+    with timed("sgd"):
+        sgd_batch_step(P, Q, u_idx, v_idx, ratings, meta["lr"], meta["reg"])
+
+    with timed("rows_write"):
+        pipe = redis_conn.pipeline()
+        pipe.hset(pk, mapping={str(u): encode_row(P[i]) for i, u in enumerate(users)})
+        pipe.hset(qk, mapping={str(v): encode_row(Q[i]) for i, v in enumerate(videos)})
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+    return len(user_ids)
+
+
+def _ordered_ids(map_key: str) -> list:
+    """Ids of a map sorted by their row index."""
+    raw = redis_conn.hgetall(map_key)
+    pairs = sorted((int(idx), int(i)) for i, idx in raw.items())
+    return [i for _, i in pairs]
+
+
+def load_user_row(user_id: int) -> Optional[np.ndarray]:
+    with timed("user_row"):
+        raw = redis_conn.hget(user_row_key(user_id), str(int(user_id)))
+    return None if raw is None else decode_row(raw)
+
+
+def load_user_rows(user_ids) -> list:
+    """Rows of many users (None for users without one), one pipeline over the user shards."""
+    with timed("user_row"):
+        raws = _hmget_sharded([int(u) for u in user_ids], user_row_key)
+    return [None if raw is None else decode_row(raw) for raw in raws]
+
+
+def load_item_matrix(k: int):
+    """Returns (video_ids, Q) with rows in index order (all item shards, one pipeline)."""
+    with timed("redis_get"):
+        video_ids = _ordered_ids(VIDEO_MAP_KEY)
+        if not video_ids:
+            return video_ids, np.zeros((0, k), dtype=np.float32)
+        raws = _hmget_sharded(video_ids, video_row_key)
+    # a video registered by a worker that has not written its row yet is skipped
+    kept = [(v, r) for v, r in zip(video_ids, raws) if r is not None]
+    return [v for v, _ in kept], decode_rows([r for _, r in kept], k)
+
+
+def load_model(user_ids=None) -> Optional[MatrixFactorization]:
+    """
+    Assemble a MatrixFactorization from the stored rows.
+    If user_ids is given, only those user rows are fetched (plus the full item matrix),
+    which is all /recommend needs.
+    """
+    meta = get_meta()
+    if meta is None:
+        return None
+    k = meta["k"]
+    if user_ids is None:
+        user_ids = _ordered_ids(USER_MAP_KEY)
+    user_ids = [int(u) for u in user_ids]
+    raws = _hmget_sharded(user_ids, user_row_key)
+    found = [(u, r) for u, r in zip(user_ids, raws) if r is not None]
+    video_ids, Q = load_item_matrix(k)
+    return MatrixFactorization.from_arrays(
+        [u for u, _ in found], decode_rows([r for _, r in found], k), video_ids, Q,
+        k=k, lr=meta["lr"], reg=meta["reg"], seed=meta["seed"],
+    )
+
+
+def save_model(model: MatrixFactorization):
+    """
+    Write a whole in-memory model into the row store (e.g. after offline training).
+    Rows go to staging keys first, MF_ROWS_SAVE_CHUNK per pipeline. One MULTI then drops
+    the live keys, renames the staged ones over them and bumps the version, so readers see
+    the old model or the new one, never an empty or half-written store. When sharded it
+    runs holding every shard lock, so no worker writes a row of the old model into the new.
+    """
+    stale = list(redis_conn.scan_iter(match=STAGING_PREFIX + ":*"))
+    if stale:
+        redis_conn.unlink(*stale)   # left by an interrupted save
+    redis_conn.hset(_staged(META_KEY), mapping={"k": model.k, "lr": model.lr, "reg": model.reg, "seed": model.seed})
+    staged = {META_KEY}
+    with timed("rows_save"):
+        staged |= _stage_rows(USER_MAP_KEY, user_row_key, model.user_map, model.P)
+        staged |= _stage_rows(VIDEO_MAP_KEY, video_row_key, model.video_map, model.Q)
+
+    with ExitStack() as stack:
+        if SHARDED:
+            # user locks before item locks, like block_lock, so a worker never deadlocks with us
+            for key in [p_key(s) for s in range(MF_USER_SHARDS)] + [q_key(s) for s in range(MF_ITEM_SHARDS)]:
+                stack.enter_context(timed_lock(shard_lock(key), "save_model"))
+        pipe = redis_conn.pipeline()
+        pipe.unlink(META_KEY, USER_MAP_KEY, VIDEO_MAP_KEY, P_KEY, Q_KEY, *_shard_keys())
+        for key in staged:
+            pipe.rename(_staged(key), key)
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+
+
+def _staged(key: str) -> str:
+    return STAGING_PREFIX + key[len(ROWS_PREFIX):]
+
+
+def _stage_rows(map_key: str, row_key_fn, id_map, rows) -> set:
+    """Write an id map and its rows under the staging prefix. Returns the live keys written."""
+    items = list(id_map.items())
+    written = set()
+    for start in range(0, len(items), MF_ROWS_SAVE_CHUNK):
+        chunk = items[start:start + MF_ROWS_SAVE_CHUNK]
+        by_key = {}
+        for id_, idx in chunk:
+            by_key.setdefault(row_key_fn(id_), {})[str(int(id_))] = encode_row(rows[idx])
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.hset(_staged(map_key), mapping={str(int(id_)): int(idx) for id_, idx in chunk})
+        for key, mapping in by_key.items():
+            pipe.hset(_staged(key), mapping=mapping)
+        pipe.execute()
+        written.add(map_key)
+        written.update(by_key)
+    return written
+
+
+def get_version() -> int:
+    raw = redis_conn.get(VERSION_KEY)
+    return 0 if raw is None else int(raw)
+
+
+def _shard_keys() -> list:
+    """Row hashes of every shard layout in Redis (P:<n> / Q:<n>, not their :lock keys)."""
+    keys = []
+    for base in (P_KEY, Q_KEY):
+        for key in redis_conn.scan_iter(match=base + ":*"):
+            if key.decode()[len(base) + 1:].isdigit():
+                keys.append(key)
+    return keys
+
+
+def reset_model():
+    # the version is bumped, not deleted, so readers never see an old version number again
+    # shard hashes are found by pattern, so keys of a previous shard layout go too
+    pipe = redis_conn.pipeline()
+    pipe.delete(META_KEY, USER_MAP_KEY, VIDEO_MAP_KEY, P_KEY, Q_KEY, *_shard_keys())
+    pipe.incr(VERSION_KEY)
+    pipe.execute()
@@ -0,0 +1,170 @@
+# app/services/redis/redis_seen.py
+"""
+Per-user seen / blocked videos as Redis sorted sets of video ids, scored by the time
+they were recorded.
+
+    mf_seen_v3:<user_id>      the last MF_SEEN_MAX videos the user interacted with
+    mf_blocked_v3:<user_id>   the last MF_BLOCKED_MAX videos the user flagged dont_suggest
+
+Memory per user is bounded: every write trims the set to its newest entries
+(ZREMRANGEBYRANK), so an active user's set, and the payload read on every /recommend,
+never grow past the cap. A video that falls out of the seen window can be recommended
+again; one that falls out of the blocked window (after MF_BLOCKED_MAX newer blocks) too.
+Any 64-bit video id is accepted. Seen sets also expire after MF_SEEN_TTL_S seconds
+without activity; blocked sets do not.
+
+Older layouts (v1 bitmaps with bit = video_id, v2 plain sets) are converted with:
+    python -m app.services.redis.redis_seen --migrate
+"""
+import argparse
+import os
+import time
+import numpy as np
+from app.services.redis.redis_client import redis_conn
+
+SEEN_PREFIX = "mf_seen_v3:"
+BLOCKED_PREFIX = "mf_blocked_v3:"
+MF_SEEN_TTL_S = int(os.environ.get("MF_SEEN_TTL_S", 30 * 24 * 3600))
+MF_SEEN_MAX = int(os.environ.get("MF_SEEN_MAX", 5000))
+MF_BLOCKED_MAX = int(os.environ.get("MF_BLOCKED_MAX", 10000))
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def record_interactions(interactions: list, pipe=None):
+    """Mark the videos of a list of interaction dicts as seen (and blocked if dont_suggest)."""
+    record_arrays(
+        [inter["user_id"] for inter in interactions],
+        [inter["video_id"] for inter in interactions],
+        [inter.get("dont_suggest") or 0 for inter in interactions],
+        pipe=pipe,
+    )
+
+
+def _add_capped(pipe, key: str, vids: list, cap: int, now_us: int):
+    # score: microseconds, plus the position so later ids of one batch rank newer
+    pipe.zadd(key, {vid: now_us + i for i, vid in enumerate(vids)})
+    if cap > 0:
+        # keep the newest cap entries (lowest scores are the oldest)
+        pipe.zremrangebyrank(key, 0, -cap - 1)
+
+
+def record_arrays(user_ids, video_ids, dont_suggest=None, pipe=None):
+    """Columnar record_interactions (used by bulk ingest): one ZADD + trim per user and set."""
+    if dont_suggest is None:
+        dont_suggest = [0] * len(user_ids)
+    seen, blocked = {}, {}
+    for uid, vid, dont in zip(user_ids, video_ids, dont_suggest):
+        uid, vid = int(uid), int(vid)
+        if not INT64_MIN <= vid <= INT64_MAX:
+            raise ValueError(f"video_id {vid} does not fit in 64 bits")
+        seen.setdefault(uid, []).append(vid)
+        if dont:
+            blocked.setdefault(uid, []).append(vid)
+    if not seen:
+        return
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = redis_conn.pipeline(transaction=False)
+    now = int(time.time() * 1e6)
+    for uid, vids in seen.items():
+        _add_capped(pipe, SEEN_PREFIX + str(uid), vids, MF_SEEN_MAX, now)
+        if MF_SEEN_TTL_S > 0:
+            pipe.expire(SEEN_PREFIX + str(uid), MF_SEEN_TTL_S)
+    for uid, vids in blocked.items():
+        _add_capped(pipe, BLOCKED_PREFIX + str(uid), vids, MF_BLOCKED_MAX, now)
+    if own_pipe:
+        pipe.execute()
+
+
+def queue_reads(pipe, user_id):
+    """Queue the two reads of one user on a (sync or async) pipeline; see merge_members."""
+    pipe.zrange(SEEN_PREFIX + str(int(user_id)), 0, -1)
+    pipe.zrange(BLOCKED_PREFIX + str(int(user_id)), 0, -1)
+
+
+def _ids(members) -> np.ndarray:
+    if not members:
+        return np.zeros(0, dtype=np.int64)
+    return np.array(list(members)).astype(np.int64)
+
+
+def merge_members(seen, blocked) -> np.ndarray:
+    """Sorted video ids of the two replies queued by queue_reads (either may be empty)."""
+    return np.union1d(_ids(seen), _ids(blocked))
+
+
+def load_excluded(user_id: int) -> np.ndarray:
+    """Sorted video ids the user has seen or blocked (one round-trip)."""
+    pipe = redis_conn.pipeline(transaction=False)
+    queue_reads(pipe, user_id)
+    seen, blocked = pipe.execute()
+    return merge_members(seen, blocked)
+
+
+def load_excluded_many(user_ids) -> list:
+    """load_excluded for many users in one round-trip."""
+    pipe = redis_conn.pipeline(transaction=False)
+    for uid in user_ids:
+        queue_reads(pipe, uid)
+    raws = pipe.execute()
+    return [merge_members(raws[2 * i], raws[2 * i + 1]) for i in range(len(user_ids))]
+
+
+def load_blocked(user_id: int) -> np.ndarray:
+    return np.sort(_ids(redis_conn.zrange(BLOCKED_PREFIX + str(int(user_id)), 0, -1)))
+
+
+def reset_user(user_id: int):
+    redis_conn.delete(SEEN_PREFIX + str(int(user_id)), BLOCKED_PREFIX + str(int(user_id)))
+
+
+def _old_ids(kind: str, raw) -> list:
+    if kind == "bitmap":
+        # Redis bit 0 is the most significant bit of byte 0 ("big" bit order)
+        return np.flatnonzero(np.unpackbits(np.frombuffer(raw, dtype=np.uint8), bitorder="big")).tolist()
+    return [int(m) for m in raw]
+
+
+def migrate(batch: int = 500) -> int:
+    """
+    Convert the v1 bitmaps and v2 sets into v3 sorted sets (keeping the TTL, trimmed to the
+    caps) and delete them. The old layouts have no time order, so which ids a trim keeps is arbitrary.
+    """
+    moved = 0
+    layouts = (("mf_seen_v1:", SEEN_PREFIX, "bitmap", MF_SEEN_MAX), ("mf_blocked_v1:", BLOCKED_PREFIX, "bitmap", MF_BLOCKED_MAX),
+               ("mf_seen_v2:", SEEN_PREFIX, "set", MF_SEEN_MAX), ("mf_blocked_v2:", BLOCKED_PREFIX, "set", MF_BLOCKED_MAX))
+    for old_prefix, new_prefix, kind, cap in layouts:
+        keys = list(redis_conn.scan_iter(match=old_prefix + "*", count=batch))
+        for start in range(0, len(keys), batch):
+            chunk = keys[start:start + batch]
+            pipe = redis_conn.pipeline(transaction=False)
+            for key in chunk:
+                if kind == "bitmap":
+                    pipe.get(key)
+                else:
+                    pipe.smembers(key)
+                pipe.pttl(key)
+            raws = pipe.execute()
+            pipe = redis_conn.pipeline(transaction=False)
+            now = int(time.time() * 1e6)
+            for i, key in enumerate(chunk):
+                raw, ttl = raws[2 * i], raws[2 * i + 1]
+                new_key = new_prefix + key.decode()[len(old_prefix):]
+                ids = _old_ids(kind, raw) if raw else []
+                if ids:
+                    _add_capped(pipe, new_key, ids, cap, now)
+                    if ttl > 0:
+                        pipe.pexpire(new_key, ttl)
+                pipe.delete(key)
+            pipe.execute()
+            moved += len(chunk)
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="seen / blocked video sets")
+    parser.add_argument("--migrate", action="store_true", help="convert the v1 bitmaps and v2 sets to v3 sorted sets")
+    args = parser.parse_args()
+    if args.migrate:
+        print({"migrated": migrate()})
@@ -0,0 +1,108 @@
+# app/services/redis/stream_worker.py
+"""
+Consumer-group interaction worker for INTERACTION_TRANSPORT=stream.
+
+Reads up to MF_BATCH_MAX new entries (or whatever arrives within MF_BATCH_WAIT_MS) from
+the interaction stream with XREADGROUP, applies them with one batched row-store update
+and acknowledges the batch with one XACK. Run any number of them, on any hosts:
+    python -m app.services.redis.stream_worker
+With MF_USER_SHARDS > 1, MF_WORKER_SHARD=<s> limits a worker to one shard's stream.
+
+Delivery is at least once. Entries of a batch that failed, or that a crashed worker had
+read, stay pending in the group; every MF_STREAM_CLAIM_S a worker claims the ones idle
+for MF_STREAM_CLAIM_IDLE_MS (XAUTOCLAIM) and applies them again, one by one if the batch
+fails. After MF_STREAM_MAX_DELIVERIES deliveries an entry moves to <stream>:dead.
+Every MF_STREAM_TRIM_S a worker trims the entries all groups have acknowledged.
+"""
+import os
+import signal
+import socket
+import sys
+import time
+import logging
+from app.services.redis.redis_queue import ack_stream, claim_stale, ensure_stream_groups, read_stream, trim_streams
+from app.services.redis.batch_worker import MF_BATCH_MAX, MF_BATCH_WAIT_MS, MF_WORKER_SHARD
+from app.services.redis.tasks import process_interaction_batch
+from app.services import metrics
+from app.services.metrics import timed
+
+# must stay the same across restarts only if the worker should get its own pending entries back at once
+MF_STREAM_CONSUMER = os.environ.get("MF_STREAM_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+MF_STREAM_CLAIM_IDLE_MS = int(os.environ.get("MF_STREAM_CLAIM_IDLE_MS", 30000))
+MF_STREAM_CLAIM_S = float(os.environ.get("MF_STREAM_CLAIM_S", 5))
+MF_STREAM_TRIM_S = float(os.environ.get("MF_STREAM_TRIM_S", 10))
+
+logger = logging.getLogger(__name__)
+
+def apply_entries(entries: dict, apply=process_interaction_batch) -> int:
+    """Apply a batch of stream entries, then acknowledge it. Returns the count applied."""
+    batch = [payload for items in entries.values() for _, payload in items]
+    if not batch:
+        return 0
+    apply(batch)
+    with timed("stream_ack"):
+        ack_stream(entries)
+    return len(batch)
+
+def run_once(consumer: str = MF_STREAM_CONSUMER, max_items: int = MF_BATCH_MAX, max_wait_ms: int = MF_BATCH_WAIT_MS,
+             shard: int | None = MF_WORKER_SHARD, apply=process_interaction_batch) -> int:
+    with timed("drain"):
+        entries = read_stream(consumer, max_items=max_items, max_wait_ms=max_wait_ms, shard=shard)
+    try:
+        return apply_entries(entries, apply)
+    except Exception:
+        # left pending: claimed again once idle for MF_STREAM_CLAIM_IDLE_MS
+        logger.exception("failed to apply %d stream entries", sum(len(items) for items in entries.values()))
+        return 0
+
+def reclaim(consumer: str = MF_STREAM_CONSUMER, min_idle_ms: int = MF_STREAM_CLAIM_IDLE_MS,
+            max_items: int = MF_BATCH_MAX, shard: int | None = MF_WORKER_SHARD, apply=process_interaction_batch) -> int:
+    """Apply entries left pending by failed batches or dead workers. Returns the count applied."""
+    entries, dead = claim_stale(consumer, min_idle_ms, max_items=max_items, shard=shard)
+    if dead:
+        logger.error("moved %d stream entries to the dead-letter stream", dead)
+        metrics.STREAM_ENTRIES.inc(dead, outcome="dead")
+    if not entries:
+        return 0
+    metrics.STREAM_ENTRIES.inc(sum(len(items) for items in entries.values()), outcome="reclaimed")
+    try:
+        return apply_entries(entries, apply)
+    except Exception:
+        logger.exception("reclaimed batch failed, applying its entries one by one")
+    applied = 0
+    for key, items in entries.items():
+        for item in items:
+            try:
+                applied += apply_entries({key: [item]}, apply)
+            except Exception:
+                logger.exception("stream entry %s %s failed", key, item[0])
+    return applied
+
+def run(consumer: str = MF_STREAM_CONSUMER, max_items: int = MF_BATCH_MAX, max_wait_ms: int = MF_BATCH_WAIT_MS,
+        shard: int | None = MF_WORKER_SHARD):
+    ensure_stream_groups(shard)
+    logger.info("stream worker %s started (max_items=%d, max_wait_ms=%d, shard=%s)", consumer, max_items, max_wait_ms, shard)
+    next_claim = next_trim = 0.0
+    while True:
+        try:
+            now = time.monotonic()
+            if now >= next_claim:
+                next_claim = now + MF_STREAM_CLAIM_S
+                reclaim(consumer, max_items=max_items, shard=shard)
+            if now >= next_trim:
+                next_trim = now + MF_STREAM_TRIM_S
+                trim_streams(shard)
+            applied = run_once(consumer, max_items, max_wait_ms, shard)
+            if applied:
+                logger.debug("applied %d interactions", applied)
+        except Exception:
+            # e.g. Redis unreachable: nothing was acknowledged, retry
+            logger.exception("stream worker iteration failed")
+            time.sleep(1.0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # exit normally on SIGTERM, so atexit pushes the spooled metrics (metrics.flush)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    run()
@@ -1,37 +1,70 @@
 # app/services/redis/tasks.py
-from app.services.redis.redis_model import load_model, save_model, get_lock
-from app.services.mf import MatrixFactorization
+from app.services.redis import redis_meta, redis_rows, redis_seen
 from app.services.helpers import compute_interaction_score
+from app.services import metrics
+from app.services.topn_cache import topn_cache
+
+def _store_meta(interactions: list):
+    users = {inter["user_id"]: inter["user_meta"] for inter in interactions if inter.get("user_meta")}
+    videos = {inter["video_id"]: inter["video_meta"] for inter in interactions if inter.get("video_meta")}
+    if users:
+        redis_meta.store_users(users)
+    if videos:
+        redis_meta.store_videos(videos)
 
 def process_interaction(interaction: dict):
     """
     interaction is a plain dict with user_id, video_id, like, watchtime, duration, dont_suggest, comentario
     This function will be executed by RQ worker processes.
+    Only the user row and the video row are read and written (see redis_rows),
+    so workers no longer serialize on a model-wide lock.
     """
-    # Try to acquire Redis lock to do atomic load->update->save
-    lock = get_lock(timeout=30)
-    got = lock.acquire(blocking=True)
-    if not got:
-        # Can't acquire lock -> either requeue or fail
-        raise RuntimeError("Could not acquire model lock")
-
-    try:
-        model = load_model()
-        if model is None:
-            # initialize if missing
-            model = MatrixFactorization(k=32, lr=0.5, reg=0.02)
+    score = compute_interaction_score(
+        like=interaction.get("like", 0),
+        watchtime=interaction.get("watchtime", 0.0),
+        duration=interaction.get("duration"),
+        dont_suggest=interaction.get("dont_suggest", 0),
+        comment=interaction.get("comentario", "")
+    )
 
-        score = compute_interaction_score(
-            like=interaction.get("like", 0),
-            watchtime=interaction.get("watchtime", 0.0),
-            duration=interaction.get("duration"),
-            dont_suggest=interaction.get("dont_suggest", 0),
-            comment=interaction.get("comentario", "")
-        )
+    # metadata first, so a new user/video row is warm-started from it
+    _store_meta([interaction])
+    # seen before the row: a top-N list cached from the new row must not miss this video
+    # in its exclusions (topn_cache only checks that the row is unchanged)
+    redis_seen.record_interactions([interaction])
+    redis_rows.update_interaction(interaction["user_id"], interaction["video_id"], score)
+    topn_cache.invalidate_users([interaction["user_id"]])
+    metrics.INTERACTIONS_APPLIED.inc()
+    metrics.maybe_push()
 
-        model.update(interaction["user_id"], interaction["video_id"], score)
+    return {"status": "ok", "user_id": interaction["user_id"], "video_id": interaction["video_id"], "score": float(score)}
 
-        save_model(model)
-        return {"status": "ok", "user_id": interaction["user_id"], "video_id": interaction["video_id"], "score": float(score)}
-    finally:
-        lock.release()
+def process_interaction_batch(interactions: list):
+    """
+    Score a list of interaction dicts and apply them with one batched row-store update.
+    Used by the batch and stream workers (see batch_worker.py, stream_worker.py).
+    """
+    if not interactions:
+        return {"status": "ok", "applied": 0}
+    scores = [
+        compute_interaction_score(
+            like=inter.get("like", 0),
+            watchtime=inter.get("watchtime", 0.0),
+            duration=inter.get("duration"),
+            dont_suggest=inter.get("dont_suggest", 0),
+            comment=inter.get("comentario", "")
+        )
+        for inter in interactions
+    ]
+    _store_meta(interactions)
+    # seen before the rows, see process_interaction
+    redis_seen.record_interactions(interactions)
+    applied = redis_rows.apply_batch(
+        [inter["user_id"] for inter in interactions],
+        [inter["video_id"] for inter in interactions],
+        scores,
+    )
+    topn_cache.invalidate_users([inter["user_id"] for inter in interactions])
+    metrics.INTERACTIONS_APPLIED.inc(applied)
+    metrics.maybe_push()
+    return {"status": "ok", "applied": applied}
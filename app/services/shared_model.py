@@ -0,0 +1,249 @@
+# app/services/shared_model.py
+"""
+One physical copy of the serving item model for all uvicorn worker processes.
+
+MF_SHARED_DIR (a tmpfs directory such as /dev/shm/mf_model; "" disables it) holds
+
+    HEAD                    generation header (HEAD_DTYPE), memory-mapped by every process
+    <generation>.bin        item model in the model_io format: no user rows, Q as MF_QUANT
+    <generation>.centroids.npy, <generation>.assign.npy, <generation>.offsets.npy,
+    <generation>.rows.npy   IVF index and its inverted lists, when the ANN index is on (ann.py)
+
+One process, the updater, holds an exclusive lock on <dir>/LOCK. It rebuilds the item
+model from the Redis row store when the row-store version moves and publishes it as a
+new generation: the files are written and renamed first, the header last. Workers read
+the generation from the header (a memory read, no Redis round trip) and attach to a new
+one with a read-only np.memmap, so N workers map the same tmpfs pages instead of holding
+N decoded copies.
+
+The first worker to start becomes the updater (SharedModelStore.start); when it exits the
+lock is released and another worker takes over at its next poll. A dedicated updater:
+
+    MF_SHARED_DIR=/dev/shm/mf_model python -m app.services.shared_model
+
+The last MF_SHARED_KEEP generations are kept; a worker that still maps an older one keeps
+its pages until it moves on (unlinking does not unmap).
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Optional, Tuple
+import numpy as np
+from app.services import model_io
+from app.services.ann import MF_ANN_PROBE, IVFIndex, attach_from_env
+from app.services.metrics import timed
+from app.services.mf import MatrixFactorization
+from app.services.quant import MF_QUANT
+from app.services.redis import redis_meta, redis_rows
+
+MF_SHARED_DIR = os.environ.get("MF_SHARED_DIR", "")
+MF_SHARED_POLL_S = float(os.environ.get("MF_SHARED_POLL_S", 1.0))
+MF_SHARED_KEEP = max(2, int(os.environ.get("MF_SHARED_KEEP", 2)))
+
+HEAD_MAGIC = b"MFSHM\x00\x00\x01"
+# seq is odd while the updater rewrites the other fields (seqlock): readers retry
+HEAD_DTYPE = np.dtype([("magic", "S8"), ("seq", "<u8"), ("generation", "<u8"),
+                       ("version", "<i8"), ("published_at", "<f8")])
+HEAD_SIZE = 64
+
+logger = logging.getLogger(__name__)
+
+
+def _build_item_model(previous_index=None, previous_ids=None) -> Optional[MatrixFactorization]:
+    """
+    What the updater publishes: all item rows of the Redis row store, with the ANN index if
+    enabled (carried over from the previous generation's, see ann.carry_index).
+    """
+    model = redis_rows.load_model(user_ids=[])
+    return None if model is None else attach_from_env(model, previous_index, previous_ids)
+
+
+class SharedModelStore:
+    def __init__(self, directory: str, poll_s: float = MF_SHARED_POLL_S, keep: int = MF_SHARED_KEEP,
+                 quant: str = MF_QUANT):
+        self.directory = directory
+        self.poll_s = poll_s
+        self.keep = keep
+        self.quant = quant
+        self._head = None          # read-only view of HEAD
+        self._head_ino = None      # re-mapped when HEAD is recreated
+        self._lock_file = None     # held by the updater only
+        self._thread: Optional[threading.Thread] = None
+        # ANN index of the last generation this process published, and its video ids
+        self._last_index = self._last_ids = None
+        self._meta_index = None   # last metadata index whose centroids this process published
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _generation_name(generation: int) -> str:
+        return f"{generation:020d}"
+
+    # ---------- readers (every worker) ----------
+    def _map_head(self):
+        try:
+            ino = os.stat(self._path("HEAD")).st_ino
+        except FileNotFoundError:
+            self._head = self._head_ino = None
+            return None
+        if self._head is None or ino != self._head_ino:
+            self._head = np.memmap(self._path("HEAD"), dtype=HEAD_DTYPE, mode="r", shape=(1,))
+            self._head_ino = ino
+        return self._head
+
+    def current(self) -> Optional[Tuple[int, int]]:
+        """(generation, row-store version) of the latest published model, or None before the first."""
+        head = self._map_head()
+        if head is None or head["magic"][0] != HEAD_MAGIC:
+            return None
+        # seq stays odd if an updater died mid-update, until the next updater repairs it
+        for _ in range(1000):
+            seq = int(head["seq"][0])
+            if seq % 2 == 0:
+                generation, version = int(head["generation"][0]), int(head["version"][0])
+                if int(head["seq"][0]) == seq:
+                    return (generation, version) if generation else None
+            time.sleep(0)
+        return None
+
+    def attach(self) -> Optional[MatrixFactorization]:
+        """Scoring-only model over the current generation's files (nothing is copied)."""
+        for _ in range(3):
+            head = self.current()
+            if head is None:
+                return None
+            name = self._generation_name(head[0])
+            try:
+                with timed("shared_attach"):
+                    model = model_io.load(self._path(name + ".bin"), serving=True, readonly=True)
+                    if os.path.exists(self._path(name + ".assign.npy")):
+                        # generations written before the inverted lists existed have no offsets / rows
+                        arrays = {part: np.load(self._path(f"{name}.{part}.npy"), mmap_mode="r")
+                                  for part in ("centroids", "assign", "offsets", "rows")
+                                  if os.path.exists(self._path(f"{name}.{part}.npy"))}
+                        model.ann_index = IVFIndex.from_arrays(n_probe=MF_ANN_PROBE, seed=model.seed, **arrays)
+                return model
+            except FileNotFoundError:
+                # the updater moved on twice since the header was read; read it again
+                continue
+        return None
+
+    # ---------- updater (one process) ----------
+    def acquire(self, blocking: bool = False) -> bool:
+        """Become the updater (True) unless another process is."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self._path("LOCK"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _writable_head(self):
+        path = self._path("HEAD")
+        if not os.path.exists(path) or os.path.getsize(path) != HEAD_SIZE:
+            head = np.zeros(1, dtype=HEAD_DTYPE)
+            head["magic"] = HEAD_MAGIC
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(head.tobytes().ljust(HEAD_SIZE, b"\x00"))
+            os.replace(tmp, path)
+        head = np.memmap(path, dtype=HEAD_DTYPE, mode="r+", shape=(1,))
+        if head["seq"][0] % 2:
+            head["seq"] += 1   # a previous updater died mid-update
+        return head
+
+    def _write(self, name: str, write):
+        tmp = self._path(name + ".tmp")
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, self._path(name))
+
+    def publish(self, model: MatrixFactorization, version: int) -> int:
+        """Write model as the next generation and point the header at it. Updater only."""
+        if self._lock_file is None:
+            raise RuntimeError("only the process holding the shared model lock publishes")
+        head = self._writable_head()
+        generation = int(head["generation"][0]) + 1
+        name = self._generation_name(generation)
+        with timed("shared_publish"):
+            if model.ann_index is not None:
+                self._write(name + ".centroids.npy", lambda f: np.save(f, model.ann_index.centroids))
+                self._write(name + ".assign.npy", lambda f: np.save(f, model.ann_index.assign))
+                offsets, rows = model.ann_index.inverted_lists()
+                self._write(name + ".offsets.npy", lambda f: np.save(f, offsets))
+                self._write(name + ".rows.npy", lambda f: np.save(f, rows))
+            self._write(name + ".bin", lambda f: f.write(model_io.dumps(model, self.quant)))
+            head["seq"] += 1
+            head["generation"], head["version"], head["published_at"] = generation, version, time.time()
+            head["seq"] += 1
+            head.flush()
+        self._remove_before(generation - self.keep + 1)
+        return generation
+
+    def _remove_before(self, generation: int):
+        for name in os.listdir(self.directory):
+            prefix = name.split(".", 1)[0]
+            if prefix.isdigit() and int(prefix) < generation:
+                os.remove(self._path(name))
+
+    def refresh(self, build=_build_item_model, version_fn=redis_rows.get_version) -> Optional[int]:
+        """Publish a new generation if the row store moved since the last one. Returns it, or None."""
+        version = version_fn()
+        head = self.current()
+        if head is not None and head[1] == version:
+            return None
+        model = build(self._last_index, self._last_ids)
+        if model is None:
+            return None
+        generation = self.publish(model, version)
+        if model.ann_index is not None:
+            self._last_index, self._last_ids = model.ann_index, model.video_id_array
+        # the updater is the one process publishing the warm-start centroids (see redis_meta)
+        meta_index = redis_meta.refresh_index(model, self._meta_index)
+        if meta_index is not self._meta_index:
+            redis_meta.publish_centroids(meta_index)
+            self._meta_index = meta_index
+        return generation
+
+    def run_updater(self, blocking: bool = False):
+        """Poll forever; publish whenever this process holds (or gets) the updater lock."""
+        while True:
+            try:
+                if self.acquire(blocking):
+                    self.refresh()
+            except Exception:
+                logger.exception("shared model refresh failed")
+            time.sleep(self.poll_s)
+
+    def start(self):
+        """Updater thread: one per process; only the lock holder does any work."""
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run_updater, name="mf-shared-model", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()   # releases the flock
+            self._lock_file = None
+
+
+shared_store = SharedModelStore(MF_SHARED_DIR) if MF_SHARED_DIR else None
+
+
+if __name__ == "__main__":
+    if shared_store is None:
+        raise SystemExit("set MF_SHARED_DIR (e.g. /dev/shm/mf_model)")
+    logging.basicConfig(level=logging.INFO)
+    logger.info("waiting for the updater lock in %s", MF_SHARED_DIR)
+    shared_store.run_updater(blocking=True)
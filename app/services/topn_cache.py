@@ -0,0 +1,262 @@
+# app/services/topn_cache.py
+"""
+Per-user top-N result cache for /recommend.
+
+Two layers: an in-process LRU (MF_TOPN_CACHE_SIZE entries) in front of a Redis
+mirror (mf_topn_v1:<user_id>:<exclude_seen>, expiring after MF_TOPN_TTL_S), so every
+API process benefits from a list computed by another one. Each entry keeps the top
+MF_TOPN_CACHE_N videos, the user row it was computed from and the item-matrix version
+(model_cache.item_cache) at the time.
+
+Invalidation:
+  - user side, immediate: /recommend reads the user row anyway, and an entry only
+    matches the exact row bytes it was computed from. Workers also delete the Redis
+    entries of the users they update (invalidate_users).
+  - item side, lazy: an entry computed against an older item version is still served
+    for MF_TOPN_MAX_STALENESS_S seconds, then recomputed.
+
+A background refresher (MF_TOPN_REFRESH_S > 0) recomputes the entries of the
+MF_TOPN_HOT_USERS most requested users before they go stale, so hot users are served
+without a scoring pass over Q.
+"""
+import os
+import struct
+import threading
+import time
+import logging
+from collections import Counter, OrderedDict
+import numpy as np
+from app.services.redis.redis_client import redis_conn
+from app.services import metrics
+
+MF_TOPN_CACHE = os.environ.get("MF_TOPN_CACHE", "1") == "1"
+MF_TOPN_CACHE_SIZE = int(os.environ.get("MF_TOPN_CACHE_SIZE", 100_000))
+MF_TOPN_CACHE_N = int(os.environ.get("MF_TOPN_CACHE_N", 50))
+MF_TOPN_TTL_S = float(os.environ.get("MF_TOPN_TTL_S", 600))
+MF_TOPN_MAX_STALENESS_S = float(os.environ.get("MF_TOPN_MAX_STALENESS_S", 30))
+MF_TOPN_REFRESH_S = float(os.environ.get("MF_TOPN_REFRESH_S", 0))
+MF_TOPN_HOT_USERS = int(os.environ.get("MF_TOPN_HOT_USERS", 1000))
+
+TOPN_PREFIX = "mf_topn_v1:"
+# item_version, computed_at (wall clock, shared across processes), n, row bytes
+_HEADER = struct.Struct("<qdII")
+
+TOPN_LOOKUPS = metrics.registry.counter("mf_topn_cache_total", "Top-N cache lookups by result")
+
+logger = logging.getLogger(__name__)
+
+
+class Entry:
+    __slots__ = ("item_version", "computed_at", "row", "recs")
+
+    def __init__(self, item_version, computed_at, row, recs):
+        self.item_version, self.computed_at, self.row, self.recs = item_version, computed_at, row, recs
+
+    def pack(self) -> bytes:
+        ids = np.array([v for v, _ in self.recs], dtype="<i8")
+        scores = np.array([s for _, s in self.recs], dtype="<f8")
+        return (_HEADER.pack(self.item_version, self.computed_at, len(self.recs), len(self.row))
+                + self.row + ids.tobytes() + scores.tobytes())
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "Entry":
+        version, computed_at, n, row_len = _HEADER.unpack_from(raw)
+        pos = _HEADER.size
+        row = raw[pos:pos + row_len]
+        pos += row_len
+        ids = np.frombuffer(raw, dtype="<i8", count=n, offset=pos)
+        scores = np.frombuffer(raw, dtype="<f8", count=n, offset=pos + 8 * n)
+        return cls(version, computed_at, row, list(zip(ids.tolist(), scores.tolist())))
+
+
+def mirror_key(user_id, exclude_seen) -> str:
+    return f"{TOPN_PREFIX}{int(user_id)}:{int(bool(exclude_seen))}"
+
+
+class TopNCache:
+    def __init__(self, size=MF_TOPN_CACHE_SIZE, list_n=MF_TOPN_CACHE_N, ttl_s=MF_TOPN_TTL_S,
+                 max_staleness_s=MF_TOPN_MAX_STALENESS_S, enabled=MF_TOPN_CACHE):
+        self.size = size
+        self.list_n = list_n
+        self.ttl_s = ttl_s
+        self.max_staleness_s = max_staleness_s
+        self.enabled = enabled
+        self.entries = OrderedDict()   # (user_id, exclude_seen) -> Entry, LRU order
+        self.activity = Counter()      # (user_id, exclude_seen) -> recent requests
+        self.lock = threading.Lock()
+        self.thread = None
+
+    # ---------- lookups ----------
+    def _valid(self, entry, row: bytes, item_version) -> bool:
+        age = time.time() - entry.computed_at
+        if entry.row != row or age > self.ttl_s:
+            return False
+        return entry.item_version == item_version or age <= self.max_staleness_s
+
+    def get_local(self, user_id, exclude_seen, user_vector, item_version, top_n):
+        """Cached list from this process, or None. Also counts the request for the refresher."""
+        if not self.enabled or top_n > self.list_n:
+            return None
+        key = (int(user_id), bool(exclude_seen))
+        with self.lock:
+            self.activity[key] += 1
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._valid(entry, np.asarray(user_vector, dtype=np.float32).tobytes(), item_version):
+                    self.entries.move_to_end(key)
+                    TOPN_LOOKUPS.inc(result="hit_local")
+                    return entry.recs[:top_n]
+                del self.entries[key]
+        return None
+
+    def accept_mirror(self, raw, user_id, exclude_seen, user_vector, item_version, top_n):
+        """Validate a Redis mirror value (fetched by the caller); keeps it locally if usable."""
+        if raw is None:
+            TOPN_LOOKUPS.inc(result="miss")
+            return None
+        entry = Entry.unpack(raw)
+        if not self._valid(entry, np.asarray(user_vector, dtype=np.float32).tobytes(), item_version):
+            TOPN_LOOKUPS.inc(result="stale")
+            return None
+        self._store_local((int(user_id), bool(exclude_seen)), entry)
+        TOPN_LOOKUPS.inc(result="hit_redis")
+        return entry.recs[:top_n]
+
+    def get(self, user_id, exclude_seen, user_vector, item_version, top_n):
+        recs = self.get_local(user_id, exclude_seen, user_vector, item_version, top_n)
+        if recs is not None or not self.enabled or top_n > self.list_n:
+            return recs
+        with metrics.timed("topn_mirror"):
+            raw = redis_conn.get(mirror_key(user_id, exclude_seen))
+        return self.accept_mirror(raw, user_id, exclude_seen, user_vector, item_version, top_n)
+
+    # ---------- writes ----------
+    def _store_local(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def put(self, user_id, exclude_seen, user_vector, item_version, recs, pipe=None):
+        if not self.enabled:
+            return
+        entry = Entry(int(item_version or 0), time.time(),
+                      np.asarray(user_vector, dtype=np.float32).tobytes(), list(recs))
+        self._store_local((int(user_id), bool(exclude_seen)), entry)
+        (pipe or redis_conn).set(mirror_key(user_id, exclude_seen), entry.pack(), ex=max(1, int(self.ttl_s)))
+
+    def compute(self, model, item_version, user_id, user_vector, exclude, exclude_seen, top_n, pipe=None):
+        """Score, cache the top list_n and return the top top_n."""
+        recs = model.recommend_for_vector(user_vector, top_n=max(top_n, self.list_n), exclude_seen=exclude)
+        if top_n <= self.list_n:
+            self.put(user_id, exclude_seen, user_vector, item_version, recs[:self.list_n], pipe=pipe)
+        return recs[:top_n]
+
+    def compute_many(self, model, item_version, user_ids, user_vectors, excludes, exclude_seen, top_n, pipe=None):
+        """compute for many users with one blocked scoring pass (model.recommend_for_vectors)."""
+        all_recs = model.recommend_for_vectors(user_vectors, top_n=max(top_n, self.list_n), exclude_seen=excludes)
+        if top_n <= self.list_n and self.enabled:
+            out = pipe or redis_conn.pipeline(transaction=False)
+            for uid, vec, recs in zip(user_ids, user_vectors, all_recs):
+                self.put(uid, exclude_seen, vec, item_version, recs[:self.list_n], pipe=out)
+            if pipe is None:
+                out.execute()
+        return [recs[:top_n] for recs in all_recs]
+
+    def recommend_batch(self, model, item_version, user_ids, user_vectors, excludes, exclude_seen, top_n):
+        """
+        /recommend/batch: cached lists where the local layer has them, one compute_many for
+        the rest. user_vectors / excludes follow user_ids; users without a row get None.
+        """
+        out = [None] * len(user_ids)
+        misses = []
+        for i, (uid, vec) in enumerate(zip(user_ids, user_vectors)):
+            if vec is not None:
+                out[i] = self.get_local(uid, exclude_seen, vec, item_version, top_n)
+                if out[i] is None:
+                    misses.append(i)
+        if misses:
+            recs = self.compute_many(model, item_version, [user_ids[i] for i in misses],
+                                     np.stack([user_vectors[i] for i in misses]),
+                                     None if excludes is None else [excludes[i] for i in misses],
+                                     exclude_seen, top_n)
+            for i, r in zip(misses, recs):
+                out[i] = r
+        return out
+
+    def invalidate_users(self, user_ids, pipe=None):
+        """Drop the entries of users whose row changed (both layers)."""
+        uids = {int(u) for u in user_ids}
+        if not uids:
+            return
+        with self.lock:
+            for uid in uids:
+                self.entries.pop((uid, True), None)
+                self.entries.pop((uid, False), None)
+        keys = [mirror_key(uid, flag) for uid in uids for flag in (True, False)]
+        (pipe or redis_conn).delete(*keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.activity.clear()
+
+    # ---------- hot users ----------
+    def refresh_hot(self, model_fn, n=MF_TOPN_HOT_USERS) -> int:
+        """
+        Recompute the entries of the n most requested (user, exclude_seen) keys that are
+        missing or built against an older item version. Returns how many were recomputed.
+        """
+        from app.services.redis import redis_rows, redis_seen
+        model, version = model_fn()
+        if model is None:
+            return 0
+        with self.lock:
+            hot = [key for key, _ in self.activity.most_common(n)]
+            # decay, so the set follows current traffic
+            self.activity = Counter({k: c // 2 for k, c in self.activity.items() if c > 1})
+            # missing, or built on an older item version and past half the staleness budget
+            now = time.time()
+            due = [key for key in hot
+                   if key not in self.entries or (self.entries[key].item_version != version and
+                                                  now - self.entries[key].computed_at > self.max_staleness_s / 2)]
+        if not due:
+            return 0
+        uids = [uid for uid, _ in due]
+        vecs = redis_rows.load_user_rows(uids)
+        excluded = redis_seen.load_excluded_many(uids)
+        out = redis_conn.pipeline(transaction=False)
+        done = 0
+        for flag in (True, False):
+            batch = [(uid, vec, ex) for (uid, excl), vec, ex in zip(due, vecs, excluded)
+                     if excl == flag and vec is not None]
+            if batch:
+                # one blocked scoring pass (P[block] @ Q.T) for all due users of this flag
+                batch_uids, batch_vecs, batch_excludes = zip(*batch)
+                self.compute_many(model, version, batch_uids, np.stack(batch_vecs),
+                                  batch_excludes if flag else None, flag, self.list_n, pipe=out)
+                done += len(batch)
+        out.execute()
+        return done
+
+    def start_refresher(self, model_fn, interval_s=MF_TOPN_REFRESH_S):
+        if self.thread is not None or interval_s <= 0 or not self.enabled:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    with metrics.timed("topn_refresh"):
+                        n = self.refresh_hot(model_fn)
+                    if n:
+                        logger.debug("refreshed %d hot top-N lists", n)
+                except Exception:
+                    logger.exception("top-N refresh failed")
+
+        self.thread = threading.Thread(target=run, name="mf-topn-refresh", daemon=True)
+        self.thread.start()
+
+
+topn_cache = TopNCache()
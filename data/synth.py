@@ -0,0 +1,304 @@
+"""
+Vectorized, seeded synthetic data pipeline (users, videos, interactions).
+
+Same columns and preference rules as the original generators, but every chunk is built
+with NumPy, chunks are generated in parallel worker processes and streamed to CSV or
+Parquet, so 100M interactions fit in bounded memory.
+
+    python synth.py users --n 1000 --out usuarios.csv
+    python synth.py videos --n 500 --out videos.csv
+    python synth.py interactions --n 100000000 --users usuarios.csv --videos videos.csv \\
+        --out interacciones.parquet --format parquet --workers 8 --popularity-skew 1.1
+
+Preference model (as in interaction-generator.py): like probability is 0.7 when the
+video's category or one of its styles is among the user's preferences and 0.1
+otherwise; watchtime is uniform 60-600s with a like and 5-60s without; 50% of rows
+carry a comment; 1% are dont_suggest. --popularity-skew s draws videos with
+P(rank r) ~ 1 / r^s (0 = uniform, as before) and --activity-skew does the same for users.
+"""
+import argparse
+import ast
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+CATEGORIAS = ['tutorial', 'performance', 'freestyle', 'battle', 'class', 'challenge', 'duet']
+ETIQUETAS_POSIBLES = ['energia', 'nivel_facil', 'nivel_medio', 'nivel_avanzado', 'pareja', 'grupo', 'solo', 'ritmo', 'coreografia', 'creatividad']
+DANCE_STYLES = ['salsa', 'hiphop', 'ballet', 'contemporary', 'jazz', 'flamenco', 'breakdance']
+
+FIRST_NAMES = ['Ana', 'Luis', 'Maria', 'Carlos', 'Lucia', 'Javier', 'Sofia', 'Pablo', 'Elena', 'Diego',
+               'Laura', 'Miguel', 'Carmen', 'Andres', 'Paula', 'Jorge', 'Marta', 'Raul', 'Sara', 'Ivan']
+LAST_NAMES = ['Garcia', 'Lopez', 'Martinez', 'Sanchez', 'Perez', 'Gomez', 'Martin', 'Jimenez', 'Ruiz', 'Hernandez',
+              'Diaz', 'Moreno', 'Alvarez', 'Romero', 'Navarro', 'Torres', 'Dominguez', 'Vazquez', 'Ramos', 'Gil']
+WORDS = ['dance', 'move', 'step', 'rhythm', 'beat', 'flow', 'style', 'energy', 'great', 'amazing', 'practice',
+         'class', 'music', 'groove', 'spin', 'jump', 'turn', 'learn', 'show', 'crew', 'night', 'stage', 'light', 'fire']
+
+# extra test users appended by user-generator.py
+TEST_USERS = [
+    {'name': "Walter White", 'edad': 50, 'danceStyles': ['jazz'], 'categorias_preferidas': ['tutorial', 'challenge']},
+    {'name': "Manolo", 'edad': 35, 'danceStyles': ['salsa', 'flamenco'], 'categorias_preferidas': ['duet']},
+    {'name': "Emo", 'edad': 27, 'danceStyles': ['hiphop', 'breakdance'], 'categorias_preferidas': ['freestyle', 'battle', 'challenge']},
+]
+
+
+# ---------- helpers ----------
+def _mask_reprs(options):
+    """repr of the option list for every bitmask, e.g. mask 0b101 -> "['a', 'c']" (lookup table)."""
+    return np.array([str([o for i, o in enumerate(options) if m >> i & 1]) for m in range(1 << len(options))],
+                    dtype=object)
+
+
+def _random_masks(rng, n, n_options, k_min, k_max):
+    """n bitmasks, each with between k_min and k_max distinct bits out of n_options."""
+    k = rng.integers(k_min, k_max + 1, n)
+    ranks = np.argsort(rng.random((n, n_options)), axis=1)
+    chosen = ranks < k[:, None]          # first k of a random permutation
+    return (chosen * (1 << np.arange(n_options))).sum(axis=1).astype(np.int64)
+
+
+def _mask_from_list(values, options):
+    index = {o: i for i, o in enumerate(options)}
+    mask = 0
+    for v in values:
+        if v in index:
+            mask |= 1 << index[v]
+    return mask
+
+
+def _zipf_cdf(n, skew):
+    if skew <= 0:
+        return None
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return np.cumsum(weights / weights.sum())
+
+
+def _draw(rng, n_items, n, cdf):
+    if cdf is None:
+        return rng.integers(0, n_items, n)
+    return np.minimum(np.searchsorted(cdf, rng.random(n)), n_items - 1)
+
+
+_SENTENCE_POOLS = {}
+
+
+def _sentences(rng, n, min_words, max_words, pool_size=8192):
+    """n random sentences, drawn from a fixed pool so no Python loop runs per row."""
+    key = (min_words, max_words)
+    pool = _SENTENCE_POOLS.get(key)
+    if pool is None:
+        prng = np.random.default_rng(key)
+        words = np.array(WORDS, dtype=object)
+        lengths = prng.integers(min_words, max_words + 1, pool_size)
+        picks = words[prng.integers(0, len(WORDS), (pool_size, max_words))]
+        pool = _SENTENCE_POOLS[key] = np.array(
+            [" ".join(row[:k]).capitalize() for row, k in zip(picks, lengths)], dtype=object)
+    return pool[rng.integers(0, len(pool), n)]
+
+
+# ---------- chunk builders (run in worker processes) ----------
+def users_chunk(start, n, seed):
+    rng = np.random.default_rng(seed)
+    styles = _random_masks(rng, n, len(DANCE_STYLES), 1, 3)
+    cats = _random_masks(rng, n, len(CATEGORIAS), 2, 4)
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), n)]
+    last = np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), n)]
+    return pd.DataFrame({
+        'id': np.arange(start, start + n),
+        'name': first + " " + last,
+        'edad': rng.integers(13, 61, n),
+        'danceStyles': _mask_reprs(DANCE_STYLES)[styles],
+        'categorias_preferidas': _mask_reprs(CATEGORIAS)[cats],
+    })
+
+
+def videos_chunk(start, n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': np.arange(start, start + n),
+        'videoTitle': _sentences(rng, n, 2, 5),
+        'etiquetas': _mask_reprs(ETIQUETAS_POSIBLES)[_random_masks(rng, n, len(ETIQUETAS_POSIBLES), 2, 5)],
+        'categoria': np.array(CATEGORIAS, dtype=object)[rng.integers(0, len(CATEGORIAS), n)],
+        'estilo': _mask_reprs(DANCE_STYLES)[_random_masks(rng, n, len(DANCE_STYLES), 1, 2)],
+    })
+
+
+# interaction workers receive the encoded catalog once, through the pool initializer
+_CTX = {}
+
+
+def _init_interactions(ctx):
+    _CTX.update(ctx)
+    _CTX["user_cdf"] = _zipf_cdf(len(ctx["user_ids"]), ctx["activity_skew"])
+    _CTX["video_cdf"] = _zipf_cdf(len(ctx["video_ids"]), ctx["popularity_skew"])
+
+
+def interactions_chunk(start, n, seed):
+    ctx = _CTX
+    rng = np.random.default_rng(seed)
+    u = _draw(rng, len(ctx["user_ids"]), n, ctx["user_cdf"])
+    v = _draw(rng, len(ctx["video_ids"]), n, ctx["video_cdf"])
+    match = (((ctx["user_cats"][u] >> ctx["video_cat"][v]) & 1) == 1) | ((ctx["user_styles"][u] & ctx["video_styles"][v]) != 0)
+    like = rng.random(n) < np.where(match, 0.7, 0.1)
+    watchtime = np.where(like, rng.uniform(60.0, 600.0, n), rng.uniform(5.0, 60.0, n)).round(2)
+    comentario = np.where(rng.random(n) < 0.5, _sentences(rng, n, 3, 10), None)
+    return pd.DataFrame({
+        'id': np.arange(start, start + n),
+        'user_id': ctx["user_ids"][u],
+        'video_id': ctx["video_ids"][v],
+        'like': like.astype(np.int8),
+        'comentario': comentario,
+        'watchtime': watchtime,
+        'dont_suggest': (rng.random(n) < 0.01).astype(np.int8),
+    })
+
+
+def encode_catalog(users_df, videos_df):
+    """Preferences and video attributes as bitmasks (list columns are parsed once per row)."""
+    def as_list(value):
+        return ast.literal_eval(value) if isinstance(value, str) else (value or [])
+    style_col = 'danceStyles' if 'danceStyles' in users_df else 'estilos_preferidos'
+    return {
+        "user_ids": users_df['id'].to_numpy(np.int64),
+        "user_cats": np.array([_mask_from_list(as_list(x), CATEGORIAS) for x in users_df['categorias_preferidas']], dtype=np.int64),
+        "user_styles": np.array([_mask_from_list(as_list(x), DANCE_STYLES) for x in users_df[style_col]], dtype=np.int64),
+        "video_ids": videos_df['id'].to_numpy(np.int64),
+        "video_cat": np.array([CATEGORIAS.index(c) if c in CATEGORIAS else 0 for c in videos_df['categoria']], dtype=np.int64),
+        "video_styles": np.array([_mask_from_list(as_list(x), DANCE_STYLES) for x in videos_df['estilo']], dtype=np.int64),
+    }
+
+
+# ---------- streaming output ----------
+class ChunkWriter:
+    """Appends DataFrame chunks to a CSV or Parquet file."""
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt or ('parquet' if path.endswith('.parquet') else 'csv')
+        self.rows = 0
+        self._parquet = None
+        if self.fmt == 'csv' and os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        if isinstance(df, bytes):
+            # CSV chunk already rendered by a worker (see _build)
+            with open(self.path, 'ab') as f:
+                f.write(df if self.rows == 0 else df.split(b"\n", 1)[1])
+            self.rows += df.count(b"\n") - 1
+            return
+        if self.fmt == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as exc:
+                raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)") from exc
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode='a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def _build(builder, fmt, start, n, seed):
+    df = builder(start, n, seed)
+    if fmt == 'csv':
+        return df.to_csv(index=False).encode()
+    return df
+
+
+def generate(builder, total, writer, chunk_size=1_000_000, workers=None, seed=0, initializer=None, initargs=()):
+    """
+    Build total rows in chunks on a process pool and write them in order.
+    At most 2 chunks per worker are in flight, so memory stays bounded.
+    Each chunk gets its own child seed, so output does not depend on the worker count.
+    """
+    starts = list(range(0, total, chunk_size))
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        if initializer:
+            initializer(*initargs)
+        for start, child in zip(starts, seeds):
+            writer.write(_build(builder, writer.fmt, start, min(chunk_size, total - start), child))
+        return writer.rows
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        pending = []
+        for start, child in zip(starts, seeds):
+            pending.append(pool.submit(_build, builder, writer.fmt, start, min(chunk_size, total - start), child))
+            if len(pending) >= 2 * workers:
+                writer.write(pending.pop(0).result())
+        for fut in pending:
+            writer.write(fut.result())
+    return writer.rows
+
+
+def generate_users(n, out, fmt=None, seed=0, workers=None, chunk_size=1_000_000, test_users=True):
+    writer = ChunkWriter(out, fmt)
+    generate(users_chunk, n, writer, chunk_size=chunk_size, workers=workers, seed=seed)
+    if test_users:
+        extra = pd.DataFrame([dict(id=n + i, **u) for i, u in enumerate(TEST_USERS)])
+        extra['danceStyles'] = extra['danceStyles'].map(str)
+        extra['categorias_preferidas'] = extra['categorias_preferidas'].map(str)
+        writer.write(extra)
+    writer.close()
+    return writer.rows
+
+
+def generate_videos(n, out, fmt=None, seed=0, workers=None, chunk_size=1_000_000):
+    writer = ChunkWriter(out, fmt)
+    generate(videos_chunk, n, writer, chunk_size=chunk_size, workers=workers, seed=seed)
+    writer.close()
+    return writer.rows
+
+
+def _read_table(path):
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
+
+def generate_interactions(n, out, users_path, videos_path, fmt=None, seed=0, workers=None,
+                          chunk_size=1_000_000, popularity_skew=0.0, activity_skew=0.0):
+    ctx = encode_catalog(_read_table(users_path), _read_table(videos_path))
+    ctx["popularity_skew"] = popularity_skew
+    ctx["activity_skew"] = activity_skew
+    writer = ChunkWriter(out, fmt)
+    generate(interactions_chunk, n, writer, chunk_size=chunk_size, workers=workers, seed=seed,
+             initializer=_init_interactions, initargs=(ctx,))
+    writer.close()
+    return writer.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic users/videos/interactions")
+    parser.add_argument("kind", choices=["users", "videos", "interactions"])
+    parser.add_argument("--n", type=int, required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--users", default="usuarios.csv")
+    parser.add_argument("--videos", default="videos.csv")
+    parser.add_argument("--popularity-skew", type=float, default=0.0)
+    parser.add_argument("--activity-skew", type=float, default=0.0)
+    args = parser.parse_args()
+
+    common = dict(fmt=args.format, seed=args.seed, workers=args.workers, chunk_size=args.chunk_size)
+    if args.kind == "users":
+        rows = generate_users(args.n, args.out, **common)
+    elif args.kind == "videos":
+        rows = generate_videos(args.n, args.out, **common)
+    else:
+        rows = generate_interactions(args.n, args.out, args.users, args.videos,
+                                     popularity_skew=args.popularity_skew, activity_skew=args.activity_skew, **common)
+    print(f"Generadas {rows} filas en '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,17 @@
-import random
-import pandas as pd
-from faker import Faker
-
-fake = Faker()
+import argparse
+from synth import generate_videos
 
 # Configuración
 NUM_VIDEOS = 500
 
-# Categorías y etiquetas posibles
-categorias = ['tutorial', 'performance', 'freestyle', 'battle', 'class', 'challenge', 'duet']
-etiquetas_posibles = ['energia', 'nivel_facil', 'nivel_medio', 'nivel_avanzado', 'pareja', 'grupo', 'solo', 'ritmo', 'coreografia', 'creatividad']
-DANCE_STYLES = ['salsa', 'hiphop', 'ballet', 'contemporary', 'jazz', 'flamenco', 'breakdance']
-
-# Generar vídeos
-videos = []
-
-for i in range(NUM_VIDEOS):
-    title = fake.sentence(nb_words=random.randint(2, 5)).rstrip(".")
-    categoria = random.choice(categorias)
-    etiquetas = random.sample(etiquetas_posibles, k=random.randint(2, 5))
-    estilo = random.sample(DANCE_STYLES, k=random.randint(1, 2))
-
-    videos.append({
-        'id': i,
-        'videoTitle': title,
-        'etiquetas': etiquetas,
-        'categoria': categoria,
-        'estilo': estilo
-    })
-
-# Convertir a DataFrame
-df_videos = pd.DataFrame(videos)
+parser = argparse.ArgumentParser(description="Genera vídeos sintéticos (ver synth.py)")
+parser.add_argument("--n", type=int, default=NUM_VIDEOS)
+parser.add_argument("--out", default="videos.csv")
+parser.add_argument("--format", choices=["csv", "parquet"], default=None)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--workers", type=int, default=None)
+args = parser.parse_args()
 
-# Guardar como CSV
-df_videos.to_csv("videos.csv", index=False)
+generate_videos(args.n, args.out, fmt=args.format, seed=args.seed, workers=args.workers)
 
-print(f"Generados {NUM_VIDEOS} vídeos en 'videos.csv'")
+print(f"Generados {args.n} vídeos en '{args.out}'")
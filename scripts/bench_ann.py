@@ -0,0 +1,45 @@
+# scripts/bench_ann.py
+"""
+Recall and latency of the IVF index (app/services/ann.py) against brute-force scoring.
+
+    python scripts/bench_ann.py --videos 100000 1000000 --lists 1024 --probe 8 16
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services.mf import MatrixFactorization  # noqa: E402
+from app.services import ann  # noqa: E402
+
+
+def build_model(n_videos, k, n_topics=64, seed=1):
+    # clustered item factors, closer to a trained Q than isotropic noise
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(0, 1.0, size=(n_topics, k))
+    Q = topics[rng.integers(0, n_topics, n_videos)] + rng.normal(0, 0.3, size=(n_videos, k))
+    return MatrixFactorization.from_arrays([], np.zeros((0, k)), np.arange(n_videos), Q, k=k)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--k", type=int, default=32)
+    parser.add_argument("--lists", type=int, default=0, help="0 = sqrt(#videos)")
+    parser.add_argument("--probe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    for n in args.videos:
+        model = build_model(n, args.k)
+        queries = np.random.default_rng(3).normal(0, 1.0, size=(args.queries, args.k)).astype(np.float32)
+        model.enable_ann(n_lists=args.lists or None)
+        for probe in args.probe:
+            print(json.dumps(ann.evaluate(model, queries, top_n=args.top_n, n_probe=probe)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# scripts/bench_quant.py
+"""
+Quantized item factors (app/services/quant.py) against float32, on a model trained on
+the synthetic interactions of scripts/benchmarks.py.
+
+For every mode it reports the memory of Q, the snapshot size, model_io dumps/loads time,
+the /recommend scoring latency and the top-N overlap with the float32 ranking
+(mean |top_n(quant) & top_n(f32)| / top_n over the sampled users).
+
+    python scripts/bench_quant.py --users 20000 --videos 200000 --interactions 2000000
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services.mf import MatrixFactorization  # noqa: E402
+from app.services.helpers import compute_interaction_scores  # noqa: E402
+from app.services import model_io  # noqa: E402
+from scripts.benchmarks import measure, synthetic_interactions  # noqa: E402
+
+
+def train(n_users, n_videos, n_interactions, k, epochs, seed=0):
+    users, videos, like, watchtime, dont = synthetic_interactions(n_users, n_videos, n_interactions, seed)
+    ratings = compute_interaction_scores(like, watchtime, dont_suggest=dont)
+    model = MatrixFactorization(k=k, seed=seed)
+    model.add_users(range(n_users))
+    model.add_videos(range(n_videos))
+    for _ in range(epochs):
+        for i in range(0, n_interactions, 4096):
+            model.update_batch(users[i:i + 4096], videos[i:i + 4096], ratings[i:i + 4096])
+    return model
+
+
+def ids(recs):
+    return {v for v, _ in recs}
+
+
+def report(model, mode, user_ids, top_n, reference):
+    serving = model
+    if mode != "none":
+        # what the API holds: a scoring-only copy of the snapshot
+        serving = model_io.loads(model_io.dumps(model, mode), serving=True)
+    blob = model_io.dumps(model, mode)
+    vectors = [model.P[model.user_map[u]] for u in user_ids]
+    recs = [serving.recommend_for_vector(vec, top_n=top_n) for vec in vectors]
+    overlap = np.mean([len(ids(r) & ids(ref)) / top_n for r, ref in zip(recs, reference)]) if reference else 1.0
+    it = iter(range(10 ** 9))
+    latency = measure(lambda: serving.recommend_for_vector(vectors[next(it) % len(vectors)], top_n=top_n), 50)
+    return recs, {
+        "mode": mode,
+        "q_mb": round(serving.item_nbytes / 2 ** 20, 2),
+        "snapshot_mb": round(len(blob) / 2 ** 20, 2),
+        "dumps_ms": round(float(measure(lambda: model_io.dumps(model, mode), 3).mean() * 1000), 2),
+        "loads_ms": round(float(measure(lambda: model_io.loads(blob, serving=True), 3).mean() * 1000), 2),
+        "recommend_p50_ms": round(float(np.percentile(latency, 50) * 1000), 3),
+        "recommend_p95_ms": round(float(np.percentile(latency, 95) * 1000), 3),
+        f"overlap@{top_n}": round(float(overlap), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="float32 vs f16 vs int8 item factors")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--videos", type=int, default=200_000)
+    parser.add_argument("--interactions", type=int, default=2_000_000)
+    parser.add_argument("--k", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    model = train(args.users, args.videos, args.interactions, args.k, args.epochs)
+    user_ids = np.random.default_rng(3).choice(args.users, size=min(args.queries, args.users), replace=False).tolist()
+    reference = None
+    for mode in ("none", "f16", "int8"):
+        recs, row = report(model, mode, user_ids, args.top_n, reference)
+        reference = reference or recs
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# scripts/bench_shards.py
+"""
+Worker throughput against a local Redis for different shard counts.
+
+For each shard count S, S worker processes run with MF_USER_SHARDS=MF_ITEM_SHARDS=S,
+each applying batches of interactions whose users belong to its own user shard
+(what the shard-routed queue delivers). Reports interactions/s per configuration.
+
+    python scripts/bench_shards.py --shards 1 2 4 8 --interactions 200000 --batch 500
+
+Uses REDIS_HOST / REDIS_PORT / REDIS_DB like the app and wipes the row store.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+WORKER = """
+import sys, time, numpy as np
+sys.path.insert(0, {root!r})
+from app.services.redis import redis_rows
+shard, n, batch, n_users, n_videos = {shard}, {n}, {batch}, {n_users}, {n_videos}
+rng = np.random.default_rng(shard)
+users = rng.integers(0, n_users // redis_rows.MF_USER_SHARDS, n) * redis_rows.MF_USER_SHARDS + shard
+videos = rng.integers(0, n_videos, n)
+ratings = rng.uniform(0.0, 1.0, n).astype(np.float32)
+t0 = time.perf_counter()
+for i in range(0, n, batch):
+    redis_rows.apply_batch(users[i:i + batch], videos[i:i + batch], ratings[i:i + batch])
+print(time.perf_counter() - t0)
+"""
+
+
+def run(shards, total, batch, n_users, n_videos):
+    env = dict(os.environ, MF_USER_SHARDS=str(shards), MF_ITEM_SHARDS=str(shards))
+    subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {ROOT!r}); "
+                    "from app.services.redis import redis_rows; redis_rows.reset_model(); redis_rows.init_meta()"],
+                   env=env, check=True)
+    per_worker = total // shards
+    t0 = time.perf_counter()
+    procs = [subprocess.Popen([sys.executable, "-c", WORKER.format(
+        root=ROOT, shard=s, n=per_worker, batch=batch, n_users=n_users, n_videos=n_videos)],
+        env=env, stdout=subprocess.PIPE, text=True) for s in range(shards)]
+    for p in procs:
+        p.communicate()
+    elapsed = time.perf_counter() - t0
+    return {"shards": shards, "interactions": per_worker * shards, "seconds": elapsed,
+            "per_s": per_worker * shards / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded worker throughput")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--interactions", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--videos", type=int, default=20_000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    base = None
+    for shards in args.shards:
+        res = run(shards, args.interactions, args.batch, args.users, args.videos)
+        base = base or res["per_s"]
+        res["speedup"] = res["per_s"] / base
+        if args.json:
+            print(json.dumps(res))
+        else:
+            print(f"shards={shards:<3} {res['per_s']:12.0f} interactions/s  x{res['speedup']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# scripts/bench_shared_model.py
+"""
+Memory of N serving processes: each decoding its own item model (what every uvicorn
+worker did) against all of them mapping one generation published by
+app/services/shared_model.py.
+
+Workers load the model, score a few queries (every page of Q is touched) and report
+RSS and PSS from /proc/self/smaps_rollup while all of them are alive. PSS splits shared
+pages between the processes mapping them, so the PSS sum is the physical memory used.
+A second generation is published at the end to check that workers pick it up.
+
+    python scripts/bench_shared_model.py --workers 4 --videos 1000000 --k 32
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services import model_io  # noqa: E402
+from app.services.mf import MatrixFactorization  # noqa: E402
+from app.services.shared_model import SharedModelStore  # noqa: E402
+
+
+def item_model(n_videos, k, seed):
+    Q = np.random.default_rng(seed).normal(0.0, 0.1, size=(n_videos, k)).astype(np.float32)
+    return MatrixFactorization.from_arrays([], np.zeros((0, k), dtype=np.float32), range(n_videos), Q, k=k)
+
+
+def memory_kb():
+    out = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                out[name.lower() + "_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    return out
+
+
+def worker(mode, directory, blob_path, barrier, results):
+    store = SharedModelStore(directory)
+    if mode == "shared":
+        model = store.attach()
+    else:
+        # a private decoded copy, as each process got from Redis
+        model = model_io.load(blob_path, mmap=False)
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(5):
+        model.recommend_for_vector(rng.normal(size=model.k).astype(np.float32), top_n=10)
+    barrier.wait()
+    row = {"mode": mode, **memory_kb()}
+    barrier.wait()
+    if mode == "shared":
+        try:
+            model.Q[0, 0] = 1.0
+            row["read_only"] = False
+        except ValueError:
+            row["read_only"] = True
+        barrier.wait()   # the parent publishes generation 2
+        barrier.wait()
+        row["generation"] = store.current()[0]
+    results.put(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-process vs shared item model memory")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--videos", type=int, default=1_000_000)
+    parser.add_argument("--k", type=int, default=32)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="mf_shared_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    try:
+        store = SharedModelStore(directory, quant="none")
+        assert store.acquire()
+        model = item_model(args.videos, args.k, seed=0)
+        store.publish(model, version=1)
+        blob_path = os.path.join(directory, "private.bin")
+        model_io.save(model, blob_path, quant="none")
+        print(json.dumps({"q_mb": round(model.Q.nbytes / 2 ** 20, 1), "workers": args.workers}))
+
+        ctx = mp.get_context("spawn")
+        for mode in ("private", "shared"):
+            barrier, results = ctx.Barrier(args.workers + 1), ctx.Queue()
+            procs = [ctx.Process(target=worker, args=(mode, directory, blob_path, barrier, results))
+                     for _ in range(args.workers)]
+            for p in procs:
+                p.start()
+            barrier.wait()
+            barrier.wait()
+            if mode == "shared":
+                barrier.wait()
+                store.publish(item_model(args.videos, args.k, seed=1), version=2)
+                barrier.wait()
+            rows = [results.get() for _ in procs]
+            for p in procs:
+                p.join()
+            print(json.dumps({"mode": mode, "rss_mb_per_worker": rows[0]["rss_mb"],
+                              "pss_mb_total": round(sum(r["pss_mb"] for r in rows), 1),
+                              **({"read_only": all(r["read_only"] for r in rows),
+                                  "saw_generation": sorted({r["generation"] for r in rows})}
+                                 if mode == "shared" else {})}))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# scripts/bench_stream.py
+"""
+Throughput of the stream interaction transport (app/services/redis/stream_worker.py)
+against one RQ job per interaction, on the Redis of REDIS_HOST / REDIS_PORT / REDIS_DB.
+
+    python scripts/bench_stream.py --events 200000 --apply none
+    python scripts/bench_stream.py --events 50000 --apply model --compare-rq
+
+  produce   add_interactions in --chunk sized calls (one pipelined XADD per event), as /interact
+  consume   stream_worker.run_once until the stream is drained; --apply none only reads and
+            acknowledges, --apply model runs process_interaction_batch (row store, seen, top-N)
+  reclaim   a consumer reads a batch and "dies" without acknowledging; a second one claims it
+  memory    Redis used_memory per queued event, stream vs RQ (--compare-rq)
+
+It deletes the interaction streams and the RQ queues of REDIS_DB: use a scratch database.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services.redis import redis_queue, stream_worker  # noqa: E402
+from app.services.redis.redis_client import redis_conn  # noqa: E402
+from app.services.redis.redis_rows import MF_USER_SHARDS  # noqa: E402
+
+
+def events(n, n_users, n_videos, seed=0):
+    rng = np.random.default_rng(seed)
+    users, videos = rng.integers(0, n_users, n), rng.integers(0, n_videos, n)
+    likes, watch = rng.random(n) < 0.3, rng.uniform(5.0, 600.0, n).round(2)
+    return [{"user_id": int(u), "video_id": int(v), "like": int(l), "watchtime": float(w), "dont_suggest": 0}
+            for u, v, l, w in zip(users, videos, likes, watch)]
+
+
+def reset():
+    keys = [redis_queue.stream_key(s) for s in range(MF_USER_SHARDS)]
+    redis_conn.delete(*keys, *[k + ":dead" for k in keys])
+    for q in redis_queue.interaction_queues:
+        q.empty()
+
+
+def used_memory():
+    return int(redis_conn.info("memory")["used_memory"])
+
+
+def produce(payloads, chunk):
+    t0 = time.perf_counter()
+    for i in range(0, len(payloads), chunk):
+        redis_queue.add_interactions(payloads[i:i + chunk])
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stream vs RQ interaction transport")
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--videos", type=int, default=5_000)
+    parser.add_argument("--chunk", type=int, default=100, help="events per /interact call")
+    parser.add_argument("--batch", type=int, default=stream_worker.MF_BATCH_MAX, help="events per XREADGROUP batch")
+    parser.add_argument("--apply", choices=["none", "model"], default="none")
+    parser.add_argument("--compare-rq", action="store_true")
+    args = parser.parse_args()
+
+    payloads = events(args.events, args.users, args.videos)
+    reset()
+    redis_queue.ensure_stream_groups()
+    mem0 = used_memory()
+    produce_s = produce(payloads, args.chunk)
+    stream_bytes = (used_memory() - mem0) / len(payloads)
+
+    apply = (lambda batch: None) if args.apply == "none" else stream_worker.process_interaction_batch
+    consumed, t0 = 0, time.perf_counter()
+    while consumed < len(payloads):
+        got = stream_worker.run_once("bench-0", max_items=args.batch, max_wait_ms=0, apply=apply)
+        if not got:
+            break
+        consumed += got
+    consume_s = time.perf_counter() - t0
+    trimmed = redis_queue.trim_streams()
+    print(json.dumps({"transport": "stream", "events": len(payloads), "apply": args.apply,
+                      "produce_per_s": round(len(payloads) / produce_s), "consume_per_s": round(consumed / consume_s),
+                      "consumed": consumed, "trimmed": trimmed, "bytes_per_event": round(stream_bytes),
+                      "depth_after": redis_queue.stream_depth()}))
+
+    # reclaim: bench-1 reads a batch and dies; bench-2 takes it over
+    redis_queue.add_interactions(payloads[:args.batch])
+    lost = redis_queue.read_stream("bench-1", max_items=args.batch, max_wait_ms=0)
+    time.sleep(0.05)
+    reclaimed = stream_worker.reclaim("bench-2", min_idle_ms=10, max_items=args.batch, apply=apply)
+    print(json.dumps({"reclaim": {"read_by_dead_consumer": sum(len(v) for v in lost.values()),
+                                  "reclaimed": reclaimed, "depth_after": redis_queue.stream_depth()}}))
+
+    if args.compare_rq:
+        mem0 = used_memory()
+        t0 = time.perf_counter()
+        for i in range(0, len(payloads), args.chunk):
+            redis_queue.enqueue_interactions(payloads[i:i + args.chunk])
+        rq_s = time.perf_counter() - t0
+        print(json.dumps({"transport": "rq", "events": len(payloads), "produce_per_s": round(len(payloads) / rq_s),
+                          "bytes_per_event": round((used_memory() - mem0) / len(payloads))}))
+    reset()
+
+
+if __name__ == "__main__":
+    main()
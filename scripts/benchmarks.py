@@ -0,0 +1,229 @@
+# scripts/benchmarks.py
+"""
+Micro-benchmark suite for the model and scoring hot paths.
+
+    python scripts/benchmarks.py                         # run everything, print a table
+    python scripts/benchmarks.py --json bench.json       # also write machine-readable results
+    python scripts/benchmarks.py --only recommend update
+    python scripts/benchmarks.py --compare baseline.json --max-regression 0.25   # exit 1 on regressions
+
+Synthetic data follows data/*-generator.py: users and videos get categories/styles,
+likes are likely (0.7) when the video matches a user preference and rare (0.1)
+otherwise, watchtime is 60-600s with a like and 5-60s without, 1% dont_suggest.
+Everything is seeded, so runs are comparable.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services.helpers import compute_interaction_score, compute_interaction_scores  # noqa: E402
+from app.services.mf import MatrixFactorization  # noqa: E402
+from app.services import model_io  # noqa: E402
+
+N_CATEGORIES = 7   # categorias in the generators
+N_STYLES = 7       # DANCE_STYLES
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def synthetic_interactions(n_users, n_videos, n, seed=0):
+    """Arrays (user_ids, video_ids, like, watchtime, dont_suggest) shaped like interacciones.csv."""
+    rng = np.random.default_rng(seed)
+    user_pref = rng.random((n_users, N_CATEGORIES + N_STYLES)) < 0.35
+    video_cat = rng.integers(0, N_CATEGORIES, n_videos)
+    video_style = N_CATEGORIES + rng.integers(0, N_STYLES, n_videos)
+    users = rng.integers(0, n_users, n)
+    videos = rng.integers(0, n_videos, n)
+    match = user_pref[users, video_cat[videos]] | user_pref[users, video_style[videos]]
+    like = rng.random(n) < np.where(match, 0.7, 0.1)
+    watchtime = np.where(like, rng.uniform(60.0, 600.0, n), rng.uniform(5.0, 60.0, n)).round(2)
+    dont = rng.random(n) < 0.01
+    return users, videos, like.astype(np.int8), watchtime, dont.astype(np.int8)
+
+
+def trained_model(n_users, n_videos, k, n_interactions=None, seed=0):
+    users, videos, like, watchtime, dont = synthetic_interactions(
+        n_users, n_videos, n_interactions or 4 * max(n_users, n_videos), seed)
+    model = MatrixFactorization(k=k, seed=seed)
+    model.add_users(range(n_users))
+    model.add_videos(range(n_videos))
+    model.update_batch(users, videos, compute_interaction_scores(like, watchtime, dont_suggest=dont))
+    return model
+
+
+def measure(fn, repeat, number=1):
+    """Run fn number times per sample, repeat samples. Returns per-call timings in seconds."""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    return np.asarray(samples)
+
+
+def result(name, params, samples, items_per_call=1):
+    return {
+        "name": name,
+        "params": params,
+        "mean_ms": float(samples.mean() * 1000.0),
+        "p50_ms": float(np.percentile(samples, 50) * 1000.0),
+        "p95_ms": float(np.percentile(samples, 95) * 1000.0),
+        "ops_per_s": float(items_per_call / samples.mean()),
+    }
+
+
+@benchmark("update")
+def bench_update(quick):
+    out = []
+    n = 2_000 if quick else 20_000
+    users, videos, like, watchtime, dont = synthetic_interactions(1000, 500, n)
+    scores = compute_interaction_scores(like, watchtime, dont_suggest=dont)
+    model = trained_model(1000, 500, 20)
+    samples = measure(lambda: [model.update(u, v, r) for u, v, r in zip(users[:1000], videos[:1000], scores[:1000])], 5)
+    out.append(result("update", {"k": 20, "calls": 1000}, samples, 1000))
+    for batch in (1000, 10_000):
+        if batch > n:
+            continue
+        samples = measure(lambda: model.update_batch(users[:batch], videos[:batch], scores[:batch]), 5)
+        out.append(result("update_batch", {"k": 20, "batch": batch}, samples, batch))
+    return out
+
+
+@benchmark("growth")
+def bench_growth(quick):
+    out = []
+    for n in ((1_000, 10_000) if quick else (1_000, 10_000, 100_000)):
+        def add_one_by_one():
+            model = MatrixFactorization(k=20)
+            for i in range(n):
+                model._add_user(i)
+        out.append(result("add_user", {"k": 20, "rows": n}, measure(add_one_by_one, 3), n))
+
+        def add_bulk():
+            MatrixFactorization(k=20).add_users(range(n))
+        out.append(result("add_users_bulk", {"k": 20, "rows": n}, measure(add_bulk, 3), n))
+    return out
+
+
+@benchmark("recommend")
+def bench_recommend(quick):
+    out = []
+    sizes = (10_000, 100_000) if quick else (10_000, 100_000, 1_000_000)
+    for n_videos in sizes:
+        for k in (20, 64):
+            rng = np.random.default_rng(1)
+            model = MatrixFactorization.from_arrays(
+                [0], rng.normal(0, 0.1, (1, k)), np.arange(n_videos), rng.normal(0, 0.1, (n_videos, k)), k=k)
+            seen = rng.choice(n_videos, 200, replace=False)
+            samples = measure(lambda: model.recommend(0, top_n=10, exclude_seen=seen), 10 if quick else 30)
+            out.append(result("recommend", {"videos": n_videos, "k": k, "top_n": 10}, samples))
+    return out
+
+
+@benchmark("serialization")
+def bench_serialization(quick):
+    out = []
+    n_users, n_videos = (5_000, 2_000) if quick else (100_000, 50_000)
+    model = trained_model(n_users, n_videos, 32, n_interactions=50_000)
+    params = {"users": n_users, "videos": n_videos, "k": 32}
+
+    blob = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    out.append(result("pickle_dumps", params, measure(lambda: pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL), 5)))
+    out.append(result("pickle_loads", params, measure(lambda: pickle.loads(blob), 5)))
+    raw = model_io.dumps(model)
+    out.append(result("model_io_dumps", params, measure(lambda: model_io.dumps(model), 5)))
+    out.append(result("model_io_loads", params, measure(lambda: model_io.loads(raw), 5)))
+
+    # Redis round-trip only if a server is reachable
+    try:
+        from app.services.redis import redis_model
+        from app.services.redis.redis_client import redis_conn
+        redis_conn.ping()
+    except Exception:
+        return out
+    key = "bench:mf_model"
+    out.append(result("redis_save_model", params, measure(lambda: redis_model.save_model(model, key=key), 5)))
+    out.append(result("redis_load_model", params, measure(lambda: redis_model.load_model(key=key), 5)))
+    redis_conn.delete(key)
+    return out
+
+
+@benchmark("scoring")
+def bench_scoring(quick):
+    n = 10_000 if quick else 100_000
+    _, _, like, watchtime, dont = synthetic_interactions(1000, 500, n)
+    duration = np.full(n, 600.0)
+
+    def scalar():
+        for l, w, d, x in zip(like.tolist(), watchtime.tolist(), duration.tolist(), dont.tolist()):
+            compute_interaction_score(l, w, d, x, "")
+    return [
+        result("compute_interaction_score", {"rows": n}, measure(scalar, 3), n),
+        result("compute_interaction_scores", {"rows": n},
+               measure(lambda: compute_interaction_scores(like, watchtime, duration, dont), 10), n),
+    ]
+
+
+def _key(entry):
+    return entry["name"] + json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(results, baseline_path, max_regression):
+    """Print regressions of mean_ms versus a previous --json file. Returns True if any exceed the limit."""
+    with open(baseline_path) as f:
+        baseline = {_key(e): e for e in json.load(f)["results"]}
+    failed = False
+    for entry in results:
+        old = baseline.get(_key(entry))
+        if old is None:
+            continue
+        change = entry["mean_ms"] / old["mean_ms"] - 1.0
+        if change > max_regression:
+            failed = True
+            print(f"REGRESSION {entry['name']} {entry['params']}: {old['mean_ms']:.3f} -> {entry['mean_ms']:.3f} ms "
+                  f"(+{change * 100:.0f}%)")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MF hot-path benchmarks")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=None)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for CI")
+    parser.add_argument("--json", default=None, help="write results to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON from a previous run")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        for entry in BENCHMARKS[name](args.quick):
+            results.append(entry)
+            print(f"{entry['name']:<28} {json.dumps(entry['params']):<44} "
+                  f"mean={entry['mean_ms']:10.3f} ms  p95={entry['p95_ms']:10.3f} ms  {entry['ops_per_s']:14.1f} ops/s")
+
+    if args.json:
+        meta = {"python": platform.python_version(), "numpy": np.__version__,
+                "machine": platform.machine(), "cpus": os.cpu_count(), "timestamp": time.time()}
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.compare and compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
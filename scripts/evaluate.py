@@ -0,0 +1,122 @@
+# scripts/evaluate.py
+"""
+Offline quality check (app/services/evaluation.py): split interactions, train a
+MatrixFactorization on the training part, report recall / precision / NDCG / coverage @k
+on the test part for the exact float32 ranking and for each serving variant.
+
+    python scripts/evaluate.py data/interacciones.csv --split time --at 10 20
+    python scripts/evaluate.py --synthetic 100000 20000 2000000 --variants int8 f16 ann --max-drop 0.02
+
+Variants:
+    int8 / f16   Q quantized as in the API (MatrixFactorization.quantize), exact ranking
+    ann          IVF index (MF_ANN_LISTS lists, default sqrt(#videos)), serving path per user
+
+With --max-drop the script exits with status 1 if a variant loses more than that fraction
+of the baseline recall or NDCG at the largest k, so it can gate a performance change.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services.ann import MF_ANN_LISTS, MF_ANN_PROBE  # noqa: E402
+from app.services.evaluation import SPLITS, evaluate, split_interactions  # noqa: E402
+from app.services.helpers import compute_interaction_scores  # noqa: E402
+from app.services.mf import MatrixFactorization  # noqa: E402
+
+VARIANTS = ("int8", "f16", "ann")
+
+
+def load(args):
+    if args.synthetic:
+        from scripts.benchmarks import synthetic_interactions
+        users, videos, like, watchtime, dont = synthetic_interactions(*args.synthetic, seed=args.seed)
+        return users, videos, compute_interaction_scores(like, watchtime, dont_suggest=dont)
+    from scripts.train import load_interactions
+    return load_interactions(args.csv)
+
+
+def train_sgd(users, videos, scores, args):
+    """Online SGD through the serving APIs: shuffled mini-batches of update_batch."""
+    model = MatrixFactorization(k=args.k, lr=args.lr, reg=args.reg, seed=args.seed)
+    model.add_users(np.unique(users).tolist())
+    model.add_videos(np.unique(videos).tolist())
+    rng = np.random.default_rng(args.seed)
+    for _ in range(args.epochs):
+        order = rng.permutation(len(users))
+        for i in range(0, len(order), args.batch):
+            sel = order[i:i + args.batch]
+            model.update_batch(users[sel], videos[sel], scores[sel])
+    return model
+
+
+def train_als(users, videos, scores, args):
+    """The offline trainer of scripts/train.py."""
+    from scripts.train import build_matrices, train_als as als
+    uniq_users, uniq_videos, R, W = build_matrices(users, videos, scores)
+    P, Q = als(R, W, k=args.k, reg=args.reg, iters=args.epochs, seed=args.seed, verbose=False)
+    return MatrixFactorization.from_arrays(uniq_users.tolist(), P, uniq_videos.tolist(), Q,
+                                           k=args.k, lr=args.lr, reg=args.reg, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline recall / precision / NDCG / coverage")
+    parser.add_argument("csv", nargs="?", default="data/interacciones.csv")
+    parser.add_argument("--synthetic", type=int, nargs=3, metavar=("USERS", "VIDEOS", "INTERACTIONS"))
+    parser.add_argument("--split", choices=SPLITS, default="time")
+    parser.add_argument("--test-frac", type=float, default=0.2)
+    parser.add_argument("--relevance", type=float, default=0.5, help="minimum score of a relevant test interaction")
+    parser.add_argument("--trainer", choices=["sgd", "als"], default="sgd")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--lr", type=float, default=0.05)
+    parser.add_argument("--reg", type=float, default=0.02)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--at", type=int, nargs="+", default=[10])
+    parser.add_argument("--variants", nargs="*", choices=VARIANTS, default=[])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-drop", type=float, default=None)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    users, videos, scores = load(args)
+    test = split_interactions(users, args.test_frac, args.split, seed=args.seed)
+    train = ~test
+    t1 = time.perf_counter()
+    model = (train_als if args.trainer == "als" else train_sgd)(users[train], videos[train], scores[train], args)
+    print(json.dumps({"interactions": int(len(users)), "train": int(train.sum()), "test": int(test.sum()),
+                      "users": int(model.n_users), "videos": int(model.n_videos),
+                      "load_s": round(t1 - t0, 2), "train_s": round(time.perf_counter() - t1, 2)}))
+
+    train_set = (users[train], videos[train], scores[train])
+    test_set = (users[test], videos[test], scores[test])
+    kw = dict(ks=args.at, relevance=args.relevance, workers=args.workers)
+    baseline = evaluate(model, train_set, test_set, **kw)
+    print(json.dumps({"variant": "exact", **baseline}))
+
+    k = max(args.at)
+    failed = []
+    for variant in args.variants:
+        if variant == "ann":
+            model.enable_ann(n_lists=MF_ANN_LISTS or None, n_probe=MF_ANN_PROBE)
+            result = evaluate(model, train_set, test_set, retrieval="model", **kw)
+            model.disable_ann()
+        else:
+            model.quantize(variant)
+            result = evaluate(model, train_set, test_set, **kw)
+            model.q_quant = None
+        print(json.dumps({"variant": variant, **result}))
+        for metric in (f"recall@{k}", f"ndcg@{k}"):
+            if args.max_drop is not None and result[metric] < baseline[metric] * (1.0 - args.max_drop):
+                failed.append(f"{variant} {metric} {result[metric]:.4f} < {baseline[metric]:.4f} - {args.max_drop:.0%}")
+    for line in failed:
+        print("FAIL", line)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
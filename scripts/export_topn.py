@@ -0,0 +1,131 @@
+# scripts/export_topn.py
+"""
+Offline bulk top-N export (nightly email / home-feed jobs).
+
+Scores every user of a model with MatrixFactorization.recommend_for_vectors (row blocks
+of P @ Q.T, per-row argpartition) on --workers processes, each taking a contiguous range
+of user rows. The model is loaded once before the workers fork, so a memory-mapped
+model file is shared between them.
+
+    python scripts/export_topn.py --model data/mf_model.bin --out data/topn.ndjson --top-n 50
+    python scripts/export_topn.py --source redis --exclude-seen --redis-key mf_export_v1:daily --ttl 90000
+
+Output:
+    --out        NDJSON, one {"user_id": ..., "recommendations": [[video_id, score], ...]} per
+                 line, in user row order (each worker writes a part, concatenated at the end)
+    --redis-key  a hash: field user_id -> the same recommendations JSON (optionally expiring)
+
+--exclude-seen reads the seen / blocked sets from Redis (app/services/redis/redis_seen.py).
+"""
+import os
+# one BLAS thread per process: the parallelism comes from the worker processes
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+import argparse
+import json
+import multiprocessing as mp
+import shutil
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services import mf  # noqa: E402
+
+# set in the parent before forking, inherited by the workers
+_model = None
+_args = None
+
+
+def load(args):
+    if args.source == "redis":
+        from app.services.redis import redis_rows
+        model = redis_rows.load_model()
+        if model is None:
+            raise SystemExit("no model in the Redis row store")
+    else:
+        model = mf.load_model_file(args.model)
+    if args.quant != "none":
+        model.quantize(args.quant)
+    return model
+
+
+def export_range(task):
+    """Score user rows [start, stop) in chunks; write them to a part file or to Redis. Returns the count."""
+    part, start, stop = task
+    model, args = _model, _args
+    ids = np.fromiter((model.idx2user[i] for i in range(start, stop)), dtype=np.int64, count=stop - start)
+    out = open(part, "w") if args.out else None
+    if args.redis_key:
+        from app.services.redis.redis_client import redis_conn
+    for a in range(0, stop - start, args.chunk):
+        uids = ids[a:a + args.chunk].tolist()
+        excludes = None
+        if args.exclude_seen:
+            from app.services.redis import redis_seen
+            excludes = redis_seen.load_excluded_many(uids)
+        recs = model.recommend_for_vectors(model.P[start + a:start + a + len(uids)], top_n=args.top_n,
+                                           exclude_seen=excludes, block_rows=args.block_rows)
+        if out is not None:
+            out.writelines(json.dumps({"user_id": uid, "recommendations": r}) + "\n" for uid, r in zip(uids, recs))
+        if args.redis_key:
+            pipe = redis_conn.pipeline(transaction=False)
+            pipe.hset(args.redis_key, mapping={uid: json.dumps(r) for uid, r in zip(uids, recs)})
+            pipe.execute()
+    if out is not None:
+        out.close()
+    return stop - start
+
+
+def main():
+    global _model, _args
+    parser = argparse.ArgumentParser(description="bulk top-N export for every user")
+    parser.add_argument("--source", choices=["file", "redis"], default="file")
+    parser.add_argument("--model", default=mf.MODEL_PATH)
+    parser.add_argument("--top-n", type=int, default=50)
+    parser.add_argument("--exclude-seen", action="store_true")
+    parser.add_argument("--quant", choices=["none", "f16", "int8"], default="none")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=4096, help="users per Redis round-trip / write")
+    parser.add_argument("--block-rows", type=int, default=None, help="users per P @ Q.T block (default: MF_SCORE_BLOCK_MB)")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--redis-key", default=None)
+    parser.add_argument("--ttl", type=int, default=0, help="expire --redis-key after this many seconds")
+    args = parser.parse_args()
+    if not args.out and not args.redis_key:
+        parser.error("give --out and/or --redis-key")
+
+    t0 = time.perf_counter()
+    _model, _args = load(args), args
+    n = _model.n_users
+    load_s = time.perf_counter() - t0
+    if args.redis_key:
+        from app.services.redis.redis_client import redis_conn
+        redis_conn.delete(args.redis_key)
+
+    n_workers = max(1, min(args.workers, n))
+    bounds = np.linspace(0, n, n_workers + 1).astype(int)
+    parts = [f"{args.out or 'export'}.part{i}" for i in range(n_workers)]
+    tasks = [(parts[i], int(bounds[i]), int(bounds[i + 1])) for i in range(n_workers)]
+    t0 = time.perf_counter()
+    if n_workers == 1:
+        done = [export_range(tasks[0])]
+    else:
+        with mp.get_context("fork").Pool(n_workers) as pool:
+            done = pool.map(export_range, tasks)
+    if args.out:
+        with open(args.out, "wb") as f:
+            for part in parts:
+                with open(part, "rb") as src:
+                    shutil.copyfileobj(src, f)
+                os.remove(part)
+    if args.redis_key and args.ttl > 0:
+        redis_conn.expire(args.redis_key, args.ttl)
+    export_s = time.perf_counter() - t0
+    print(json.dumps({"users": int(sum(done)), "videos": int(_model.n_videos), "workers": n_workers,
+                      "load_s": round(load_s, 2), "export_s": round(export_s, 2),
+                      "users_per_s": round(sum(done) / max(export_s, 1e-9))}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# scripts/stress_mf.py
+"""
+Concurrency stress test for the in-process MatrixFactorization.
+
+For each concurrency mode, writer threads call update / update_batch / update_many
+(registering new ids as they go) while reader threads call recommend on the published
+snapshots (mf.SnapshotPublisher). Afterwards it checks that:
+  - no thread raised
+  - no snapshot changed while a reader held it, and its id maps matched its arrays
+  - the id maps are a bijection onto rows 0..n-1 and every id that was sent is known
+  - P and Q are finite
+  - training error is in line with a single-threaded replay of the same work: the same
+    per-thread partitions and steps, round-robin, and the same update_many calls, in the
+    same mode. Both models then get --settle more sequential epochs in one fixed order,
+    since after a few epochs the result hardly depends on how the steps interleaved
+    (one short epoch alone varies by 10-15% between runs of the lock mode). A remaining
+    gap means lost or corrupted steps
+  - in "lock" and "striped" mode no two mini-batches ever write the same row at the
+    same time (OverlapProbe); for "hogwild" the number of racing batches is reported
+and prints update_many throughput per mode, with 1 thread and with --threads.
+Exit code 1 on any failure.
+
+Whether update_many scales across cores is not checked, only reported: the SGD steps are
+small NumPy calls that hold the GIL for much of their time, and on a 1-2 core box striped
+mode is slower than lock (stripe bookkeeping, no parallelism to gain). Read the speedup
+column on the target machine before picking a mode for throughput.
+
+    python scripts/stress_mf.py --modes lock striped hogwild --threads 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services import mf  # noqa: E402
+from app.services.mf import CONCURRENCY_MODES, MatrixFactorization  # noqa: E402
+from scripts.benchmarks import synthetic_interactions  # noqa: E402
+from app.services.helpers import compute_interaction_scores  # noqa: E402
+
+
+def rmse(model, users, videos, ratings):
+    u = np.fromiter((model.user_map[x] for x in users), dtype=np.int64, count=len(users))
+    v = np.fromiter((model.video_map[x] for x in videos), dtype=np.int64, count=len(videos))
+    pred = np.einsum("ij,ij->i", model.P[u], model.Q[v])
+    return float(np.sqrt(np.mean((ratings - pred) ** 2)))
+
+
+def check_maps(model, users, videos):
+    errors = []
+    for name, id_map, idx_map, n in (("user", model.user_map, model.idx2user, model.n_users),
+                                     ("video", model.video_map, model.idx2video, model.n_videos)):
+        if sorted(id_map.values()) != list(range(n)):
+            errors.append(f"{name} rows are not 0..{n - 1}")
+        if any(idx_map[i] != x for x, i in id_map.items()):
+            errors.append(f"{name} maps disagree")
+    if set(map(int, users)) - set(model.user_map) or set(map(int, videos)) - set(model.video_map):
+        errors.append("ids were lost")
+    if not (np.isfinite(model.P).all() and np.isfinite(model.Q).all()):
+        errors.append("non-finite factors")
+    return errors
+
+
+def partition_steps(t, threads, users, videos, ratings):
+    """Writer t's share of one epoch: single updates, then mini-batches, of every threads-th interaction."""
+    part = slice(t, None, threads)
+    u, v, r = users[part], videos[part], ratings[part]
+    steps = [(int(u[i]), int(v[i]), float(r[i])) for i in range(min(len(u), 200))]
+    steps += [(u[i:i + 512], v[i:i + 512], r[i:i + 512]) for i in range(0, len(u), 512)]
+    return steps
+
+
+def apply_step(model, step):
+    if isinstance(step[0], int):
+        model.update(*step)
+    else:
+        model.update_batch(*step)
+
+
+def replay(mode, users, videos, ratings, threads, epochs):
+    """
+    The work of stress() in the same mode, one thread: per epoch the writers' steps
+    round-robin (the interleaving an ideal scheduler would give them), then update_many.
+    """
+    model = MatrixFactorization(k=16, seed=0, concurrency=mode)
+    parts = [partition_steps(t, threads, users, videos, ratings) for t in range(threads)]
+    for _ in range(epochs):
+        for i in range(max(len(p) for p in parts)):
+            for p in parts:
+                if i < len(p):
+                    apply_step(model, p[i])
+    for _ in range(epochs):
+        model.update_many(users, videos, ratings, n_threads=1)
+    return model
+
+
+def settle(model, users, videos, ratings, epochs):
+    for _ in range(epochs):
+        for i in range(0, len(users), 512):
+            model.update_batch(users[i:i + 512], videos[i:i + 512], ratings[i:i + 512])
+    return model
+
+
+def stress(mode, users, videos, ratings, threads, readers, epochs):
+    model = MatrixFactorization(k=16, seed=0, concurrency=mode)
+    publisher = mf.SnapshotPublisher(model, every=2048, interval_s=0.05)
+    publisher.start()
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        rng = np.random.default_rng()
+        while not stop.is_set():
+            try:
+                snap = publisher.current
+                if not snap.n_users:
+                    continue
+                if len(snap.user_map) != snap.n_users or len(snap.video_map) != snap.n_videos:
+                    errors.append("snapshot id maps do not match its arrays")
+                    return
+                checksum = float(snap.Q.sum())
+                snap.recommend(snap.idx2user[int(rng.integers(0, snap.n_users))], top_n=10)
+                if float(snap.Q.sum()) != checksum:
+                    errors.append("snapshot changed while a reader held it")
+                    return
+            except Exception as exc:  # noqa: BLE001
+                errors.append(f"reader: {exc!r}")
+                return
+
+    def writer(t):
+        try:
+            steps = partition_steps(t, threads, users, videos, ratings)
+            for _ in range(epochs):
+                for step in steps:
+                    apply_step(model, step)
+        except Exception as exc:  # noqa: BLE001
+            errors.append(f"writer: {exc!r}")
+
+    pool = [threading.Thread(target=reader) for _ in range(readers)]
+    pool += [threading.Thread(target=writer, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for th in pool:
+        th.start()
+    for th in pool[readers:]:
+        th.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for th in pool[:readers]:
+        th.join()
+
+    t1 = time.perf_counter()
+    for _ in range(epochs):
+        model.update_many(users, videos, ratings, n_threads=threads)
+    many_elapsed = time.perf_counter() - t1
+    errors += check_maps(model, users, videos)
+    if publisher.publish().n_updates != model.n_updates:
+        errors.append("final snapshot is behind the working model")
+    return model, errors, elapsed, many_elapsed
+
+
+def update_many_rate(mode, users, videos, ratings, n_threads, epochs):
+    """Interactions per second of update_many alone (ids registered beforehand)."""
+    model = MatrixFactorization(k=16, seed=0, concurrency=mode)
+    model.add_users(np.unique(users).tolist())
+    model.add_videos(np.unique(videos).tolist())
+    t0 = time.perf_counter()
+    for _ in range(epochs):
+        model.update_many(users, videos, ratings, n_threads=n_threads)
+    return epochs * len(users) / (time.perf_counter() - t0)
+
+
+class OverlapProbe:
+    """
+    Wraps mf.sgd_batch_step and counts mini-batches that started writing rows another
+    thread was still writing. Must stay 0 in "lock" and "striped" mode.
+    """
+
+    def __init__(self):
+        self.busy_p, self.busy_q = set(), set()
+        self.guard = threading.Lock()
+        self.overlaps = 0
+        self.original = mf.sgd_batch_step
+
+    def __call__(self, P, Q, u_idx, v_idx, *args):
+        us, vs = set(np.asarray(u_idx).tolist()), set(np.asarray(v_idx).tolist())
+        with self.guard:
+            if us & self.busy_p or vs & self.busy_q:
+                self.overlaps += 1
+            self.busy_p |= us
+            self.busy_q |= vs
+        try:
+            time.sleep(0)  # let other writers interleave
+            return self.original(P, Q, u_idx, v_idx, *args)
+        finally:
+            with self.guard:
+                self.busy_p -= us
+                self.busy_q -= vs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MatrixFactorization concurrency stress test")
+    parser.add_argument("--modes", nargs="+", choices=CONCURRENCY_MODES, default=list(CONCURRENCY_MODES))
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--interactions", type=int, default=100_000)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--settle", type=int, default=3, help="sequential epochs before comparing rmse")
+    parser.add_argument("--rmse-tolerance", type=float, default=0.05,
+                        help="allowed relative rmse gap to the sequential replay")
+    args = parser.parse_args()
+
+    users, videos, like, watchtime, dont = synthetic_interactions(5_000, 2_000, args.interactions, seed=3)
+    ratings = compute_interaction_scores(like, watchtime, dont_suggest=dont)
+
+    print(f"cpus={os.cpu_count()} threads={args.threads}")
+    failed = False
+    for mode in args.modes:
+        reference = settle(replay(mode, users, videos, ratings, args.threads, args.epochs),
+                           users, videos, ratings, args.settle)
+        base_rmse = rmse(reference, users, videos, ratings)
+        probe = mf.sgd_batch_step = OverlapProbe()
+        try:
+            model, errors, elapsed, _ = stress(mode, users, videos, ratings, args.threads, args.readers, args.epochs)
+        finally:
+            mf.sgd_batch_step = probe.original
+        if probe.overlaps and mode != "hogwild":
+            errors.append(f"{probe.overlaps} mini-batches wrote rows held by another writer")
+        score = rmse(settle(model, users, videos, ratings, args.settle), users, videos, ratings)
+        if score > base_rmse * (1.0 + args.rmse_tolerance):
+            errors.append(f"rmse {score:.4f} worse than the sequential replay {base_rmse:.4f} "
+                          f"by more than {args.rmse_tolerance:.0%}")
+        one = update_many_rate(mode, users, videos, ratings, 1, args.epochs)
+        many = update_many_rate(mode, users, videos, ratings, args.threads, args.epochs)
+        status = "FAIL" if errors else "ok"
+        print(f"{mode:<8} {status:<4} rmse={score:.4f} (replay {base_rmse:.4f})  overlaps={probe.overlaps:<5} "
+              f"update/update_batch {elapsed:6.2f}s  update_many {one:9.0f}/s x1 {many:9.0f}/s x{args.threads} "
+              f"(speedup {many / one:.2f})")
+        for err in errors:
+            print("   ", err)
+        failed |= bool(errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,191 @@
-# Gym 
+# scripts/train.py
+"""
+Offline batch trainer (Gym): weighted ALS over interacciones.csv.
 
+    python scripts/train.py data/interacciones.csv --k 20 --iters 10 --out data/mf_model.bin
+    python scripts/train.py data/interacciones.csv --redis rows   # also publish to the Redis row store
+
+Interactions are scored with compute_interaction_scores (vectorized), repeated
+(user, video) pairs are averaged and weighted by their count, and P/Q are fitted with
+alternating least squares on the observed entries (weighted-lambda regularization).
+Each half-step solves all k x k systems of a block of rows at once with a batched
+np.linalg.solve; blocks run on a thread pool (NumPy releases the GIL), one per core.
+
+The output is the binary model format (app/services/model_io.py), so mf.init_model
+memory-maps it directly.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.services.helpers import compute_interaction_scores  # noqa: E402
+from app.services.mf import MatrixFactorization  # noqa: E402
+from app.services import model_io  # noqa: E402
+
+CSV_COLUMNS = ["user_id", "video_id", "like", "watchtime", "dont_suggest"]
+# memory budget for the per-block stack of k x k outer products
+BLOCK_BYTES = 32 * 1024 * 1024
+
+
+def load_interactions(path, chunksize=1_000_000):
+    """Read the CSV in chunks and score it. Returns (user_ids, video_ids, scores) arrays."""
+    users, videos, scores = [], [], []
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = CSV_COLUMNS + (["duration"] if "duration" in header else [])
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+        users.append(chunk["user_id"].to_numpy(np.int64))
+        videos.append(chunk["video_id"].to_numpy(np.int64))
+        scores.append(compute_interaction_scores(
+            like=chunk["like"].fillna(0).to_numpy(),
+            watchtime=chunk["watchtime"].fillna(0.0).to_numpy(),
+            duration=chunk["duration"].to_numpy() if "duration" in chunk else None,
+            dont_suggest=chunk["dont_suggest"].fillna(0).to_numpy(),
+        ))
+    return np.concatenate(users), np.concatenate(videos), np.concatenate(scores)
+
+
+def build_matrices(user_ids, video_ids, scores):
+    """
+    Map ids to dense indices and build the (users x videos) rating and weight matrices.
+    Duplicated pairs are averaged; their count becomes the weight.
+    """
+    uniq_users, u_idx = np.unique(user_ids, return_inverse=True)
+    uniq_videos, v_idx = np.unique(video_ids, return_inverse=True)
+    n_users, n_videos = len(uniq_users), len(uniq_videos)
+    # unique pair keys come out sorted by (user, video), i.e. already in CSR order
+    keys, inverse = np.unique(u_idx.astype(np.int64) * n_videos + v_idx, return_inverse=True)
+    counts = np.bincount(inverse).astype(np.float64)
+    means = np.bincount(inverse, weights=scores) / counts
+    rows, cols = keys // n_videos, (keys % n_videos).astype(np.int32)
+    indptr = np.searchsorted(rows, np.arange(n_users + 1))
+    ratings = sparse.csr_matrix((means, cols, indptr), shape=(n_users, n_videos))
+    counts = sparse.csr_matrix((counts, cols.copy(), indptr.copy()), shape=(n_users, n_videos))
+    return uniq_users, uniq_videos, ratings, counts
+
+
+def _solve_heavy_row(R, W, Y, row, reg, max_entries):
+    """One row with more than max_entries entries (a popular video): A and b accumulated by matmuls over chunks."""
+    k = Y.shape[1]
+    lo, hi = R.indptr[row], R.indptr[row + 1]
+    A = reg * (hi - lo) * np.eye(k)
+    b = np.zeros(k)
+    for a in range(lo, hi, max_entries):
+        z = min(hi, a + max_entries)
+        Yc, w = Y[R.indices[a:z]], W.data[a:z]
+        A += Yc.T @ (w[:, None] * Yc)
+        b += Yc.T @ (w * R.data[a:z])
+    return np.array([row]), np.linalg.solve(A, b)[None, :]
+
+
+def _solve_block(R, W, Y, start, stop, reg, max_entries):
+    """Least-squares rows start:stop of X given the fixed factors Y (all nonempty rows solved at once)."""
+    k = Y.shape[1]
+    lo, hi = R.indptr[start], R.indptr[stop]
+    if lo == hi:
+        return None
+    if hi - lo > max_entries:
+        # only a single-row block can exceed the budget (see als_half_step)
+        return _solve_heavy_row(R, W, Y, start, reg, max_entries)
+    cols = R.indices[lo:hi]
+    r = R.data[lo:hi]
+    w = W.data[lo:hi]
+    row_nnz = np.diff(R.indptr[start:stop + 1])
+    nonempty = np.flatnonzero(row_nnz)
+    seg = (R.indptr[start:stop][nonempty] - lo)
+
+    Yc = Y[cols]
+    # A_u = sum_i w_ui y_i y_i^T + reg * n_u * I ;  b_u = sum_i w_ui r_ui y_i
+    outer = (Yc * w[:, None])[:, :, None] * Yc[:, None, :]
+    A = np.add.reduceat(outer, seg, axis=0)
+    b = np.add.reduceat(Yc * (w * r)[:, None], seg, axis=0)
+    A += (reg * row_nnz[nonempty])[:, None, None] * np.eye(k)
+    return start + nonempty, np.linalg.solve(A, b[:, :, None])[:, :, 0]
+
+
+def als_half_step(R, W, Y, X, reg, pool):
+    """
+    Update every row of X in place. Blocks are cut so their outer products fit in
+    BLOCK_BYTES; a row over the budget on its own is solved with chunked matmuls instead.
+    """
+    k = Y.shape[1]
+    max_entries = max(1, BLOCK_BYTES // (k * k * 8))
+    bounds = [0]
+    n_rows = R.shape[0]
+    while bounds[-1] < n_rows:
+        start = bounds[-1]
+        target = R.indptr[start] + max_entries
+        stop = int(np.searchsorted(R.indptr, target, side="right")) - 1
+        bounds.append(min(n_rows, max(stop, start + 1)))
+    futures = [pool.submit(_solve_block, R, W, Y, a, b, reg, max_entries) for a, b in zip(bounds[:-1], bounds[1:])]
+    for fut in futures:
+        res = fut.result()
+        if res is not None:
+            rows, sol = res
+            X[rows] = sol
+
+
+def rmse(R, P, Q):
+    rows = np.repeat(np.arange(R.shape[0]), np.diff(R.indptr))
+    pred = np.einsum("ij,ij->i", P[rows], Q[R.indices])
+    return float(np.sqrt(np.mean((R.data - pred) ** 2)))
+
+
+def train_als(R, W, k=20, reg=0.02, iters=10, seed=1, workers=None, verbose=True):
+    rng = np.random.default_rng(seed)
+    P = rng.normal(0.0, 0.01, size=(R.shape[0], k))
+    Q = rng.normal(0.0, 0.01, size=(R.shape[1], k))
+    Rt, Wt = R.T.tocsr(), W.T.tocsr()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for it in range(iters):
+            t0 = time.perf_counter()
+            als_half_step(R, W, Q, P, reg, pool)
+            als_half_step(Rt, Wt, P, Q, reg, pool)
+            if verbose:
+                print(f"iter {it + 1}/{iters}: rmse={rmse(R, P, Q):.4f} ({time.perf_counter() - t0:.2f}s)")
+    return P.astype(np.float32), Q.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weighted ALS trainer")
+    parser.add_argument("csv", nargs="?", default="data/interacciones.csv")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--reg", type=float, default=0.02)
+    parser.add_argument("--lr", type=float, default=0.5, help="stored in the model for online SGD updates")
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=os.environ.get("MF_MODEL_PATH", "data/mf_model.bin"))
+    parser.add_argument("--redis", choices=["rows", "blob", "both"], default=None,
+                        help="also publish the model to the Redis row store and/or blob key")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    user_ids, video_ids, scores = load_interactions(args.csv)
+    uniq_users, uniq_videos, R, W = build_matrices(user_ids, video_ids, scores)
+    print(f"loaded {len(scores)} interactions, {R.shape[0]} users x {R.shape[1]} videos, "
+          f"{R.nnz} pairs ({time.perf_counter() - t0:.2f}s)")
+
+    P, Q = train_als(R, W, k=args.k, reg=args.reg, iters=args.iters, seed=args.seed, workers=args.workers)
+    model = MatrixFactorization.from_arrays(uniq_users.tolist(), P, uniq_videos.tolist(), Q,
+                                            k=args.k, lr=args.lr, reg=args.reg, seed=args.seed)
+    model_io.save(model, args.out)
+    print(f"model written to {args.out}")
+
+    if args.redis in ("rows", "both"):
+        from app.services.redis import redis_rows
+        redis_rows.save_model(model)
+        print("model published to the Redis row store")
+    if args.redis in ("blob", "both"):
+        from app.services.redis import redis_model
+        redis_model.save_model(model)
+        print("model published to the Redis blob key")
+
+
+if __name__ == "__main__":
+    main()